@@ -0,0 +1,125 @@
+"""Windowed ADC statistics for CUBEcontrol
+At report intervals of a few milliseconds the last ADC value says little, so the
+samples are collected into a preallocated numpy block and summarised once per
+window: min, max, mean, standard deviation and the fraction of samples below the
+lower and above the upper threshold of the ConfigWindow.
+
+The threshold counters mirror adcCounterL/adcCounterH of the adc interrupt in
+src/adc.cpp: a sample below the lower threshold counts the low counter up, a sample
+above the upper threshold the high counter, a sample in between counts both down.
+The firmware moves the axis once a counter reaches auto_sens, the window reports
+the highest counter values, so it shows whether auto mode would have reacted to
+the reported samples. The firmware counters are unsigned and wrap below zero, here
+they stop at zero. The firmware evaluates every generator pulse, the host only sees
+the reports.
+"""
+import time  # Importing time for the window timestamps
+import numpy as np  # Importing numpy for the block statistics
+from telemetry import AdcFrame, Record  # Importing the decoded telemetry records
+
+
+class AdcWindow(Record):
+    """Summary of the ADC samples of one window, t is the host time the window was closed."""
+
+    __slots__ = ("t", "count", "min", "max", "mean", "std", "below", "above", "counter_l", "counter_h")
+
+    def __init__(self, t, count, min, max, mean, std, below, above, counter_l, counter_h):
+        self.t = t
+        self.count = count
+        self.min = min
+        self.max = max
+        self.mean = mean
+        self.std = std
+        self.below = below
+        self.above = above
+        self.counter_l = counter_l
+        self.counter_h = counter_h
+
+
+def threshold_counter(steps, start):
+    """Running counter that adds steps (+1/0/-1) and stops at zero, returns (peak, last).
+
+    Lindley recursion without a loop: the counter is the running sum minus its
+    lowest value so far whenever that went below zero.
+    """
+    level = start + np.cumsum(steps)
+    counter = level - np.minimum(np.minimum.accumulate(level), 0)
+    return int(counter.max()), int(counter[-1])
+
+
+class AdcAggregator:
+    """Collects the volts of AdcFrames and summarises them every window seconds.
+
+    append_records() may be called from the serial reader thread with the records of
+    one chunk, the per sample work is a single list comprehension, the statistics are
+    a few array operations per window. settings returns (window, lower, upper) in
+    seconds and volts, it is read once per window so changes in the ConfigWindow apply
+    from the next window on. on_window is called with every AdcWindow.
+    """
+
+    def __init__(self, settings, on_window=None, capacity=1 << 16):
+        self.settings = settings
+        self.window, self.lower, self.upper = settings()
+        self.on_window = on_window
+        self.block = np.empty(capacity)
+        self.count = 0
+        self.started = None
+        self.counter_l = 0
+        self.counter_h = 0
+
+    def append_records(self, records, t=None) -> list:
+        if t is None:
+            t = time.monotonic()
+        volts = [record.volts for record in records if type(record) is AdcFrame]
+        windows = []
+        if self.started is None:
+            self.started = t
+        if volts:
+            n = len(volts)
+            if self.count + n > len(self.block):
+                # more samples than fit into one window, summarise what we have
+                if self.count:
+                    windows.append(self._summarise(t))
+                n = min(n, len(self.block))
+                volts = volts[-n:]
+            self.block[self.count : self.count + n] = volts
+            self.count += n
+        if t - self.started >= self.window:
+            if self.count:
+                windows.append(self._summarise(t))
+            self.started = t
+        if self.on_window is not None:
+            for window in windows:
+                self.on_window(window)
+        return windows
+
+    def _summarise(self, t) -> AdcWindow:
+        lower, upper = self.lower, self.upper
+        v = self.block[: self.count]
+        below = v < lower
+        above = v > upper
+        between = ~(below | above)
+        count = self.count
+        peak_l, self.counter_l = threshold_counter(below.astype(np.int64) - between, self.counter_l)
+        peak_h, self.counter_h = threshold_counter(above.astype(np.int64) - between, self.counter_h)
+        window = AdcWindow(
+            t,
+            count,
+            float(v.min()),
+            float(v.max()),
+            float(v.mean()),
+            float(v.std()),
+            float(np.count_nonzero(below)) / count,
+            float(np.count_nonzero(above)) / count,
+            peak_l,
+            peak_h,
+        )
+        self.count = 0
+        self.window, self.lower, self.upper = self.settings()
+        return window
+
+    def reset(self) -> None:
+        self.count = 0
+        self.started = None
+        self.counter_l = 0
+        self.counter_h = 0
@@ -0,0 +1,93 @@
+"""Text reports against binary report frames (M105)
+
+Builds the byte stream of --reports alternating ADC and POS reports with a log line
+every 20 reports, once as the text lines of the firmware and once as binary frames,
+and decodes both in 4 KiB chunks the way the serial reader does (FrameSplitter +
+decode_lines). Reports the bytes per report, the reports per second the uart can
+carry at 115200 baud and the decode cost per report, the best of --repeat runs.
+
+The corrupted variant flips --corrupt random bytes of the binary stream and reports
+how many frames were recovered, rejected by the CRC and detected as lost by the
+sequence numbers.
+
+usage: python benchmarks/benchBinary.py [--reports 200000] [--repeat 5] [--corrupt 100]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from binaryTelemetry import FrameSplitter, encode_adc, encode_pos  # noqa: E402
+from telemetry import decode_lines, AdcFrame, PosFrame  # noqa: E402
+
+BAUD = 115200
+CHUNK = 4096
+
+
+def build(reports, binary):
+    stream = bytearray()
+    for i in range(reports):
+        seq = i // 2
+        if i % 2 == 0:
+            raw = 1500 + i % 100
+            stream += encode_adc(seq, raw) if binary else f"<ADC> raw:{raw} calc:11.91V \n".encode()
+        else:
+            steps = 40000 + i % 1000
+            stream += encode_pos(seq, 1, steps) if binary else f"<POS> homed:1 steps:{steps} pos:10.0527\n".encode()
+        if i % 20 == 0:
+            stream += b"<INFO> move finished curr: 40211, tar: 40211 (10053)\n"
+    return bytes(stream)
+
+
+def decode(stream):
+    splitter = FrameSplitter()
+    reports = 0
+    for offset in range(0, len(stream), CHUNK):
+        for record in decode_lines(splitter.feed(stream[offset : offset + CHUNK])):
+            if type(record) is AdcFrame or type(record) is PosFrame:
+                reports += 1
+    return reports, splitter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--corrupt", type=int, default=100)
+    args = parser.parse_args()
+
+    for name, binary in (("text", False), ("binary", True)):
+        stream = build(args.reports, binary)
+        elapsed = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            reports, _ = decode(stream)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        bytes_per_report = len(stream) / args.reports
+        print(
+            json.dumps(
+                {
+                    "benchmark": "binary",
+                    "variant": name,
+                    "reports": reports,
+                    "bytes_per_report": round(bytes_per_report, 1),
+                    "max_reports_per_s_at_115200": round(BAUD / 10 / bytes_per_report),
+                    "ns_per_report": round(elapsed / args.reports * 1e9, 1),
+                }
+            )
+        )
+
+    stream = bytearray(build(args.reports, True))
+    rng = random.Random(1)
+    for _ in range(args.corrupt):
+        stream[rng.randrange(len(stream))] ^= 1 << rng.randrange(8)
+    reports, splitter = decode(bytes(stream))
+    print(json.dumps({"benchmark": "binary", "variant": "corrupted", "reports": reports, **splitter.stats()}))
+
+
+if __name__ == "__main__":
+    main()
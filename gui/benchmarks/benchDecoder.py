@@ -0,0 +1,66 @@
+"""Lines per second of the telemetry decoder
+
+Decodes a firmware-like mix of <ADC>, <POS> and log lines with telemetry.decode_line
+and with the regex chain that parse_msg used before. Both variants build a record per
+line, the best of --repeat runs is reported.
+
+usage: python benchmarks/benchDecoder.py [--lines 200000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from telemetry import decode_line, AdcFrame, PosFrame, LogLine  # noqa: E402
+
+SAMPLE_LINES = [
+    "<ADC> raw:1543 calc:11.91V ",
+    "<POS> homed:1 steps:40211 pos:10.0527",
+    "<ADC> raw:1601 calc:12.36V ",
+    "<POS> homed:1 steps:40215 pos:10.0537",
+    "<INFO> -> G1 Z-10",
+    "<ERROR> Can't do this during homing...",
+    "\r",
+    "<ADC> raw:garbage calc:V ",
+]
+
+
+def legacy_decode(msg, adc_pattern=re.compile(r"<ADC>.*calc:(\d+\.\d+)V"),
+                  pos_pattern=re.compile(r"POS> homed:(\d) steps:(\d+) pos:(\d+\.\d{4})")):
+    # the regex chain parse_msg used before telemetry.decode_line
+    match_adc_voltage = adc_pattern.search(msg)
+    if match_adc_voltage:
+        return AdcFrame(None, float(match_adc_voltage.group(1)))
+    pos_match = pos_pattern.search(msg)
+    if pos_match:
+        return PosFrame(bool(int(pos_match.group(1))), int(pos_match.group(2)), float(pos_match.group(3)))
+    return LogLine(None, msg)
+
+
+def run(decode, lines, repeat):
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            decode(line)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return {"lines_per_s": round(len(lines) / elapsed), "ns_per_line": round(elapsed / len(lines) * 1e9, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = (SAMPLE_LINES * (args.lines // len(SAMPLE_LINES) + 1))[: args.lines]
+    for name, decode in (("legacy_regex", legacy_decode), ("decode_line", decode_line)):
+        print(json.dumps({"benchmark": "decoder", "variant": name, **run(decode, lines, args.repeat)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Telemetry fan-out to many local subscribers
+
+Starts the simulator (cubeSim.py) on a pty link, connects a CubeDevice reporting
+every --interval ms and shares it with a telemetryServer.TelemetryServer on a unix
+socket. For every count of --subscribers a second process connects that many
+clients reading as fast as they can plus --stalled clients which never read, and
+reports the lines every reading client got and the delay from encoding to reading
+(p50/p99). This process reports its CPU time and the records the device received,
+which must not drop while the stalled clients fill their buffers.
+
+usage: python benchmarks/benchFanout.py [--subscribers 1 10 25] [--interval 1] [--seconds 5] [--buffer 256]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from cubeDevice import CubeDevice  # noqa: E402
+from telemetryServer import TelemetryServer  # noqa: E402
+
+LINK = "/tmp/ttyCUBEfanout"
+SOCKET = "/tmp/cubeFanout.sock"
+
+
+async def subscribe(readers, stalled, seconds):
+    async def read(counts, delays):
+        reader, writer = await asyncio.open_unix_connection(SOCKET)
+        stop = time.monotonic() + seconds
+        lines = 0
+        while time.monotonic() < stop:
+            line = await reader.readline()
+            if not line:
+                break
+            lines += 1
+            if line.startswith(b'{"type":"adc"'):
+                delays.append(time.time() - float(line[18:32]))
+        counts.append(lines)
+        writer.close()
+
+    sockets = [await asyncio.open_unix_connection(SOCKET) for _ in range(stalled)]
+    counts = []
+    delays = []
+    await asyncio.gather(*(read(counts, delays) for _ in range(readers)))
+    for _, writer in sockets:
+        writer.close()
+    delays.sort()
+    return {
+        "lines_min": min(counts),
+        "lines_mean": round(sum(counts) / len(counts)),
+        "delay_p50_ms": round(delays[len(delays) // 2] * 1000, 2) if delays else None,
+        "delay_p99_ms": round(delays[int(len(delays) * 0.99)] * 1000, 2) if delays else None,
+    }
+
+
+async def run(subscribers, stalled, interval, seconds, buffer):
+    device = CubeDevice(LINK)
+    await device.connect()
+    await device.initialize(restart=False, report_interval=interval)
+    received = [0]
+    device.add_listener(lambda records: received.__setitem__(0, received[0] + len(records)))
+    server = TelemetryServer(device, buffer=buffer)
+    await server.start(SOCKET)
+    try:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            os.path.realpath(__file__),
+            "--subscribe",
+            str(subscribers),
+            "--stalled",
+            str(stalled),
+            "--seconds",
+            str(seconds),
+            stdout=subprocess.PIPE,
+        )
+        while len(server.clients) < subscribers + stalled:
+            await asyncio.sleep(0.01)
+        records = received[0]
+        dropped = server.dropped
+        cpu = time.process_time()
+        output, _ = await process.communicate()
+        cpu = time.process_time() - cpu
+        records = received[0] - records
+        dropped = server.dropped - dropped
+    finally:
+        await server.close()
+        await device.disconnect()
+    return {
+        "records_per_s": round(records / seconds),
+        "owner_cpu_percent": round(cpu / seconds * 100, 2),
+        "stalled_dropped_chunks": dropped,
+        **json.loads(output),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 25])
+    parser.add_argument("--stalled", type=int, default=2, help="clients which never read")
+    parser.add_argument("--interval", type=int, default=1, help="report interval in ms")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--buffer", type=int, default=256, help="received chunks queued per client")
+    parser.add_argument("--subscribe", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.subscribe is not None:
+        print(json.dumps(asyncio.run(subscribe(args.subscribe, args.stalled, args.seconds))))
+        return
+
+    simulator = subprocess.Popen(
+        [sys.executable, os.path.join(GUI_PATH, "cubeSim.py"), "--link", LINK, "--parser-tick", "0.01"],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        while not os.path.lexists(LINK):
+            time.sleep(0.05)
+        for subscribers in args.subscribers:
+            result = asyncio.run(run(subscribers, args.stalled, args.interval, args.seconds, args.buffer))
+            print(
+                json.dumps(
+                    {
+                        "benchmark": "fanout",
+                        "variant": f"{subscribers}_subscribers",
+                        "subscribers": subscribers,
+                        "stalled": args.stalled,
+                        "interval_ms": args.interval,
+                        "buffer": args.buffer,
+                        **result,
+                    }
+                )
+            )
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+
+if __name__ == "__main__":
+    main()
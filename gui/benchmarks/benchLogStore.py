@@ -0,0 +1,128 @@
+"""Console operations on a session log with millions of lines
+
+Fills a logStore.LogStore with --lines console lines (move notices, parser
+responses, every 1000th line an error, every 777th a warning) in batches of 500
+like the UI pipeline hands them over, and times the operations of the console on
+it: changing the level filter (a new view over the whole store), a regex search
+without a hit (a scan of the whole store, case sensitive and ignoring the case),
+the next error after the last one (a scan to the end of the store) and fetching
+the lines of one window of 40 rows. The list variant keeps the lines as
+(text, level) tuples in a Python list and does the same with loops over the lines.
+Times are the best of --repeat runs.
+
+usage: python benchmarks/benchLogStore.py [--lines 2000000] [--repeat 3]
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from logStore import LogStore, Column, compile_search, LEVEL_CODES, ERROR  # noqa: E402
+from telemetry import LogLine, ESP  # noqa: E402
+
+WARNING = LEVEL_CODES["WARNING"]
+ROWS = 40
+
+
+def records(lines):
+    result = []
+    for i in range(lines // 2):
+        result.append(LogLine("INFO", f"move finished curr: {i}, tar: {i} ({i // 4})"))
+        if i % 1000 == 0:
+            result.append(LogLine("ERROR", f"limit switch hit at {i}"))
+        elif i % 777 == 0:
+            result.append(LogLine("WARNING", f"slow response {i}"))
+        else:
+            result.append(LogLine(ESP, "G1 X0.01"))
+    return result
+
+
+def best(function, repeat):
+    elapsed = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return elapsed, result
+
+
+def bench_store(lines, repeat):
+    store = LogStore()
+    start = time.perf_counter()
+    for i in range(0, len(lines), 500):
+        store.append_records(lines[i : i + 500])
+    append = time.perf_counter() - start
+
+    def warnings_view():
+        view = Column("int64")
+        view.extend(store.select(lambda levels, kinds: levels <= WARNING))
+        return view
+
+    filter_s, view = best(warnings_view, repeat)
+    pattern = compile_search("No such text")
+    search_s, _ = best(lambda: store.find(pattern), repeat)
+    pattern = compile_search("no such text")
+    nocase_s, _ = best(lambda: store.find(pattern), repeat)
+    last_error = int(store.select(lambda levels, kinds: levels == ERROR)[-1])
+    error_s, _ = best(lambda: store.find_level(ERROR, last_error + 1), repeat)
+    middle = view.count // 2
+    window_s, _ = best(lambda: store.lines(view.array[middle : middle + ROWS]), repeat)
+    return append, filter_s, search_s, nocase_s, error_s, window_s
+
+
+def bench_list(lines, repeat):
+    entries = []
+    start = time.perf_counter()
+    for i in range(0, len(lines), 500):
+        entries.extend((str(record), record.level) for record in lines[i : i + 500])
+    append = time.perf_counter() - start
+
+    levels = ("FATAL", "ERROR", "WARNING")
+    filter_s, view = best(lambda: [i for i, (_, level) in enumerate(entries) if level in levels], repeat)
+    pattern = re.compile("No such text")
+    search_s, _ = best(lambda: next((i for i, (text, _) in enumerate(entries) if pattern.search(text)), None), repeat)
+    pattern = re.compile("no such text", re.IGNORECASE)
+    nocase_s, _ = best(lambda: next((i for i, (text, _) in enumerate(entries) if pattern.search(text)), None), repeat)
+    errors = ("FATAL", "ERROR")
+    last_error = max(i for i, (_, level) in enumerate(entries) if level in errors)
+    error_s, _ = best(
+        lambda: next((i for i in range(last_error + 1, len(entries)) if entries[i][1] in errors), None), repeat
+    )
+    middle = len(view) // 2
+    window_s, _ = best(lambda: [entries[i][0] for i in view[middle : middle + ROWS]], repeat)
+    return append, filter_s, search_s, nocase_s, error_s, window_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=2000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    lines = records(args.lines)
+    for name, bench in (("list", bench_list), ("log_store", bench_store)):
+        append, filter_s, search_s, nocase_s, error_s, window_s = bench(lines, args.repeat)
+        print(
+            json.dumps(
+                {
+                    "benchmark": "log_store",
+                    "variant": name,
+                    "lines": len(lines),
+                    "append_us_per_line": round(append / len(lines) * 1e6, 3),
+                    "filter_ms": round(filter_s * 1000, 2),
+                    "search_miss_ms": round(search_s * 1000, 2),
+                    "search_miss_nocase_ms": round(nocase_s * 1000, 2),
+                    "next_error_ms": round(error_s * 1000, 3),
+                    "window_ms": round(window_s * 1000, 3),
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""CPU cost of many machines in one process
+
+Starts --machines simulators (cubeSim.py, one process each) on pty links, connects
+them all through a ConnectionManager and measures the CPU time of this process
+while every machine reports ADC and POS every --interval ms. The selector variant
+receives all ports in one thread, the threads variant uses a SerialReader per port.
+
+usage: python benchmarks/benchManager.py [--machines 16] [--interval 100] [--seconds 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from connectionManager import ConnectionManager  # noqa: E402
+
+
+def run(links, interval, seconds, use_selector):
+    manager = ConnectionManager(use_selector=use_selector)
+    try:
+        started = time.perf_counter()
+        results = manager.connect_all(links, report_interval=interval).result(60)
+        connect_s = time.perf_counter() - started
+        failed = [str(result) for result in results if isinstance(result, Exception)]
+
+        records = sum(summary.records for summary in manager.summaries.values())
+        cpu = time.process_time()
+        time.sleep(seconds)
+        cpu = time.process_time() - cpu
+        records = sum(summary.records for summary in manager.summaries.values()) - records
+        return {
+            "connected": len(links) - len(failed),
+            "connect_s": round(connect_s, 2),
+            "records_per_s": round(records / seconds),
+            "cpu_percent": round(cpu / seconds * 100, 2),
+            "threads": threading.active_count(),
+        }
+    finally:
+        manager.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--machines", type=int, default=16)
+    parser.add_argument("--interval", type=int, default=100, help="report interval in ms")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    links = [f"/tmp/ttyCUBEbench{i}" for i in range(args.machines)]
+    simulators = [
+        subprocess.Popen(
+            [sys.executable, os.path.join(GUI_PATH, "cubeSim.py"), "--link", link, "--parser-tick", "0.01"],
+            stdout=subprocess.DEVNULL,
+        )
+        for link in links
+    ]
+    try:
+        while not all(os.path.lexists(link) for link in links):
+            time.sleep(0.05)
+        for name, use_selector in (("selector", True), ("threads", False)):
+            result = run(links, args.interval, args.seconds, use_selector)
+            print(json.dumps({"benchmark": "manager", "variant": name, "machines": args.machines, **result}))
+    finally:
+        for simulator in simulators:
+            simulator.terminate()
+        for simulator in simulators:
+            simulator.wait()
+
+
+if __name__ == "__main__":
+    main()
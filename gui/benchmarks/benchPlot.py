@@ -0,0 +1,57 @@
+"""Cost of one strip chart frame against the number of samples in the window
+
+Fills the plot ring buffer with ADC samples at --rate Hz for the chart span and times
+the per-frame work of the live plot without Tk: copying the window out of the ring
+buffer, min/max decimation to the chart width and building the coordinate list that
+is handed to canvas.coords(). The number of plotted points is bounded by the width.
+
+usage: python benchmarks/benchPlot.py [--width 560] [--span 30] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from plotPanel import TelemetryBuffers, decimate_minmax  # noqa: E402
+from telemetry import AdcFrame  # noqa: E402
+
+
+def run(rate, width, span, repeat):
+    buffers = TelemetryBuffers(capacity=int(rate * span) + 1)
+    now = 1000.0
+    # at most one chunk every 10ms, like the serial reader delivers them
+    interval = max(1 / rate, 0.01)
+    volts = 12 + np.sin(np.arange(round(rate * interval)) / 10)
+    records = [AdcFrame(0, float(v)) for v in volts]
+    for i in range(int(span / interval)):
+        buffers.append_records(records, now - span + i * interval)
+
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        (t, v), _ = buffers.since(now - span)
+        x, y = decimate_minmax(t, v, now - span, span, width)
+        coords = np.column_stack((x, y)).ravel().tolist()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return {"samples": len(t), "points": len(coords) // 2, "ms_per_frame": round(elapsed * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=560)
+    parser.add_argument("--span", type=float, default=30.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for rate in (2, 100, 1000, 5000):
+        result = run(rate, args.width, args.span, args.repeat)
+        print(json.dumps({"benchmark": "plot_frame", "variant": f"{rate}Hz", **result}))
+
+
+if __name__ == "__main__":
+    main()
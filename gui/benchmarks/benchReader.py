@@ -0,0 +1,127 @@
+"""CPU cost of reading the serial port, measured against a pty stand-in (Linux only)
+
+Compares the old busy-poll loop of CubeControlApp.read_serial with the SerialReader
+thread. A forked writer process feeds firmware-like lines into the master side of
+a pty so that only the reading side is accounted in process_time().
+
+usage: python benchmarks/benchReader.py [--lines 20000] [--idle 2.0]
+"""
+import argparse
+import json
+import os
+import pty
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import serial  # noqa: E402
+from serialReader import SerialReader  # noqa: E402
+
+SAMPLE_LINES = [
+    b"<ADC> raw:1543 calc:11.91V \n",
+    b"<POS> homed:1 steps:40211 pos:10.0527\n",
+    b"<INFO> -> G1 Z-10\n",
+    b"<INFO> New target steps: 40171\n",
+]
+
+
+def open_pty():
+    master, slave = pty.openpty()
+    device = serial.Serial(os.ttyname(slave), 115200, timeout=1)
+    return master, slave, device
+
+
+def spawn_writer(master, n_lines, delay):
+    # writer runs in its own process so its cpu time does not count
+    pid = os.fork()
+    if pid == 0:
+        try:
+            time.sleep(delay)
+            block = b"".join(SAMPLE_LINES)
+            per_block = len(SAMPLE_LINES)
+            for _ in range(n_lines // per_block):
+                os.write(master, block)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def legacy_loop(device, stop, counter):
+    # copy of the busy-poll loop that used to be CubeControlApp.read_serial
+    while not stop.is_set():
+        if device.inWaiting() > 0:
+            try:
+                device.readline().decode()
+            except UnicodeDecodeError:
+                pass
+            counter[0] += 1
+
+
+def run_legacy(n_lines, idle):
+    master, slave, device = open_pty()
+    stop, counter = threading.Event(), [0]
+    thread = threading.Thread(target=legacy_loop, args=(device, stop, counter), daemon=True)
+    thread.start()
+    result = measure(master, n_lines, idle, lambda: counter[0])
+    stop.set()
+    thread.join()
+    for fd in (master, slave):
+        os.close(fd)
+    device.close()
+    return result
+
+
+def run_reader(n_lines, idle):
+    master, slave, device = open_pty()
+    counter = [0]
+
+    def on_lines(lines):
+        counter[0] += len(lines)
+
+    reader = SerialReader(device, on_lines)
+    reader.start()
+    result = measure(master, n_lines, idle, lambda: counter[0])
+    reader.stop()
+    reader.join()
+    for fd in (master, slave):
+        os.close(fd)
+    device.close()
+    return result
+
+
+def measure(master, n_lines, idle, received):
+    # idle phase: nothing arrives, a blocking reader should cost ~0% cpu
+    cpu, wall = time.process_time(), time.perf_counter()
+    time.sleep(idle)
+    idle_cpu = (time.process_time() - cpu) / (time.perf_counter() - wall) * 100
+
+    # load phase: n_lines arrive as fast as the pty can carry them
+    pid = spawn_writer(master, n_lines, 0.05)
+    cpu, wall = time.process_time(), time.perf_counter()
+    deadline = wall + 60
+    while received() < n_lines and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    os.waitpid(pid, 0)
+    return {
+        "idle_cpu_percent": round(idle_cpu, 2),
+        "cpu_ms_per_1000_lines": round(cpu * 1000 / max(received(), 1) * 1000, 3),
+        "lines_received": received(),
+        "wall_s": round(wall, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--idle", type=float, default=2.0)
+    args = parser.parse_args()
+
+    for name, runner in (("legacy_poll", run_legacy), ("serial_reader", run_reader)):
+        print(json.dumps({"benchmark": "reader", "variant": name, **runner(args.lines, args.idle)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Latency of the send path from send() to the parser response
+
+Starts the simulator (cubeSim.py) on a pty link with --parser-tick seconds per
+parsed line (the firmware reads one line per 100 ms loop) and reports ADC and POS
+every --interval ms meanwhile. Then it times --commands commands through CubeDevice
+using the timestamps of their Reply:
+
+    write_ms    send() until the writer thread wrote the line
+    ack_ms      send() until the parser response arrived (includes the parser tick)
+
+The command variant awaits every "G1 Z1" before sending the next. The jog_burst
+variant queues --commands jogs at once, the writer merges what is still queued, so
+the reply of the last jog is the latency of a burst of clicks.
+
+usage: python benchmarks/benchSend.py [--commands 200] [--parser-tick 0.01] [--interval 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from cubeDevice import CubeDevice  # noqa: E402
+
+LINK = "/tmp/ttyCUBEsend"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q / 100), len(values) - 1)]
+
+
+def latencies(replies):
+    write = [(reply.written_at - reply.queued_at) * 1000 for reply in replies]
+    ack = [(reply.acked_at - reply.queued_at) * 1000 for reply in replies]
+    return {
+        "write_p50_ms": round(statistics.median(write), 3),
+        "write_p99_ms": round(percentile(write, 99), 3),
+        "ack_p50_ms": round(statistics.median(ack), 2),
+        "ack_p99_ms": round(percentile(ack, 99), 2),
+    }
+
+
+async def run(commands, interval):
+    device = CubeDevice(LINK)
+    await device.connect()
+    try:
+        await device.initialize(restart=False, report_interval=interval)
+        replies = []
+        started = time.perf_counter()
+        for _ in range(commands):
+            replies.append(await device.move_z(1))
+        elapsed = time.perf_counter() - started
+        yield "command", {"commands": commands, "commands_per_s": round(commands / elapsed, 1), **latencies(replies)}
+
+        started = time.perf_counter()
+        futures = [await device.send("G1 Z1", jog=1) for _ in range(commands)]
+        replies = await asyncio.gather(*futures)
+        elapsed = time.perf_counter() - started
+        lines = len({id(reply) for reply in replies})
+        yield "jog_burst", {
+            "commands": commands,
+            "lines_sent": lines,
+            "burst_ms": round(elapsed * 1000, 2),
+            **latencies(replies[-1:]),
+        }
+    finally:
+        await device.disconnect()
+
+
+async def collect(commands, interval):
+    return [result async for result in run(commands, interval)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--parser-tick", type=float, default=0.01)
+    parser.add_argument("--interval", type=int, default=10, help="report interval in ms")
+    args = parser.parse_args()
+
+    simulator = subprocess.Popen(
+        [sys.executable, os.path.join(GUI_PATH, "cubeSim.py"), "--link", LINK, "--parser-tick", str(args.parser_tick)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        while not os.path.lexists(LINK):
+            time.sleep(0.05)
+        for name, result in asyncio.run(collect(args.commands, args.interval)):
+            print(
+                json.dumps(
+                    {
+                        "benchmark": "send",
+                        "variant": name,
+                        "parser_tick_ms": args.parser_tick * 1000,
+                        "interval_ms": args.interval,
+                        **result,
+                    }
+                )
+            )
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+
+if __name__ == "__main__":
+    main()
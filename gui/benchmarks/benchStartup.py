@@ -0,0 +1,99 @@
+"""Time to first frame and time to interactive of the gui
+
+Starts cubeControl --runs times in a fresh interpreter, once with the deferred startup
+and once with everything loaded before the window is shown, and reports the median
+times since the process was spawned:
+
+    first_frame_ms      the main window was mapped
+    interactive_ms      theme, images, device selection, port watcher and device loop are up
+
+Needs an X display. Without DISPLAY an Xvfb server is started for the benchmark.
+
+usage: python benchmarks/benchStartup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+
+CHILD = """
+import json, sys
+sys.path.insert(0, {gui_path!r})
+from cubeControl import CubeControlApp
+
+app = CubeControlApp(defer_startup={defer})
+
+def report():
+    # in the eager mode the window is mapped after the startup was finished
+    if "first_frame" not in app.startup_times:
+        app.app.after(5, report)
+        return
+    print(json.dumps(app.startup_times), flush=True)
+    app.on_closing()
+
+app.app.bind("<<StartupDone>>", lambda event: report())
+app.start()
+"""
+
+
+def start_xvfb(display=":57"):
+    if os.environ.get("DISPLAY"):
+        return None
+    if shutil.which("Xvfb") is None:
+        sys.exit("no X display and no Xvfb found, run under xvfb-run or install Xvfb")
+    server = subprocess.Popen(["Xvfb", display, "-screen", "0", "1024x768x24", "-nolisten", "tcp"])
+    socket = f"/tmp/.X11-unix/X{display[1:]}"
+    for _ in range(100):
+        if os.path.exists(socket):
+            break
+        time.sleep(0.05)
+    os.environ["DISPLAY"] = display
+    return server
+
+
+def run(defer):
+    code = CHILD.format(gui_path=GUI_PATH, defer=defer)
+    spawned = time.time()
+    child = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=60)
+    if child.returncode != 0 or not child.stdout.strip():
+        raise RuntimeError(child.stderr.strip())
+    times = json.loads(child.stdout.strip().splitlines()[-1])
+    return (times["first_frame"] - spawned) * 1000, (times["interactive"] - spawned) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    server = start_xvfb()
+    try:
+        for name, defer in (("eager", False), ("deferred", True)):
+            results = [run(defer) for _ in range(args.runs)]
+            first_frame = statistics.median(result[0] for result in results)
+            interactive = statistics.median(result[1] for result in results)
+            print(
+                json.dumps(
+                    {
+                        "benchmark": "startup",
+                        "variant": name,
+                        "runs": args.runs,
+                        "first_frame_ms": round(first_frame, 1),
+                        "interactive_ms": round(interactive, 1),
+                    }
+                )
+            )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Cost of the windowed ADC statistics at high report rates
+
+Feeds --seconds of a --rate Hz ADC stream in 10 ms chunks (like the serial reader
+hands them over) to adcStats.AdcAggregator and to the same statistics computed
+sample by sample in Python (running min/max/sum/sum of squares and the two
+threshold counters), and reports the CPU time per second of stream, the best
+of --repeat runs. Both variants close the same windows.
+
+usage: python benchmarks/benchStats.py [--rate 1000] [--seconds 60] [--window 0.5]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from adcStats import AdcAggregator  # noqa: E402
+from telemetry import AdcFrame, PosFrame  # noqa: E402
+
+LOWER = 3.5
+UPPER = 30.0
+
+
+class PerSample:
+    """The statistics with Python work per sample."""
+
+    def __init__(self, window):
+        self.window = window
+        self.started = None
+        self.counter_l = self.counter_h = 0
+        self._clear()
+
+    def _clear(self):
+        self.n = self.below = self.above = self.peak_l = self.peak_h = 0
+        self.total = self.squares = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+
+    def append_records(self, records, t):
+        if self.started is None:
+            self.started = t
+        for record in records:
+            if type(record) is not AdcFrame:
+                continue
+            v = record.volts
+            self.n += 1
+            self.total += v
+            self.squares += v * v
+            self.low = min(self.low, v)
+            self.high = max(self.high, v)
+            if v < LOWER:
+                self.below += 1
+                self.counter_l += 1
+            elif v > UPPER:
+                self.above += 1
+                self.counter_h += 1
+            else:
+                self.counter_l = max(self.counter_l - 1, 0)
+                self.counter_h = max(self.counter_h - 1, 0)
+            self.peak_l = max(self.peak_l, self.counter_l)
+            self.peak_h = max(self.peak_h, self.counter_h)
+        windows = []
+        if t - self.started >= self.window:
+            if self.n:
+                mean = self.total / self.n
+                std = math.sqrt(max(self.squares / self.n - mean * mean, 0.0))
+                windows.append((self.n, self.low, self.high, mean, std, self.below / self.n, self.peak_l))
+                self._clear()
+            self.started = t
+        return windows
+
+
+def stream(rate, seconds):
+    rng = random.Random(1)
+    per_chunk = max(1, int(rate / 100))
+    chunks = []
+    for i in range(int(seconds * 100)):
+        records = [AdcFrame(0, rng.choice((1.0, 18.0, 18.0, 18.0, 45.0)) + rng.gauss(0, 0.3)) for _ in range(per_chunk)]
+        records.append(PosFrame(True, 40000, 10.0))
+        chunks.append((i / 100, records))
+    return chunks
+
+
+def run(aggregator, chunks, repeat):
+    best = math.inf
+    windows = 0
+    for _ in range(repeat):
+        instance = aggregator()
+        started = time.process_time()
+        windows = sum(len(instance.append_records(records, t)) for t, records in chunks)
+        best = min(best, time.process_time() - started)
+    return best, windows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--window", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    chunks = stream(args.rate, args.seconds)
+    variants = (
+        ("per_sample", lambda: PerSample(args.window)),
+        ("numpy_window", lambda: AdcAggregator(lambda: (args.window, LOWER, UPPER))),
+    )
+    for name, aggregator in variants:
+        elapsed, windows = run(aggregator, chunks, args.repeat)
+        print(
+            json.dumps(
+                {
+                    "benchmark": "adc_stats",
+                    "variant": name,
+                    "rate_hz": args.rate,
+                    "windows": windows,
+                    "cpu_ms_per_s": round(elapsed / args.seconds * 1000, 3),
+                    "us_per_sample": round(elapsed / (args.seconds * args.rate) * 1e6, 3),
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Benchmark suite of the read, parse, render and send paths with a baseline check
+
+Runs the benchmarks of this directory with short settings, one process each, and
+collects their JSON lines into one results file together with the machine, the
+Python version and the git commit. With a baseline every metric with a direction
+is compared to the same benchmark and variant in it:
+
+    lower is better     *_ms, *_us, *_s, *_percent, cpu_*, *_us_per_*, us_per_*
+    higher is better    *_per_s (except cpu_*)
+
+A metric that got worse by more than --tolerance (relative) is a regression and
+the suite exits with 1. Benchmarks that need an X display (ui, startup) are
+skipped without DISPLAY and Xvfb, the pty ones on platforms without pty.
+
+    python benchmarks/benchSuite.py --out results.json --update-baseline   # on the reference machine
+    python benchmarks/benchSuite.py --out results.json                     # compares to benchmarks/baseline.json
+
+benchmarks/baseline.json is the reference run checked in with the code. Without a
+baseline nothing is compared, a warning says so on stderr and in the output, and
+--require-baseline makes that an error (exit code 2). Timings of another machine
+are compared anyway, with a warning.
+
+usage: python benchmarks/benchSuite.py [--only reader send ...] [--baseline PATH] [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+BENCH_PATH = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_PATH, "baseline.json")
+
+# name: (script, arguments, needs) with needs "pty" or "display"
+SUITE = {
+    "decoder": ("benchDecoder.py", ["--lines", "50000", "--repeat", "3"], None),
+    "binary": ("benchBinary.py", ["--reports", "50000", "--repeat", "3"], None),
+    "reader": ("benchReader.py", ["--lines", "10000", "--idle", "1.0"], "pty"),
+    "stats": ("benchStats.py", ["--seconds", "10", "--repeat", "3"], None),
+    "plot": ("benchPlot.py", ["--repeat", "10"], None),
+    "log_store": ("benchLogStore.py", ["--lines", "500000", "--repeat", "2"], None),
+    "send": ("benchSend.py", ["--commands", "100"], "pty"),
+    "manager": ("benchManager.py", ["--machines", "4", "--seconds", "2"], "pty"),
+    "fanout": ("benchFanout.py", ["--subscribers", "10", "--seconds", "2"], "pty"),
+    "ui": ("benchUi.py", ["--rates", "10", "1000", "5000", "--seconds", "3", "--repeat", "100"], "display"),
+    "startup": ("benchStartup.py", ["--runs", "3"], "display"),
+}
+
+
+# parameters of a benchmark that look like metrics
+SETTINGS = {"interval_ms", "parser_tick_ms"}
+
+
+def direction(metric) -> int:
+    """-1 if lower is better, 1 if higher is better, 0 for counts and settings."""
+    if metric in SETTINGS:
+        return 0
+    if metric.startswith(("cpu", "us_per_", "ms_per_")) or "_cpu" in metric or "_us_per_" in metric:
+        return -1
+    if metric.endswith("_per_s"):
+        return 1
+    if metric.endswith(("_ms", "_us", "_s", "_percent")):
+        return -1
+    return 0
+
+
+def missing(needs):
+    if needs == "pty" and not sys.platform.startswith("linux"):
+        return "needs a pty (Linux)"
+    if needs == "display" and not os.environ.get("DISPLAY") and shutil.which("Xvfb") is None:
+        return "needs an X display or Xvfb"
+    return None
+
+
+def run_benchmark(name, timeout):
+    script, arguments, _ = SUITE[name]
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, os.path.join(BENCH_PATH, script), *arguments], capture_output=True, text=True, timeout=timeout
+    )
+    elapsed = time.perf_counter() - started
+    lines = [json.loads(line) for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0:
+        error = (result.stderr.strip().splitlines() or [f"exit code {result.returncode}"])[-1]
+        return lines, error, elapsed
+    return lines, None, elapsed
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BENCH_PATH, timeout=10
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def warn(message) -> None:
+    print(f"WARNING: {message}", file=sys.stderr, flush=True)
+    print(json.dumps({"type": "warning", "message": message}), flush=True)
+
+
+def compare(results, baseline, tolerance) -> list:
+    """One comparison per metric with a direction that is in both runs."""
+    reference = {(result["benchmark"], result["variant"]): result for result in baseline["results"]}
+    comparisons = []
+    for result in results:
+        old = reference.get((result["benchmark"], result["variant"]))
+        if old is None:
+            continue
+        for metric, value in result.items():
+            sign = direction(metric)
+            before = old.get(metric)
+            if not sign or type(value) not in (int, float) or type(before) not in (int, float) or not before:
+                continue
+            change = (value - before) / abs(before)
+            comparisons.append(
+                {
+                    "benchmark": result["benchmark"],
+                    "variant": result["variant"],
+                    "metric": metric,
+                    "baseline": before,
+                    "value": value,
+                    "change": round(change, 4),
+                    "regression": -sign * change > tolerance,
+                }
+            )
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(SUITE), help="run these benchmarks only")
+    parser.add_argument("--skip", nargs="+", choices=list(SUITE), default=[], help="don't run these benchmarks")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="results to compare to")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--require-baseline", action="store_true", help="exit with 2 if there is no baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative change counted as regression")
+    parser.add_argument("--timeout", type=float, default=900, help="seconds per benchmark")
+    args = parser.parse_args()
+
+    names = [name for name in args.only or SUITE if name not in args.skip]
+    run = {
+        "created": time.time(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.node(),
+        "results": [],
+        "skipped": [],
+        "failed": [],
+    }
+    for name in names:
+        reason = missing(SUITE[name][2])
+        if reason is not None:
+            run["skipped"].append({"benchmark": name, "reason": reason})
+            print(json.dumps({"type": "skipped", "benchmark": name, "reason": reason}), flush=True)
+            continue
+        try:
+            lines, error, elapsed = run_benchmark(name, args.timeout)
+        except subprocess.TimeoutExpired:
+            lines, error, elapsed = [], f"timeout after {args.timeout}s", args.timeout
+        for line in lines:
+            print(json.dumps({"type": "result", **line}), flush=True)
+        run["results"].extend(lines)
+        if error is not None:
+            run["failed"].append({"benchmark": name, "error": error})
+            print(json.dumps({"type": "failed", "benchmark": name, "error": error}), flush=True)
+        else:
+            print(json.dumps({"type": "done", "benchmark": name, "elapsed_s": round(elapsed, 1)}), flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(run, f, indent=2)
+    regressions = []
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+    elif not os.path.exists(args.baseline):
+        warn(f"no baseline at {args.baseline}, nothing was compared (--update-baseline creates it)")
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != run["machine"]:
+            warn(f"baseline from {baseline.get('machine')} ({baseline.get('commit')}), timings differ between machines")
+        for comparison in compare(run["results"], baseline, args.tolerance):
+            print(json.dumps({"type": "comparison", **comparison}), flush=True)
+            if comparison["regression"]:
+                regressions.append(comparison)
+    print(
+        json.dumps(
+            {
+                "type": "summary",
+                "results": len(run["results"]),
+                "skipped": len(run["skipped"]),
+                "failed": len(run["failed"]),
+                "regressions": len(regressions),
+                "baseline": args.baseline if os.path.exists(args.baseline) else None,
+            }
+        ),
+        flush=True,
+    )
+    if args.require_baseline and not os.path.exists(args.baseline):
+        raise SystemExit(2)
+    raise SystemExit(1 if regressions or run["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Frame time of the gui under sustained telemetry and console cost against history
+
+stream: for every --rates value a simulator (cubeSim.py --rate) reports ADC and POS
+at that rate, a fresh cubeControl attaches to it like the Connect button and after
+a second of warm-up the latency metrics of the ui pipeline are taken for --seconds:
+
+    frame_p50_ms / frame_p99_ms / frame_max_ms    one flush of the ui pipeline (ui_render_ms)
+    post_to_render_p99_ms                         reader thread post until rendered
+    frames_per_s, cpu_percent                     of the gui process
+
+console: fills the console's log store up to every --histories size and times
+add_console_entries() with a batch of --batch log lines plus the redraw of the
+text widget (update_idletasks), the p50/p99 of --repeat batches.
+
+Needs an X display. Without DISPLAY an Xvfb server is started for the benchmark.
+
+usage: python benchmarks/benchUi.py [--rates 10 100 1000 5000] [--seconds 5] [--histories 0 100000 1000000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from benchStartup import start_xvfb  # noqa: E402
+
+LINK = "/tmp/ttyCUBEui"
+
+STREAM = """
+import json, sys, time
+sys.path.insert(0, {gui_path!r})
+from cubeControl import CubeControlApp
+from instrumentation import metrics
+
+app = CubeControlApp(defer_startup=False, port_patterns=({link!r},))
+
+def connect():
+    app.device_dropdown.set({link!r})
+    app.connect_device()
+    app.app.after(1000, measure)
+
+def measure():
+    metrics.reset()
+    metrics.enabled = True
+    cpu = time.process_time()
+    app.app.after(int({seconds} * 1000), lambda: report(cpu))
+
+def report(cpu):
+    cpu = time.process_time() - cpu
+    histograms = metrics.snapshot()["histograms"]
+    frame = histograms.get("ui_render_ms", {{}})
+    post = histograms.get("post_to_render_ms", {{}})
+    print(json.dumps({{
+        "frame_p50_ms": frame.get("p50"),
+        "frame_p99_ms": frame.get("p99"),
+        "frame_max_ms": frame.get("max"),
+        "post_to_render_p99_ms": post.get("p99"),
+        "frames_per_s": round(frame.get("count", 0) / {seconds}, 1),
+        "cpu_percent": round(cpu / {seconds} * 100, 2),
+    }}), flush=True)
+    app.on_closing()
+
+app.app.after(500, connect)
+app.start()
+"""
+
+CONSOLE = """
+import json, statistics, sys, time
+sys.path.insert(0, {gui_path!r})
+from cubeControl import CubeControlApp
+from logStore import LEVEL_CODES, KIND_LOG
+from telemetry import LogLine
+
+app = CubeControlApp(defer_startup=False, port_patterns=())
+
+def run():
+    console = app.console
+    console.create_console()
+    app.app.update()
+    batch = [LogLine("INFO", f"move finished curr: {{i}}, tar: {{i}}") for i in range({batch})]
+    info = LEVEL_CODES["INFO"]
+    for history in {histories}:
+        missing = history - len(console.store)
+        for start in range(0, max(missing, 0), 100000):
+            count = min(100000, missing - start)
+            console.store.append_lines([(f"move finished curr: {{i}}, tar: {{i}}", info, KIND_LOG) for i in range(count)])
+        console.add_console_entries([])
+        app.app.update()
+        times = []
+        for _ in range({repeat}):
+            started = time.perf_counter()
+            console.add_console_entries(batch)
+            app.app.update_idletasks()
+            times.append((time.perf_counter() - started) * 1000)
+        times.sort()
+        print(json.dumps({{
+            "history": history,
+            "insert_p50_ms": round(statistics.median(times), 3),
+            "insert_p99_ms": round(times[min(int(len(times) * 0.99), len(times) - 1)], 3),
+        }}), flush=True)
+    app.on_closing()
+
+app.app.after(500, run)
+app.start()
+"""
+
+
+def child(code, timeout):
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=timeout)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(result.stderr.strip())
+    return [json.loads(line) for line in lines]
+
+
+def run_stream(rate, seconds):
+    simulator = subprocess.Popen(
+        # M114 reports the --interval the gui asks for, so attaching sends no M1 that would end --rate
+        [sys.executable, os.path.join(GUI_PATH, "cubeSim.py"), "--link", LINK, "--rate", str(rate), "--interval", "500"],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        while not os.path.lexists(LINK):
+            time.sleep(0.05)
+        code = STREAM.format(gui_path=GUI_PATH, link=LINK, seconds=seconds)
+        return child(code, seconds + 60)[-1]
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", type=int, nargs="+", default=[10, 100, 1000, 5000], help="report rates in Hz")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--histories", type=int, nargs="+", default=[0, 100000, 1000000])
+    parser.add_argument("--batch", type=int, default=50, help="console lines per insert")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    server = start_xvfb()
+    try:
+        for rate in args.rates:
+            result = run_stream(rate, args.seconds)
+            print(json.dumps({"benchmark": "ui_stream", "variant": f"{rate}Hz", "rate_hz": rate, **result}))
+        code = CONSOLE.format(
+            gui_path=GUI_PATH, histories=sorted(args.histories), batch=args.batch, repeat=args.repeat
+        )
+        for result in child(code, 600):
+            print(
+                json.dumps(
+                    {"benchmark": "ui_console", "variant": f"{result['history']}_lines", "batch": args.batch, **result}
+                )
+            )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Binary telemetry frames for CUBEcontrol
+Decoder for the compact ADC/POS report frames the firmware sends after "M105 1"
+(see include/binaryReport.h). Frames and text log lines share the serial stream:
+
+    A5 01 seq:u16 raw:u16 crc:u16                       -> AdcFrame(raw, volts)
+    A5 02 seq:u16 homed:u8 steps:i32 crc:u16            -> PosFrame(homed, steps, pos_mm)
+
+FrameSplitter cuts the frames out of the received bytes before the rest is split
+into lines, so a frame in the middle of a log line leaves the line intact. A sync
+byte that does not start a valid frame (unknown type or wrong CRC) is kept as text,
+the search continues one byte later. Sequence gaps are counted per frame type.
+
+Recorded or simulated byte streams can be checked from the command line:
+
+    python binaryTelemetry.py capture.bin
+"""
+import argparse  # Importing argparse for the command line interface
+from binascii import crc_hqx  # Importing the C implementation of the CRC
+import json  # Importing json for the command line output
+import struct  # Importing struct to unpack the fixed-width fields in place
+from instrumentation import metrics  # Importing the process-wide latency metrics
+from serialReader import LineFramer  # Importing the line splitter for the text between the frames
+from telemetry import AdcFrame, PosFrame, decode_line  # Importing the decoded telemetry records
+
+# constants from include/pinDefs.h and include/movement.h
+VOLTAGE_DIVIDER_FACTOR = 31.57
+ADC_VREF = 5.0
+ADC_NUM_BITS = 12
+ADC_ZERO_OFFSET = 0
+ENCODER_STEPS_PER_MM = 4000
+VOLTS_PER_STEP = VOLTAGE_DIVIDER_FACTOR * (ADC_VREF / ((1 << ADC_NUM_BITS) - 1))
+
+SYNC = 0xA5
+TYPE_ADC = 0x01
+TYPE_POS = 0x02
+ADC_FRAME = struct.Struct("<BBHHH")
+POS_FRAME = struct.Struct("<BBHBiH")
+FRAMES = {TYPE_ADC: ADC_FRAME, TYPE_POS: POS_FRAME}
+_SYNC = bytes((SYNC,))
+
+
+def calc_voltage(raw) -> float:
+    # calcVoltage() from adc.h
+    return (max(raw - ADC_ZERO_OFFSET, 0) >> 4) * VOLTS_PER_STEP
+
+
+def crc16(data) -> int:
+    # CRC-16/CCITT-FALSE like crc16() in src/binaryReport.cpp
+    return crc_hqx(data, 0xFFFF)
+
+
+def encode_adc(seq, raw) -> bytes:
+    body = ADC_FRAME.pack(SYNC, TYPE_ADC, seq & 0xFFFF, raw, 0)[:-2]
+    return body + struct.pack("<H", crc16(body[1:]))
+
+
+def encode_pos(seq, homed, steps) -> bytes:
+    body = POS_FRAME.pack(SYNC, TYPE_POS, seq & 0xFFFF, int(homed), steps, 0)[:-2]
+    return body + struct.pack("<H", crc16(body[1:]))
+
+
+class FrameSplitter:
+    """Byte stream to a list of text lines and AdcFrame/PosFrame records in stream order.
+
+    Drop-in replacement for the LineFramer of a SerialReader: feed() returns the lines
+    as str and the frames already decoded. Without a sync byte in the stream it costs
+    one bytes.find() per chunk on top of the LineFramer.
+    """
+
+    def __init__(self, encoding="utf-8", max_line=4096):
+        self.lines = LineFramer(encoding, max_line)
+        # bytes from an incomplete frame on, everything before was handed to the line framer
+        self.buffer = bytearray()
+        self.last_seq = {}
+        self.frames = 0
+        self.crc_errors = 0
+        self.lost = 0
+        self.restarts = 0
+
+    def feed(self, data) -> list:
+        buffer = self.buffer
+        if not buffer and _SYNC not in data:
+            return self.lines.feed(data)
+        buffer += data
+        items = []
+        append = items.append
+        find = buffer.find
+        feed_lines = self.lines.feed
+        last_seq = self.last_seq
+        size = len(buffer)
+        text_start = position = frames = 0
+        tail = size
+        with memoryview(buffer) as view:
+            while True:
+                # frames mostly follow each other directly
+                if position < size and buffer[position] == SYNC:
+                    start = position
+                else:
+                    start = find(SYNC, position)
+                    if start < 0:
+                        break
+                if start + 1 == size:
+                    tail = start
+                    break
+                frame = FRAMES.get(buffer[start + 1])
+                if frame is None:
+                    # 0xA5 inside text, e.g. the second byte of an utf-8 "å"
+                    position = start + 1
+                    continue
+                end = start + frame.size
+                if end > size:
+                    # wait for the rest of the frame
+                    tail = start
+                    break
+                fields = frame.unpack_from(buffer, start)
+                if crc_hqx(view[start + 1 : end - 2], 0xFFFF) != fields[-1]:
+                    self.crc_errors += 1
+                    position = start + 1
+                    continue
+                if start > text_start:
+                    items += feed_lines(view[text_start:start])
+                text_start = position = end
+                frames += 1
+
+                kind = fields[1]
+                seq = fields[2]
+                last = last_seq.get(kind)
+                if last is not None and (seq - last - 1) & 0xFFFF:
+                    self._gap((seq - last - 1) & 0xFFFF)
+                last_seq[kind] = seq
+                if kind == TYPE_ADC:
+                    raw = fields[3]
+                    append(AdcFrame(raw, ((raw - ADC_ZERO_OFFSET) >> 4) * VOLTS_PER_STEP if raw > ADC_ZERO_OFFSET else 0.0))
+                else:
+                    steps = fields[4]
+                    append(PosFrame(fields[3] == 1, steps, steps / ENCODER_STEPS_PER_MM))
+            if tail > text_start:
+                items += feed_lines(view[text_start:tail])
+        self.frames += frames
+        del buffer[:tail]
+        return items
+
+    def _gap(self, gap) -> None:
+        if gap < 0x8000:
+            self.lost += gap
+            if metrics.enabled:
+                metrics.count("frames_lost", gap)
+        else:
+            # the sequence went back: the firmware was restarted
+            self.restarts += 1
+
+    def reset(self) -> None:
+        self.lines.reset()
+        self.buffer.clear()
+        self.last_seq.clear()
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "crc_errors": self.crc_errors, "lost": self.lost, "restarts": self.restarts}
+
+
+def decode_stream(data, chunk_size=4096) -> tuple:
+    """Decode a recorded byte stream in chunks, returns (records, stats)."""
+    splitter = FrameSplitter()
+    records = []
+    for offset in range(0, len(data), chunk_size):
+        for item in splitter.feed(data[offset : offset + chunk_size]):
+            records.append(decode_line(item) if type(item) is str else item)
+    return records, splitter.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="file with the raw bytes received from the serial port")
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    parser.add_argument("--records", action="store_true", help="print every decoded record")
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as f:
+        records, stats = decode_stream(f.read(), args.chunk_size)
+    if args.records:
+        for record in records:
+            print(record)
+    counts = {}
+    for record in records:
+        counts[type(record).__name__] = counts.get(type(record).__name__, 0) + 1
+    print(json.dumps({**stats, "records": counts}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Connection manager for several CUBE machines
+Owns one CubeDevice per serial port. All ports share one asyncio loop, one selector
+thread for receiving (on POSIX) and the telemetry is routed per port: listeners get
+(port, records), the latest values of every machine are kept in a MachineSummary
+and the log lines in a bounded queue per machine, so a gui can poll them at its
+own pace no matter how many machines report how fast. Machines are attached without
+a restart unless one is asked for, lost connections are re-attached for reconnect
+seconds (summary state "reconnecting").
+
+    manager = ConnectionManager()
+    manager.connect_all(["/dev/ttyUSB0", "/dev/ttyUSB1"]).result()
+    print(manager.summaries["/dev/ttyUSB0"].volts)
+"""
+import asyncio  # Importing asyncio to connect several machines at once
+import os  # Importing the OS module to detect POSIX systems
+import time  # Importing time for the timestamp of the last report
+from collections import deque  # Importing deque for the bounded log queues
+from cubeDevice import CubeDevice, LoopThread, SentLine, ConnectionEvent  # Importing the headless device core
+from serialReader import SerialSelector  # Importing the shared selector reader
+from telemetry import AdcFrame, PosFrame, LogLine  # Importing the decoded telemetry records
+
+
+# summary state after a ConnectionEvent
+CONNECTION_STATES = {"lost": "reconnecting", "reconnected": "connected", "failed": "error"}
+
+
+class MachineSummary:
+    """Latest known state of one machine, updated from the reader side."""
+
+    __slots__ = ("port", "state", "volts", "steps", "pos_mm", "homed", "mode", "generator", "records", "updated")
+
+    def __init__(self, port):
+        self.port = port
+        self.state = "disconnected"
+        self.volts = None
+        self.steps = None
+        self.pos_mm = None
+        self.homed = None
+        # from the DeviceState of the machine, generator is None while unknown
+        self.mode = "manual"
+        self.generator = None
+        self.records = 0
+        self.updated = None
+
+
+class ConnectionManager:
+    """Connects, routes and summarizes any number of CubeDevices.
+
+    The coroutines run on the manager's LoopThread, the methods without "async" are
+    meant for synchronous callers and return concurrent.futures.Future objects.
+    """
+
+    def __init__(self, loop_thread=None, use_selector=None, log_lines=500, reconnect=3.0):
+        if loop_thread is None:
+            loop_thread = LoopThread()
+            loop_thread.start()
+        self.loop_thread = loop_thread
+        if use_selector is None:
+            use_selector = os.name == "posix"
+        self.selector = SerialSelector() if use_selector else None
+        if self.selector is not None:
+            self.selector.start()
+        self.log_lines = log_lines
+        self.reconnect = reconnect
+        self.devices = {}
+        self.summaries = {}
+        self.logs = {}
+        # callbacks receiving (port, records), called from the reader side
+        self.listeners = []
+
+    def add(self, port, baudrate=115200) -> CubeDevice:
+        if port in self.devices:
+            return self.devices[port]
+        device = CubeDevice(port, baudrate, selector=self.selector, reconnect=self.reconnect)
+        device.add_listener(lambda records: self._route(port, records))
+        device.state.add_listener(lambda state, changes: self._state_changed(port, state))
+        self.devices[port] = device
+        self.summaries[port] = MachineSummary(port)
+        self.logs[port] = deque(maxlen=self.log_lines)
+        return device
+
+    async def remove_device(self, port) -> None:
+        # the device owns the open port, its writer thread and the selector registration
+        await self.disconnect_device(port)
+        self.devices.pop(port, None)
+        self.summaries.pop(port, None)
+        self.logs.pop(port, None)
+
+    async def connect_device(self, port, restart=False, report_interval=500) -> CubeDevice:
+        device = self.add(port)
+        summary = self.summaries[port]
+        summary.state = "connecting"
+        try:
+            await device.connect()
+            summary.state = "initializing"
+            await device.initialize(restart=restart, report_interval=report_interval)
+        except Exception:
+            summary.state = "error"
+            raise
+        summary.state = "connected"
+        return device
+
+    async def disconnect_device(self, port) -> None:
+        device = self.devices.get(port)
+        if device is None:
+            return
+        await device.disconnect()
+        self.summaries[port].state = "disconnected"
+
+    async def connect_many(self, ports, restart=False, report_interval=500) -> list:
+        # all machines boot in parallel, failures are returned instead of raised
+        return await asyncio.gather(
+            *(self.connect_device(port, restart, report_interval) for port in ports), return_exceptions=True
+        )
+
+    def connect(self, port, restart=False, report_interval=500):
+        return self.loop_thread.submit(self.connect_device(port, restart, report_interval))
+
+    def connect_all(self, ports, restart=False, report_interval=500):
+        return self.loop_thread.submit(self.connect_many(ports, restart, report_interval))
+
+    def disconnect(self, port):
+        return self.loop_thread.submit(self.disconnect_device(port))
+
+    def remove(self, port):
+        return self.loop_thread.submit(self.remove_device(port))
+
+    def run(self, coro):
+        return self.loop_thread.submit(coro)
+
+    async def disconnect_all(self) -> None:
+        await asyncio.gather(*(self.disconnect_device(port) for port in list(self.devices)))
+
+    def close(self, timeout=10) -> None:
+        try:
+            self.run(self.disconnect_all()).result(timeout)
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        # stop the threads, for managers whose devices were disconnected by the caller's own loop
+        if self.selector is not None:
+            self.selector.stop()
+        self.loop_thread.stop()
+
+    def _route(self, port, records) -> None:
+        # reader side (or the writer thread for SentLine): keep the latest values and the log
+        summary = self.summaries.get(port)
+        if summary is None:
+            return
+        log = self.logs[port]
+        summary.records += len(records)
+        summary.updated = time.monotonic()
+        for record in records:
+            cls = type(record)
+            if cls is AdcFrame:
+                summary.volts = record.volts
+            elif cls is PosFrame:
+                summary.steps = record.steps
+                summary.pos_mm = record.pos_mm
+                summary.homed = record.homed
+            elif cls is LogLine or cls is SentLine:
+                log.append(record)
+            elif cls is ConnectionEvent:
+                summary.state = CONNECTION_STATES[record.event]
+        for callback in self.listeners:
+            callback(port, records)
+
+    def _state_changed(self, port, state) -> None:
+        # event loop
+        summary = self.summaries.get(port)
+        if summary is not None:
+            summary.mode = state.mode
+            summary.generator = state.generator
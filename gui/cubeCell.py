@@ -0,0 +1,314 @@
+"""CUBEcontrol cell view
+Drives several CUBE machines from one process. Every machine gets its own tab, the
+overview tab shows voltage, position, homed and mode state of all of them. The
+machines are handled by one ConnectionManager, the gui polls the summaries a few
+times per second, so its cost does not grow with the report rate.
+
+    python cubeCell.py /dev/ttyUSB0 /dev/ttyUSB1
+    python cubeCell.py --pattern "/tmp/ttyCUBE*" --interval 200
+"""
+import argparse  # Importing argparse for the command line interface
+import glob  # Importing glob for the port patterns
+import time  # Importing time for the report rates
+import tkinter as tk  # Importing the Tkinter library for creating graphical user interfaces
+from tkinter import ttk  # Importing the themed Tkinter widgets
+import sv_ttk  # Importing a custom module for additional themed Tkinter widgets
+from connectionManager import ConnectionManager  # Importing the multi machine connection manager
+from cubeDevice import CommandError, SentLine  # Importing the errors and records of the device core
+from cubeControl import ConfigWindow  # Importing the shared generator/ADC settings window
+from telemetry import LogLine, ESP  # Importing the decoded log lines
+
+
+OVERVIEW_COLUMNS = (
+    ("state", "State", 90),
+    ("volts", "Voltage", 80),
+    ("pos", "Position", 100),
+    ("homed", "Homed", 70),
+    ("mode", "Mode", 80),
+    ("generator", "Generator", 80),
+    ("rate", "Reports/s", 80),
+)
+
+
+class MachinePanel:
+    """Tab with the controls, values and console of one machine."""
+
+    def __init__(self, cell, notebook, port, max_lines=500):
+        self.cell = cell
+        self.port = port
+        self.max_lines = max_lines
+        self.widget_lines = 0
+        self.frame = ttk.Frame(notebook, padding=10)
+        notebook.add(self.frame, text=port.rsplit("/", 1)[-1])
+
+        values_frame = ttk.LabelFrame(self.frame, text="State", padding=10)
+        values_frame.grid(column=0, row=0, sticky="nesw")
+        self.value_labels = {}
+        for row, (name, text) in enumerate(
+            (("volts", "ADC voltage"), ("pos", "Position"), ("steps", "Steps"), ("homed", "Homed"), ("mode", "Mode"))
+        ):
+            ttk.Label(values_frame, text=f"{text}:").grid(column=0, row=row, sticky="w")
+            label = ttk.Label(values_frame, text="?", width=14)
+            label.grid(column=1, row=row, sticky="w", padx=(10, 0))
+            self.value_labels[name] = label
+
+        control_frame = ttk.LabelFrame(self.frame, text="Control", padding=10)
+        control_frame.grid(column=0, row=1, sticky="nesw", pady=(10, 0))
+        self.movement_steps = [0.5, 1, 2.5, 5, 10, 100, 1000, 5000]
+        self.movement_steps_dropdown = ttk.Combobox(
+            control_frame,
+            values=["0.5µm", "1µm", "2.5µm", "5µm", "10µm", "100µm", "1mm", "5mm"],
+            state="readonly",
+            width=6,
+        )
+        self.movement_steps_dropdown.current(0)
+        self.movement_steps_dropdown.grid(column=2, row=0, padx=(10, 0))
+
+        config = cell.config_window
+        # the command word decides whether the firmware state allows the button
+        buttons = [
+            ("↑ Up", 0, 0, "G1", lambda device: device.jog(-self.step())),
+            ("↓ Down", 1, 0, "G1", lambda device: device.jog(self.step())),
+            ("Home", 0, 1, "G28", lambda device: device.home()),
+            ("Touch", 1, 1, "M102", lambda device: device.touch(config.get("lower_thr"), config.get("upper_thr"))),
+            ("Restart", 2, 1, "M0", lambda device: device.restart()),
+            ("Enable", 0, 2, "M100", lambda device: device.generator_on(config.get("ontime"), config.get("offtime"))),
+            ("Disable", 1, 2, "M101", lambda device: device.generator_off()),
+            (
+                "Auto ON",
+                0,
+                3,
+                "M103",
+                lambda device: device.auto_mode(
+                    config.get("lower_thr"), config.get("upper_thr"), config.get("auto_sens")
+                ),
+            ),
+            ("Auto OFF", 1, 3, "M104", lambda device: device.auto_off()),
+        ]
+        self.command_buttons = []
+        self.button_states = {}
+        for text, col, row, word, command in buttons:
+            button = ttk.Button(control_frame, text=text, width=9, command=lambda command=command: self.run(command))
+            button.grid(column=col, row=row, sticky="nesw", padx=(0 if col == 0 else 10, 0), pady=5)
+            self.command_buttons.append((button, word))
+
+        console_frame = ttk.Frame(self.frame)
+        console_frame.grid(column=1, row=0, rowspan=2, sticky="nesw", padx=(10, 0))
+        self.console_text = tk.Text(console_frame, wrap=tk.WORD, state="disabled", font=("Arial", 9), width=52)
+        self.console_text.tag_config("send", foreground="green")
+        self.console_text.tag_config("error", background="yellow", foreground="red")
+        self.console_text.grid(column=0, row=0, columnspan=2, sticky="nesw")
+        self.console_input = ttk.Entry(console_frame)
+        self.console_input.bind("<Return>", lambda event: self.send())
+        self.console_input.grid(column=0, row=1, sticky="ew", pady=(5, 0))
+        ttk.Button(console_frame, text="Send", style="Accent.TButton", command=self.send).grid(
+            column=1, row=1, padx=(5, 0), pady=(5, 0)
+        )
+        console_frame.rowconfigure(0, weight=1)
+        console_frame.columnconfigure(0, weight=1)
+        self.frame.rowconfigure(1, weight=1)
+        self.frame.columnconfigure(1, weight=1)
+
+    def step(self):
+        return self.movement_steps[self.movement_steps_dropdown.current()]
+
+    def run(self, command) -> None:
+        device = self.cell.manager.devices[self.port]
+        if not device.connected:
+            self.add_lines([("Not connected.\n", "error")])
+            return
+        future = self.cell.manager.run(command(device))
+        future.add_done_callback(self._done)
+
+    def _done(self, future) -> None:
+        # loop thread, errors go through the log queue to the tab
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None and not isinstance(error, CommandError):
+            self.cell.manager.logs[self.port].append(LogLine("ERROR", f"{type(error).__name__} {error}"))
+
+    def send(self) -> None:
+        text = self.console_input.get().strip()
+        if text:
+            self.console_input.delete(0, "end")
+            self.run(lambda device: device.send(text))
+
+    def render(self, summary, log) -> None:
+        labels = self.value_labels
+        labels["volts"].configure(text="?" if summary.volts is None else f"{summary.volts}V")
+        labels["pos"].configure(text="?" if summary.pos_mm is None else f"{summary.pos_mm:.4f}mm")
+        labels["steps"].configure(text="?" if summary.steps is None else str(summary.steps))
+        labels["homed"].configure(text="?" if summary.homed is None else ("Homed" if summary.homed else "Not Homed"))
+        labels["mode"].configure(text=summary.mode)
+        state = self.cell.manager.devices[self.port].state
+        for button, word in self.command_buttons:
+            enabled = state.check(word) is None
+            if self.button_states.get(button) != enabled:
+                button.configure(state="enabled" if enabled else "disabled")
+                self.button_states[button] = enabled
+
+        entries = []
+        while log:
+            record = log.popleft()
+            if type(record) is SentLine:
+                entries.append((f">>> {record.text}", "send"))
+            elif record.level != ESP:
+                entries.append((f"{record}\n", "error" if record.is_error else ""))
+            elif "parse" in record.text:
+                # parser errors are the only esp-internal lines worth showing
+                entries.append((record.text.strip() + "\n", "error"))
+        self.add_lines(entries)
+
+    def add_lines(self, entries) -> None:
+        if not entries:
+            return
+        chunks = []
+        for text, tag in entries:
+            chunks += (text, tag)
+        self.console_text.configure(state="normal")
+        self.console_text.insert("end", *chunks)
+        self.widget_lines += len(entries)
+        if self.widget_lines > self.max_lines:
+            excess = self.widget_lines - self.max_lines
+            self.console_text.delete("1.0", f"{excess + 1}.0")
+            self.widget_lines = self.max_lines
+        self.console_text.configure(state="disabled")
+        self.console_text.see("end")
+
+
+class CubeCellApp:
+    def __init__(self, ports, restart=False, report_interval=500, refresh_ms=200) -> None:
+        self.restart = restart
+        self.report_interval = report_interval
+        self.refresh_ms = refresh_ms
+        self.manager = ConnectionManager()
+        self.panels = {}
+        self.rates = {}
+
+        self.app = tk.Tk()
+        self.app.title("CUBEcontrol --- cell")
+        self.app.geometry("900x560")
+        sv_ttk.set_theme("light")
+        self.config_window = ConfigWindow(self.app)
+
+        self.notebook = ttk.Notebook(self.app)
+        self.notebook.pack(fill="both", expand=True, padx=10, pady=10)
+        overview = ttk.Frame(self.notebook, padding=10)
+        self.notebook.add(overview, text="Overview")
+
+        self.overview_table = ttk.Treeview(
+            overview, columns=[name for name, _, _ in OVERVIEW_COLUMNS], height=16, selectmode="extended"
+        )
+        self.overview_table.heading("#0", text="Port")
+        self.overview_table.column("#0", width=160)
+        for name, text, width in OVERVIEW_COLUMNS:
+            self.overview_table.heading(name, text=text)
+            self.overview_table.column(name, width=width, anchor="e")
+        self.overview_table.grid(column=0, row=0, columnspan=5, sticky="nesw")
+        self.overview_table.bind("<Double-1>", lambda event: self.show_selected())
+
+        buttons = [
+            ("Connect all", lambda: self.connect(list(self.panels))),
+            ("Disconnect all", lambda: self.disconnect(list(self.panels))),
+            ("Connect", lambda: self.connect(self.overview_table.selection())),
+            ("Disconnect", lambda: self.disconnect(self.overview_table.selection())),
+            ("Config", self.config_window.open),
+        ]
+        for col, (text, command) in enumerate(buttons):
+            ttk.Button(overview, text=text, command=command).grid(column=col, row=1, sticky="w", pady=(10, 0))
+        overview.rowconfigure(0, weight=1)
+        overview.columnconfigure(4, weight=1)
+
+        for port in ports:
+            self.add_machine(port)
+
+    def add_machine(self, port) -> None:
+        if port in self.panels:
+            return
+        self.manager.add(port)
+        self.panels[port] = MachinePanel(self, self.notebook, port)
+        self.rates[port] = (time.monotonic(), 0, 0.0)
+        self.overview_table.insert("", "end", iid=port, text=port, values=[""] * len(OVERVIEW_COLUMNS))
+
+    def connect(self, ports) -> None:
+        for port in ports:
+            if not self.manager.devices[port].connected:
+                self.manager.connect(port, self.restart, self.report_interval).add_done_callback(
+                    lambda future, port=port: self._connect_done(port, future)
+                )
+
+    def _connect_done(self, port, future) -> None:
+        # loop thread
+        error = future.exception()
+        if error is not None:
+            self.manager.logs[port].append(LogLine("ERROR", f"connecting failed: {type(error).__name__} {error}"))
+
+    def disconnect(self, ports) -> None:
+        for port in ports:
+            self.manager.disconnect(port)
+
+    def show_selected(self) -> None:
+        selection = self.overview_table.selection()
+        if selection:
+            self.notebook.select(self.panels[selection[0]].frame)
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        selected = self.notebook.select()
+        for port, panel in self.panels.items():
+            summary = self.manager.summaries[port]
+            last_time, last_records, rate = self.rates[port]
+            if now - last_time >= 1.0:
+                rate = (summary.records - last_records) / (now - last_time)
+                self.rates[port] = (now, summary.records, rate)
+            state = summary.state
+            if state == "connected" and not self.manager.devices[port].connected:
+                state = "lost"
+            self.overview_table.item(
+                port,
+                values=(
+                    state,
+                    "?" if summary.volts is None else f"{summary.volts:.2f}V",
+                    "?" if summary.pos_mm is None else f"{summary.pos_mm:.4f}mm",
+                    "?" if summary.homed is None else ("yes" if summary.homed else "no"),
+                    summary.mode,
+                    "?" if summary.generator is None else ("on" if summary.generator else "off"),
+                    f"{rate:.0f}",
+                ),
+            )
+            if str(panel.frame) == selected:
+                panel.render(summary, self.manager.logs[port])
+        self.app.after(self.refresh_ms, self.refresh)
+
+    def start(self) -> None:
+        self.app.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.refresh()
+        self.app.mainloop()
+
+    def on_closing(self) -> None:
+        print("closing all connections...")
+        self.manager.close()
+        self.app.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("ports", nargs="*", help="serial ports of the machines")
+    parser.add_argument("--pattern", action="append", default=[], help="glob pattern for more ports")
+    parser.add_argument("--interval", type=int, default=500, help="report interval in ms (default 500)")
+    parser.add_argument("--restart", action="store_true", help="restart the machines on connect")
+    parser.add_argument("--connect", action="store_true", help="connect all machines on start")
+    args = parser.parse_args()
+
+    ports = list(args.ports)
+    for pattern in args.pattern:
+        ports += sorted(port for port in glob.glob(pattern) if port not in ports)
+    cell = CubeCellApp(ports, restart=args.restart, report_interval=args.interval)
+    if args.connect:
+        cell.connect(ports)
+    cell.start()
+
+
+if __name__ == "__main__":
+    main()
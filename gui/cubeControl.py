@@ -8,27 +8,79 @@ This is the CubeControl gui apllication designed to control the edm-mashine CUBE
 import tkinter as tk  # Importing the Tkinter library for creating graphical user interfaces
 from tkinter import (
     ttk,
+    font as tkfont,
     messagebox,
+    filedialog,
     StringVar,
 )  # Importing additional Tkinter classes for themed widgets, message boxes, and string variables
-import sv_ttk  # Importing a custom module for additional themed Tkinter widgets (assuming it's a custom module)
-import serial  # Importing the PySerial library for communicating with serial devices
-import serial.tools.list_ports  # Importing a utility to list available serial ports
-import threading  # Importing the threading module for creating and managing threads
-import re  # Importing the regular expressions module for advanced string manipulation
 import os  # Importing the OS module for interacting with the operating system
+import time  # Importing time to name the recordings
+import re  # Importing re for the errors of the console search
+from uiPipeline import UiPipeline, ConsoleEvent  # Importing the thread-safe UI event queue
+from telemetry import PosFrame, LogLine  # Importing the decoded telemetry records
+
+# sv_ttk, the device core (asyncio, pyserial), the port watcher and everything using numpy
+# are imported where they are needed, the window is shown before any of them is loaded
 
 
 # current file path to allow the app to be called from outside its own workspace
 current_path = os.path.dirname(os.path.realpath(__file__))
+# recordings are kept in the home directory, the onefile build unpacks itself into a temp folder
+recordings_path = os.path.join(os.path.expanduser("~"), "CUBEcontrol", "recordings")
+# a press of a jog button or arrow key shorter than this is a click (one step), longer is held
+HOLD_DELAY_MS = 250
+# a key release followed by a press within this time is the auto repeat of a held key
+KEY_REPEAT_MS = 40
+# choices of the replay speed, "max" replays without waiting for the recorded timestamps
+REPLAY_SPEEDS = ("1x", "2x", "10x", "100x", "max")
+
+
+def parse_replay_speed(text):
+    """Replay factor of a choice: "10x" -> 10.0, "max" -> None (as fast as possible)."""
+    text = text.strip().lower()
+    if text == "max":
+        return None
+    return float(text.removesuffix("x"))
+
+
+def replay_speed_text(speed) -> str:
+    return "max" if not speed else f"{speed:g}x"
 
 
 class Console:
-    def __init__(self, app, parent):
+    # level filter choices and the lowest firmware level they show
+    LEVEL_FILTERS = {"All": "VERBOSE", "Trace": "TRACE", "Info": "INFO", "Warnings": "WARNING", "Errors": "ERROR"}
+
+    def __init__(self, app, parent, max_lines=1_000_000):
         self.app = app
         self.parent = parent
 
+        # the last max_lines lines of the session (None: all of them) are kept in the log store, created
+        # with the console, the text widget only holds the rows of the store lines in view that are visible
+        self.max_lines = max_lines
+        self.store = None
+        self.view = None
+        # store lines already run through the filter and the first line after "Clear"
+        self.filtered = 0
+        self.first = 0
+        # position in view of the first row, the window follows new lines while at the end
+        self.top = 0
+        self.rows = 20
+        self.follow = True
+        # store line of the last search hit or error, marked and used as start of the next search
+        self.found = None
+        self.search_text = None
+        self.pattern = None
+
     def create_console(self) -> None:
+        from logStore import LogStore, Column  # Importing the indexed session log store
+
+        self.store = LogStore(self.max_lines)
+        self.view = Column("int64")
+        self.filtered = self.first = self.top = 0
+        self.follow = True
+        self.found = None
+
         self.console_frame = ttk.Frame(self.parent, padding=20, width=400, height=500)
         self.console_frame.pack()
         self.console_frame.grid_propagate(False)
@@ -38,12 +90,18 @@ class Console:
 
         self.console_text = tk.Text(self.console_frame, wrap=tk.WORD, state="disabled", font=("Arial", 10))
         self.console_text.tag_config("send", foreground="green")
+        self.console_text.tag_config("warning", foreground="darkorange")
         self.console_text.tag_config("error", background="yellow", foreground="red")
+        self.console_text.tag_config("found", background="lightblue")
         self.console_text.grid(column=0, row=1, columnspan=3, sticky="nsew")
-
-        scrollbar = ttk.Scrollbar(self.console_frame, orient="vertical", command=self.console_text.yview)
-        scrollbar.grid(column=3, row=1, sticky="ns")
-        self.console_text.configure(yscrollcommand=scrollbar.set)
+        self.console_text.bind("<Configure>", self._on_resize)
+        self.console_text.bind("<MouseWheel>", lambda event: self.scroll(-3 if event.delta > 0 else 3))
+        self.console_text.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.console_text.bind("<Button-5>", lambda event: self.scroll(3))
+
+        # the scrollbar moves through the view, not through the text widget
+        self.scrollbar = ttk.Scrollbar(self.console_frame, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.grid(column=3, row=1, sticky="ns")
         self.console_frame.grid_rowconfigure(2, weight=1)
         self.placeholder_text = "Type your command here..."
 
@@ -70,44 +128,239 @@ class Console:
         clear_button.grid(column=0, row=4, sticky="w", padx=(0, 5))
 
         self.auto_scroll_enabled = tk.BooleanVar(value=True)
-        toggle_button = ttk.Checkbutton(self.console_frame, text="Auto Scroll", variable=self.auto_scroll_enabled)
+        toggle_button = ttk.Checkbutton(
+            self.console_frame, text="Auto Scroll", variable=self.auto_scroll_enabled, command=self._scroll_to_end
+        )
         toggle_button.grid(column=1, row=4, sticky="w", pady=(10, 0))
 
         self.show_all_enabled = tk.BooleanVar(value=False)
-        toggle_button = ttk.Checkbutton(self.console_frame, text="Show All", variable=self.show_all_enabled)
+        toggle_button = ttk.Checkbutton(
+            self.console_frame, text="Show All", variable=self.show_all_enabled, command=self.redraw_console_text
+        )
         toggle_button.grid(column=2, row=4, sticky="w", pady=(10, 0))
 
+        self.level_filter = tk.StringVar(value="All")
+        level_box = ttk.Combobox(
+            self.console_frame,
+            textvariable=self.level_filter,
+            values=list(self.LEVEL_FILTERS),
+            state="readonly",
+            width=8,
+        )
+        level_box.bind("<<ComboboxSelected>>", lambda event: self.redraw_console_text())
+        level_box.grid(column=0, row=5, sticky="w", pady=(10, 0))
+
+        # regex search, Return jumps to the next hit, Shift+Return to the previous one
+        self.search_input = ttk.Entry(self.console_frame, font=("Arial", 10))
+        self.search_input.bind("<Return>", lambda event: self.find_next())
+        self.search_input.bind("<Shift-Return>", lambda event: self.find_next(backwards=True))
+        self.search_input.grid(column=1, row=5, sticky="ew", pady=(10, 0))
+
+        error_button = ttk.Button(self.console_frame, text="Next Error", command=self.next_error)
+        error_button.grid(column=2, row=5, sticky="e", padx=(5, 0), pady=(10, 0))
+
         self.console_frame.columnconfigure(0, weight=1)
         self.console_frame.columnconfigure(1, weight=1)
         self.console_frame.columnconfigure(2, weight=1)
         self.console_frame.rowconfigure(1, weight=1)
 
     def update_console_text(self, new_text: str, send=False) -> None:
-        if new_text[-1] != "\n":
-            new_text += "\n"
+        self.add_console_entries([ConsoleEvent(new_text, send)])
+
+    def add_console_entries(self, events) -> None:
+        # store a batch of LogLines, SentLines and ConsoleEvents and update the window once
+        from logStore import classify, ERROR, LEVEL_HOST, KIND_APP, KIND_SENT  # Importing the line classification
+
+        lines = []
+        for event in events:
+            if type(event) is ConsoleEvent:
+                level = ERROR if event.error else LEVEL_HOST
+                kind = KIND_SENT if event.send else KIND_APP
+                lines.extend((text, level, kind) for text in event.text.rstrip("\n").split("\n"))
+                continue
+            line = classify(event)
+            if line is not None:
+                lines.append(line)
+        dropped = self.store.append_lines(lines)
+        if dropped:
+            self._drop_lines(dropped)
+        added = self._update_view()
+        if self.follow:
+            if added:
+                self._render()
+        else:
+            self._update_scrollbar()
+
+    def redraw_console_text(self) -> None:
+        # run the filter over the whole store again, e.g. after toggling "Show All"
+        keep = self.found if self.found is not None else self._top_line()
+        self.view.clear()
+        self.filtered = self.first
+        self._update_view()
+        if keep is not None and not self.follow:
+            self.top = self.view.search(keep)
+        self._render()
 
-        # filter esp-inernal messages
-        if not self.show_all_enabled.get() and "\r\n" in new_text and "parse" not in new_text:
+    def clear_console_text(self) -> None:
+        # the store keeps the lines, the view starts after them
+        self.first = self.filtered = len(self.store)
+        self.view.clear()
+        self.top = 0
+        self.found = None
+        self.follow = self.auto_scroll_enabled.get()
+        self._render()
+
+    def scroll(self, lines) -> str:
+        self.scroll_to(self.top + lines)
+        # no scrolling of the text widget itself
+        return "break"
+
+    def scroll_to(self, top) -> None:
+        end = max(self.view.count - self.rows, 0)
+        self.top = min(max(top, 0), end)
+        self.follow = self.auto_scroll_enabled.get() and self.top == end
+        self._render()
+
+    def show_line(self, line) -> None:
+        # bring a visible store line into the upper third of the window and mark it
+        self.found = line
+        self.scroll_to(self.view.search(line) - self.rows // 3)
+        # stay at the hit even if it is in the last rows
+        self.follow = False
+
+    def find_next(self, backwards=False) -> None:
+        from logStore import compile_search  # Importing the regex search on the store
+
+        text = self.search_input.get()
+        if not text:
             return
-
-        new_text = new_text.replace("\r", "")
-        # print(">> ", new_text.encode())
-        self.console_text.configure(state="normal")
-        if send:
-            self.console_text.insert("end", new_text, "send")
-        elif "error" in new_text.lower():
-            self.console_text.insert("end", new_text, "error")
+        if text != self.search_text:
+            try:
+                self.pattern = compile_search(text)
+            except re.error:
+                self.search_input.configure(foreground="red")
+                return
+            self.search_text = text
+            self.search_input.configure(foreground="black")
+        if backwards:
+            end = self.found if self.found is not None else len(self.store)
+            line = self.store.rfind(self.pattern, self.first, end, mask_function=self._mask)
+            if line is None:
+                # wrap around
+                line = self.store.rfind(self.pattern, end, mask_function=self._mask)
         else:
-            self.console_text.insert("end", new_text)
-        self.console_text.configure(state="disabled")
-        # Add auto-scrolling functionality
-        if self.auto_scroll_enabled.get():
-            self.console_text.see("end")
+            start = self.found + 1 if self.found is not None else self._top_line() or self.first
+            line = self.store.find(self.pattern, start, mask_function=self._mask)
+            if line is None:
+                line = self.store.find(self.pattern, self.first, start, mask_function=self._mask)
+        if line is None:
+            self.app.app.bell()
+            return
+        self.show_line(line)
+
+    def next_error(self) -> None:
+        from logStore import ERROR  # Importing the level code of errors
+
+        # errors pass every level filter and "Show All"
+        start = self.found + 1 if self.found is not None else self._top_line() or self.first
+        line = self.store.find_level(ERROR, start)
+        if line is None:
+            line = self.store.find_level(ERROR, self.first, start)
+        if line is None:
+            self.app.app.bell()
+            return
+        self.show_line(line)
+
+    def _mask(self, levels, kinds):
+        from logStore import LEVEL_CODES, LEVEL_ESP, ERROR, KIND_RESPONSE  # Importing the level codes
+
+        # firmware lines up to the chosen level, lines of the parser and CUBEcontrol always
+        visible = (levels <= LEVEL_CODES[self.LEVEL_FILTERS[self.level_filter.get()]]) | (levels >= LEVEL_ESP)
+        if not self.show_all_enabled.get():
+            # esp-internal messages are only shown with "Show All", parser errors always
+            visible &= (kinds != KIND_RESPONSE) | (levels <= ERROR)
+        return visible
+
+    def _drop_lines(self, n) -> None:
+        # the store dropped its n oldest lines, shift every store index down by n
+        cut = self.view.search(n)
+        self.view.drop(cut)
+        self.view.values[:] -= n
+        self.top = max(self.top - cut, 0)
+        self.filtered = max(self.filtered - n, 0)
+        self.first = max(self.first - n, 0)
+        if self.found is not None:
+            self.found = self.found - n if self.found >= n else None
+
+    def _update_view(self) -> int:
+        # filter the store lines added since the last call
+        count = len(self.store)
+        if self.filtered >= count:
+            return 0
+        lines = self.store.select(self._mask, self.filtered, count)
+        self.view.extend(lines)
+        self.filtered = count
+        return len(lines)
+
+    def _top_line(self):
+        return int(self.view.array[self.top]) if self.top < self.view.count else None
+
+    def _render(self) -> None:
+        from logStore import FATAL, ERROR, LEVEL_CODES, KIND_SENT  # Importing the level codes
+
+        if self.follow:
+            self.top = max(self.view.count - self.rows, 0)
+        lines = self.view.array[self.top : min(self.top + self.rows, self.view.count)]
+        levels = self.store.levels.array[lines]
+        kinds = self.store.kinds.array[lines]
+        warning = LEVEL_CODES["WARNING"]
+        chunks = []
+        for line, text, level, kind in zip(lines, self.store.lines(lines), levels, kinds):
+            if FATAL <= level <= ERROR:
+                tag = "error"
+            elif level == warning:
+                tag = "warning"
+            elif kind == KIND_SENT:
+                tag = "send"
+            else:
+                tag = ""
+            chunks += (text + "\n", (tag, "found") if line == self.found else tag)
 
-    def clear_console_text(self) -> None:
+        # one state toggle, one delete and one insert per update, whatever the size of the store
         self.console_text.configure(state="normal")
         self.console_text.delete("1.0", "end")
+        if chunks:
+            self.console_text.insert("end", *chunks)
         self.console_text.configure(state="disabled")
+        if self.follow:
+            # wrapped lines may need more rows than the widget has
+            self.console_text.see("end")
+        self._update_scrollbar()
+
+    def _update_scrollbar(self) -> None:
+        count = self.view.count
+        if count <= self.rows:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.top / count, min(self.top + self.rows, count) / count)
+
+    def _on_scrollbar(self, action, amount, unit=None) -> None:
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.view.count))
+        else:
+            self.scroll(int(amount) * (self.rows if unit == "pages" else 1))
+
+    def _on_resize(self, event) -> None:
+        rows = max(1, event.height // tkfont.Font(font=self.console_text["font"]).metrics("linespace"))
+        if rows != self.rows:
+            self.rows = rows
+            self._render()
+
+    def _scroll_to_end(self) -> None:
+        if self.auto_scroll_enabled.get():
+            self.scroll_to(self.view.count)
+        else:
+            self.follow = False
 
     def remove_console(self) -> None:
         self.console_frame.destroy()
@@ -122,9 +375,7 @@ class Console:
             self.app.send_msg(input_data)
 
         else:
-            self.console_text.config(state="normal")
-            self.update_console_text("Serial port not connected.\n")
-            self.console_text.config(state="disabled")
+            self.update_console_text("Serial port not connected.")
 
     def _remove_placeholder_text(self):
         if self.console_input.get() == self.placeholder_text:
@@ -154,6 +405,7 @@ class ConfigWindow:
             "offtime": [12000, "OffTime (ns):", "int"],
             "lower_thr": [3.5, "Lower Threshold (V):", "float"],
             "upper_thr": [30.0, "Upper Threshold (V):", "float"],
+            "adc_window": [0.5, "Stats Window (s):", "float"],
             "auto_sens": [10, "Sensitivity:", "int"],
         }
 
@@ -183,7 +435,7 @@ class ConfigWindow:
         # Define the label frames' information
         label_frames = [
             ("Generator Settings", 0, 0, ("ontime", "offtime")),
-            ("ADC Settings", 0, 1, ("lower_thr", "upper_thr")),
+            ("ADC Settings", 0, 1, ("lower_thr", "upper_thr", "adc_window")),
             ("Automode Settings", 0, 2, ("auto_sens",)),
         ]
 
@@ -230,11 +482,181 @@ class ConfigWindow:
         return False
 
 
+class ProgramWindow:
+    def __init__(self, app):
+        # refernce to the window and the app, the streamer runs on the device loop
+        self.window = None
+        self.app = app
+        self.program = None
+        self.program_path = None
+        self.streamer = None
+        self.update_handle = None
+
+    def open(self):
+        # Check if the window already exists, and if so, destroy it
+        if self.window and self.window.winfo_exists():
+            self.close()
+            return
+
+        self.window = tk.Toplevel(self.app.app)
+        self.window.title("Program")
+        self.window.resizable(False, False)
+        self.window.transient(self.app.app)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        inner_frame = ttk.Frame(self.window, padding=(20, 20, 20, 20))
+        inner_frame.pack(fill="both", expand=True)
+        self.window.geometry("+%d+%d" % (self.app.app.winfo_x() + 400, self.app.app.winfo_y() + 200))
+
+        self.file_label = ttk.Label(inner_frame, text="No program loaded", width=40)
+        self.file_label.grid(column=0, row=0, columnspan=4, sticky="w", pady=(0, 10))
+
+        buttons = [
+            ("load_button", "Load", self.load),
+            ("start_button", "Start", self.start),
+            ("pause_button", "Pause", self.toggle_pause),
+            ("abort_button", "Abort", self.abort),
+        ]
+        for col, (name, text, command) in enumerate(buttons):
+            button = ttk.Button(inner_frame, text=text, width=9, command=command)
+            button.grid(column=col, row=1, sticky="nesw", padx=(0 if col == 0 else 10, 0))
+            setattr(self, name, button)
+
+        self.status_label = ttk.Label(inner_frame, text="", justify="left")
+        self.status_label.grid(column=0, row=2, columnspan=4, sticky="w", pady=(10, 0))
+        self.refresh()
+        self.update_handle = self.app.app.after(250, self.update_status)
+
+    def close(self):
+        if self.update_handle is not None:
+            self.app.app.after_cancel(self.update_handle)
+            self.update_handle = None
+        if self.window is not None:
+            self.window.destroy()
+            self.window = None
+
+    def load(self):
+        path = filedialog.askopenfilename(
+            parent=self.window, title="Open G-code program", filetypes=(("G-code", "*.gcode *.nc *.txt"), ("All", "*"))
+        )
+        if not path:
+            return
+        from programStreamer import load_program  # Importing the program loader on first use
+
+        try:
+            self.program = load_program(path)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            messagebox.showerror("Error loading program!", message=f"Error loading program: {e}", parent=self.window)
+            return
+        self.program_path = path
+        self.streamer = None
+        self.file_label.configure(text=f"{os.path.basename(path)} ({len(self.program)} lines)")
+        self.refresh()
+
+    def start(self):
+        if self.program is None or self.app.device is None or self.running:
+            return
+        from programStreamer import ProgramStreamer  # Importing the flow controlled program streamer
+
+        self.streamer = ProgramStreamer(self.app.device, self.program)
+        self.app.ui_pipeline.post(ConsoleEvent(f"Streaming {os.path.basename(self.program_path)}", send=True))
+        self.app.run_device(self.streamer.run()).add_done_callback(self._done)
+        self.refresh()
+
+    def toggle_pause(self):
+        if not self.running:
+            return
+        if self.streamer.state == "paused":
+            self.streamer.resume()
+        else:
+            self.streamer.pause()
+
+    def abort(self):
+        if self.running:
+            self.streamer.abort()
+
+    @property
+    def running(self) -> bool:
+        return self.streamer is not None and self.streamer.state in ("idle", "running", "paused")
+
+    def _done(self, future) -> None:
+        # device loop thread
+        if future.cancelled() or future.exception() is not None:
+            return
+        status = future.result()
+        text = f"Program {status['state']}: {status['done']}/{status['lines']} lines, {status['lines_per_s']} lines/s"
+        if self.streamer.first_error is not None:
+            line, error = self.streamer.first_error
+            text += f", first error in line {line.number}: {error.text}"
+        self.app.ui_pipeline.post(ConsoleEvent(text, error=self.streamer.first_error is not None))
+
+    def update_status(self):
+        # poll the streamer counters while the window is open, the only place that reschedules
+        self.update_handle = None
+        if self.window is None:
+            return
+        self.refresh()
+        self.update_handle = self.app.app.after(250, self.update_status)
+
+    def refresh(self):
+        # labels and buttons from the streamer counters
+        if self.streamer is None:
+            self.status_label.configure(text="")
+        else:
+            status = self.streamer.status()
+            self.status_label.configure(
+                text=f"{status['state']}: {status['done']}/{status['lines']} lines done, "
+                f"{status['lines_per_s']} lines/s\n"
+                f"queue: {status['queued']} lines, in flight: {status['in_flight']} lines "
+                f"({status['bytes_in_flight']} bytes), errors: {status['errors']}"
+            )
+        running = self.running
+        can_start = self.program is not None and self.app.device is not None and not running
+        self.start_button.configure(state="enabled" if can_start else "disabled")
+        self.pause_button.configure(
+            state="enabled" if running else "disabled",
+            text="Resume" if running and self.streamer.state == "paused" else "Pause",
+        )
+        self.abort_button.configure(state="enabled" if running else "disabled")
+
+
 class CubeControlApp:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        max_fps=30,
+        console_lines=1_000_000,
+        replay_speed=1.0,
+        port_patterns=(),
+        defer_startup=True,
+        binary_reports=False,
+        reconnect_timeout=3.0,
+        serve=None,
+    ) -> None:
         self.device = None
+        self.recorder = None
+        self.window_recorder = None
+        self.replayer = None
+        self.replay_speed = replay_speed
+        # lines kept in the console log store, None keeps the whole session
+        self.console_lines = console_lines
+        self.control_frame = None
         self.serial_devices = []
-        self.update_serial_handle = None
+        self.port_patterns = port_patterns
+        self.defer_startup = defer_startup
+        # switch the firmware to binary ADC/POS frames (M105) after connecting
+        self.binary_reports = binary_reports
+        # seconds the device core tries to re-attach a lost port before giving up
+        self.reconnect_timeout = reconnect_timeout
+        # address ("127.0.0.1:8765" or a unix socket path) to share the telemetry with local clients
+        self.serve = serve
+        self.telemetry_server = None
+        # continuous jog while an arrow button or key is held, see holdJog.py
+        self.hold_jog = None
+        self.jog_direction = None
+        self._hold_after = None
+        self._key_release_after = None
+        # wall clock times of the startup phases, see benchmarks/benchStartup.py
+        self.startup_times = {"created": time.time()}
 
         self.app = tk.Tk()
         #self.app.iconbitmap(current_path + "/img/icon.ico")
@@ -242,28 +664,87 @@ class CubeControlApp:
         self.app.geometry("800x500")
         self.app.resizable(False, False)
 
-        self.adc_pattern = re.compile(r"<ADC>.*calc:(\d+\.\d+)V")
-        self.pos_pattern = re.compile(r"POS> homed:(\d) steps:(\d+) pos:(\d+\.\d{4})")
         self.config_window = ConfigWindow(self.app)
 
+        # telemetry history for the live plot and the ADC statistics, created with the control widgets
+        self.adc_aggregator = None
+        self.plot_buffers = None
+        self.plot_window = None
+        self.program_window = ProgramWindow(self)
+
+        # latency counters and histograms, toggled with F12
+        self.stats_window = None
+        self.app.bind("<F12>", lambda event: self.toggle_stats())
+
+        # created by finish_startup()
+        self.loop_thread = None
+        self.port_watcher = None
+
+        # serial data is rendered through the pipeline, at most max_fps times per second
+        self.ui_pipeline = UiPipeline(
+            self.app,
+            {
+                PosFrame: self.render_pos,
+                LogLine: self.render_console,
+                ConsoleEvent: self.render_console,
+            },
+            max_fps=max_fps,
+        )
+
         self.setup_ui()
 
     def setup_ui(self) -> None:
-        # set theme
-        sv_ttk.set_theme("light")
-
         # Create frames and configure grid
         self.right_frame, self.left_frame = self.create_frames(self.app)
-        self.console = Console(self, self.right_frame)
+        self.console = Console(self, self.right_frame, max_lines=self.console_lines)
 
-        # Load and display the image, text, and logo in the right frame
+        # Display the canvas and the logo text, the images are loaded by finish_startup()
         self.display_image_text_logo()
 
+        self.app.bind("<Map>", self._on_map, add="+")
+        if not self.defer_startup:
+            self.finish_startup()
+
+    def _on_map(self, event) -> None:
+        if event.widget is not self.app or "first_frame" in self.startup_times:
+            return
+        self.startup_times["first_frame"] = time.time()
+        if self.defer_startup:
+            # give Tk the time to handle the expose events before the slow part of the startup
+            self.app.after(10, self.finish_startup)
+
+    def finish_startup(self) -> None:
+        # everything that is not needed for the first frame
+        self.app.update_idletasks()
+
+        import sv_ttk  # Importing a custom module for additional themed Tkinter widgets (assuming it's a custom module)
+        from cubeDevice import LoopThread, SentLine  # Importing the headless device core
+        from portWatcher import PortWatcher, PortChange  # Importing the background serial port watcher
+
+        # set theme
+        sv_ttk.set_theme("light")
+        self.load_images()
+
         # Add the select device label and dropdown in the left frame
         self.add_device_selection()
 
-        # Schedule the automatic update of the serial devices list
-        self.update_serial_handle = self.app.after(0, self.update_serial_devices)
+        # the device core runs on an asyncio loop next to the Tk mainloop
+        self.loop_thread = LoopThread()
+        self.loop_thread.start()
+
+        # serial ports are watched in the background, only changes are posted to the ui
+        # (port_patterns add ports comports() doesn't list, e.g. the link of the simulator)
+        self.ui_pipeline.handlers[SentLine] = self.render_console
+        self.ui_pipeline.handlers[PortChange] = self.render_ports
+        self.port_watcher = PortWatcher(
+            lambda added, removed: self.ui_pipeline.post(PortChange(added, removed)), patterns=self.port_patterns
+        )
+        # the first scan of the watcher fills the serial devices list
+        self.port_watcher.start()
+
+        self.ui_pipeline.start()
+        self.startup_times["interactive"] = time.time()
+        self.app.event_generate("<<StartupDone>>", when="tail")
 
     def create_frames(self, app):
         frame_settings = [
@@ -284,24 +765,21 @@ class CubeControlApp:
         return self.right_frame, self.left_frame
 
     def display_image_text_logo(self):
-        self.image = tk.PhotoImage(file=current_path + "/img/background.png")
         self.image_canvas = tk.Canvas(self.right_frame, width=400, height=500, bd=0, highlightthickness=0)
         self.image_canvas.grid()
-        self.image_canvas.create_image(0, 0, anchor=tk.NW, image=self.image)
+        self.background_item = self.image_canvas.create_image(0, 0, anchor=tk.NW)
 
         version_text = "Marcus Voß 2023"
         self.image_canvas.create_text(330, 480, text=version_text)
 
-        self.logo_image = tk.PhotoImage(file=current_path + "/img/logo.png")
         logo_labels = [
-            ("logo_image_label", self.logo_image, None, 0, 0, 3),
-            ("logo_text_label", None, "CUBEcontrol", 0, 0, 3),
+            ("logo_image_label", None, 0, 0, 3),
+            ("logo_text_label", "CUBEcontrol", 0, 0, 3),
         ]
 
-        for name, image, text, col, row, colspan in logo_labels:
+        for name, text, col, row, colspan in logo_labels:
             label = ttk.Label(
                 self.left_frame,
-                image=image,
                 text=text,
                 anchor="center",
                 font=("Arial", 24, "bold"),
@@ -310,11 +788,17 @@ class CubeControlApp:
             label.grid(column=col, row=row, columnspan=colspan)
             setattr(self, name, label)
 
+    def load_images(self):
+        # decoding the pngs is one of the slower parts of the startup
+        self.image = tk.PhotoImage(file=current_path + "/img/background.png")
+        self.image_canvas.itemconfigure(self.background_item, image=self.image)
+        self.logo_image = tk.PhotoImage(file=current_path + "/img/logo.png")
+        self.logo_image_label.configure(image=self.logo_image)
+
     def add_device_selection(self):
         self.select_device_label = ttk.Label(self.left_frame, text="Select a Device:", font=("Arial", 12))
         self.select_device_label.grid(column=0, row=1, sticky=tk.W, columnspan=3, pady=10, padx=10)
 
-        self.serial_devices = [str(port.device) for port in serial.tools.list_ports.comports()]
         self.device_dropdown = ttk.Combobox(
             self.left_frame,
             values=self.serial_devices,
@@ -332,41 +816,112 @@ class CubeControlApp:
         )
         self.connect_button.grid(column=1, row=2, sticky=tk.W)
 
+        self.replay_button = ttk.Button(self.left_frame, text="Replay", command=self.start_replay)
+        self.replay_button.grid(column=1, row=3, sticky=tk.W, pady=(10, 0))
+        # "max" feeds the recording as fast as the gui takes it
+        self.replay_speed_box = ttk.Combobox(self.left_frame, values=REPLAY_SPEEDS, width=6, state="readonly")
+        self.replay_speed_box.set(replay_speed_text(self.replay_speed))
+        self.replay_speed_box.grid(column=0, row=3, sticky=tk.E, padx=10, pady=(10, 0))
+
     def connect_device(self) -> None:
         selected_device = self.device_dropdown.get()
         print(f"Connecting to {selected_device}...")
+        from cubeDevice import CubeDevice, ConnectionEvent  # Importing the headless device core
+        from deviceState import DeviceState  # Importing the mirror of the firmware state
+
+        # a lost connection (USB glitch) is re-attached without restarting the firmware
+        device = CubeDevice(selected_device, 115200, reconnect=self.reconnect_timeout)
         try:
-            self.device = serial.Serial(selected_device, 115200, timeout=1)
+            self.loop_thread.submit(device.connect()).result()
         except Exception as e:
             messagebox.showerror(
                 "Error connecting to device!",
                 message=f"Error connecting to device: {e}",
             )
             return
-        if self.device.is_open:
-            self.stop_serial = False
-            self.connect_button.configure(text="Disconnect", command=self.disconnect_device)
-            self.device_dropdown.configure(state="disabled")
-            self.create_control_widgets()
-            self.console.create_console()
-            self.serial_thread = threading.Thread(target=self.read_serial)
-            self.console.update_console_text(f"Connected to {self.device.port} @  baudrate {self.device.baudrate}")
-            # send intial messages
-            self.send_msg("M0 ;restart device")
-            self.send_msg("G91 ; relative positioning")
-            self.send_msg("M1 500 ;set report interval to 500ms")
-            self.serial_thread.start()
+        self.device = device
+        self.device.add_listener(self.read_serial)
+        self.connect_button.configure(text="Disconnect", command=self.disconnect_device)
+        self.device_dropdown.configure(state="disabled")
+        self.replay_button.grid_remove()
+        self.replay_speed_box.grid_remove()
+        self.create_control_widgets()
+        self.console.create_console()
+        # buttons the firmware would refuse are greyed out, the state changes on the device loop
+        self.ui_pipeline.handlers[DeviceState] = self.render_state
+        if DeviceState not in self.ui_pipeline.coalesce:
+            self.ui_pipeline.coalesce += (DeviceState,)
+        self.ui_pipeline.handlers[ConnectionEvent] = self.render_connection
+        device.state.add_listener(self._state_changed)
+        self.ui_pipeline.post(device.state.copy())
+        self.ui_pipeline.post(ConsoleEvent(f"Connected to {self.device.port} @  baudrate {self.device.baudrate}"))
+        if self.serve:
+            self.start_telemetry_server()
+        # attach to the running firmware (the Restart button restarts it), relative positioning, report interval 500ms
+        self.run_device(self.device.initialize(restart=False, report_interval=500, binary=self.binary_reports))
 
     def disconnect_device(self) -> None:
         print("Disconnected from device")
-        self.stop_serial = True
-        self.serial_thread.join()
+        self.close_device()
+        # clearing the queue may drop port changes, take the current list from the watcher
+        self.ui_pipeline.clear()
+        self.serial_devices = list(self.port_watcher.ports)
         self.connect_button.configure(text="Connect", command=self.connect_device, state="enabled")
         self.device_dropdown.configure(state="readonly")
         self.select_device_label.grid()
+        self.replay_button.grid()
+        self.replay_speed_box.grid()
         self.console.remove_console()
         self.remove_control_widgets()
-        self.device = None
+        self.update_serial_devices()
+
+    def start_replay(self) -> None:
+        path = filedialog.askdirectory(parent=self.app, title="Open recording", initialdir=recordings_path)
+        if not path:
+            return
+        from recorder import Recording, Replayer  # Importing the memory-mapped telemetry recorder
+
+        try:
+            recording = Recording(path)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error opening recording!", message=f"Error opening recording: {e}")
+            return
+        self.replay_speed = parse_replay_speed(self.replay_speed_box.get())
+        self.replayer = Replayer(recording, self.read_serial, speed=self.replay_speed, on_done=self._replay_done)
+        self.connect_button.configure(text="Stop Replay", command=self.stop_replay, state="enabled")
+        self.device_dropdown.configure(state="disabled")
+        self.replay_button.grid_remove()
+        self.replay_speed_box.grid_remove()
+        self.create_control_widgets()
+        self.console.create_console()
+        # there is no device to send commands to
+        for frame in (self.generator_label_frame, self.movement_label_frame):
+            for widget in frame.winfo_children():
+                if isinstance(widget, ttk.Button) and widget is not self.config_button:
+                    widget.configure(state="disabled")
+        self.ui_pipeline.post(
+            ConsoleEvent(
+                f"Replaying {path} ({len(recording)} samples, {recording.duration:.1f}s)"
+                f" at {replay_speed_text(self.replay_speed)}"
+            )
+        )
+        self.replayer.start()
+
+    def stop_replay(self) -> None:
+        self.replayer.stop()
+        self.replayer.join()
+        self.replayer = None
+        self.disconnect_device()
+
+    def _replay_done(self, replayer) -> None:
+        # replay thread
+        elapsed = time.perf_counter() - replayer.started
+        self.ui_pipeline.post(
+            ConsoleEvent(
+                f"Replay finished after {replayer.replayed} samples in {elapsed:.2f}s"
+                f" ({replayer.replayed / max(elapsed, 1e-9):.0f} samples/s)"
+            )
+        )
 
     def fill_movement_frame(self, parent):
         # Labels and buttons settings
@@ -406,16 +961,13 @@ class CubeControlApp:
             None,
             None,
             None,
-            lambda: self.send_msg(
-                f"G1 Z-{self.movement_steps[self.movement_steps_dropdown.current()]} ;move up {self.movement_steps_dropdown.get()}"
-            ),
-            lambda: self.send_msg(
-                f"G1 Z{self.movement_steps[self.movement_steps_dropdown.current()]} ;move down {self.movement_steps_dropdown.get()}"
-            ),
-            lambda: self.send_msg("G28 ;home"),
-            lambda: self.send_msg("M0 ;restart"),
-            lambda: self.send_msg(
-                f"M102 {self.config_window.get('lower_thr')} {self.config_window.get('upper_thr')} ;touchmode"
+            # the arrow buttons are bound to press and release below
+            None,
+            None,
+            lambda: self.run_device(self.device.home()),
+            lambda: self.run_device(self.device.restart()),
+            lambda: self.run_device(
+                self.device.touch(self.config_window.get("lower_thr"), self.config_window.get("upper_thr"))
             ),
         ]
 
@@ -427,6 +979,14 @@ class CubeControlApp:
                 widget.configure(command=commands[idx])
             setattr(self, name, widget)
 
+        # a click jogs one step, holding the button or the arrow key moves until it is released
+        for button, direction in ((self.up_arrow_button, -1), (self.down_arrow_button, 1)):
+            button.bind("<ButtonPress-1>", lambda event, d=direction: self.press_jog(d, event.widget))
+            button.bind("<ButtonRelease-1>", lambda event, d=direction: self.release_jog(d))
+        for key, direction in (("Up", -1), ("Down", 1)):
+            self.app.bind(f"<KeyPress-{key}>", lambda event, d=direction: self.press_jog_key(d, event.widget))
+            self.app.bind(f"<KeyRelease-{key}>", lambda event, d=direction: self.release_jog_key(d))
+
         # Movement Step dropdown
         self.movement_steps = [0.5, 1, 2.5, 5, 10, 100, 1000, 5000]
         movement_steps_labels = [
@@ -449,6 +1009,77 @@ class CubeControlApp:
         self.movement_steps_dropdown.current(0)
         self.movement_steps_dropdown.grid(column=2, row=1, pady=10, sticky="w")
 
+    def press_jog(self, direction, button) -> None:
+        if self.device is None or self.jog_direction is not None or self.hold_jog is not None:
+            return
+        if button.instate(["disabled"]):
+            return
+        self.jog_direction = direction
+        self._hold_after = self.app.after(HOLD_DELAY_MS, self.start_hold_jog)
+
+    def release_jog(self, direction) -> None:
+        if direction != self.jog_direction:
+            return
+        if self._hold_after is not None:
+            # released before the hold delay: one step of the dropdown
+            self.app.after_cancel(self._hold_after)
+            self._hold_after = None
+            self.run_device(self.device.jog(direction * self.movement_steps[self.movement_steps_dropdown.current()]))
+        else:
+            # set back to None on the device loop when the jog stopped
+            hold_jog = self.hold_jog
+            if hold_jog is not None:
+                hold_jog.release()
+        self.jog_direction = None
+
+    def press_jog_key(self, direction, widget) -> None:
+        if self._key_release_after is not None and direction == self.jog_direction:
+            # auto repeat of a held key sends release and press pairs
+            self.app.after_cancel(self._key_release_after)
+            self._key_release_after = None
+            return
+        # the arrow keys keep their meaning in entries, comboboxes and the console
+        if self.control_frame is None or isinstance(widget, (ttk.Entry, tk.Entry, tk.Text)):
+            return
+        button = self.up_arrow_button if direction < 0 else self.down_arrow_button
+        self.press_jog(direction, button)
+
+    def release_jog_key(self, direction) -> None:
+        if direction != self.jog_direction:
+            return
+        if self._key_release_after is not None:
+            self.app.after_cancel(self._key_release_after)
+        self._key_release_after = self.app.after(KEY_REPEAT_MS, lambda: self._release_jog_key(direction))
+
+    def _release_jog_key(self, direction) -> None:
+        self._key_release_after = None
+        self.release_jog(direction)
+
+    def start_hold_jog(self) -> None:
+        from holdJog import HoldJog  # Importing the continuous jog
+
+        self._hold_after = None
+        if self.device is None:
+            self.jog_direction = None
+            return
+        self.hold_jog = HoldJog(self.device, self.jog_direction)
+        self.run_device(self.hold_jog.run()).add_done_callback(self._hold_jog_done)
+
+    def _hold_jog_done(self, future) -> None:
+        # device loop, errors are reported by _device_done
+        self.hold_jog = None
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        text = (
+            f"Jogged {result['distance_um'] / 1000:.4f}mm in {result['moves']} moves "
+            f"(latency {result['latency_ms']:.0f}ms), overshoot {result['overshoot_um']:.1f}µm "
+            f"(max. {result['overshoot_bound_um']:.1f}µm, stop: {result['stop']})"
+        )
+        if result["error"] is not None:
+            text += f", stopped by: {result['error']}"
+        self.ui_pipeline.post(ConsoleEvent(text, error=result["error"] is not None))
+
     def fill_generator_frame(self, parent):
         # Buttons settings
         widget_settings = [
@@ -478,28 +1109,61 @@ class CubeControlApp:
                 {"sticky": "nesw", "padx": (15, 15), "pady": (0, 10)},
             ),
             ("generator_auto_disable_button", ttk.Button, "Auto OFF", 2, 0, {"sticky": "nesw", "pady": (0, 10)}),
+            ("program_button", ttk.Button, "Program", 2, 1, {"sticky": "nesw"}),
         ]
 
         commands = [
             self.config_window.open,
-            lambda: self.send_msg(
-                f"M100 {self.config_window.get('ontime')} {self.config_window.get('offtime')} ;enable generator"
+            lambda: self.run_device(
+                self.device.generator_on(self.config_window.get("ontime"), self.config_window.get("offtime"))
             ),
-            lambda: self.send_msg("M101 ;disable generator"),
-            lambda: self.send_msg(
-                f"M103 {self.config_window.get('lower_thr')} {self.config_window.get('upper_thr')} {self.config_window.get('auto_sens')} ;auto mode"
+            lambda: self.run_device(self.device.generator_off()),
+            lambda: self.run_device(
+                self.device.auto_mode(
+                    self.config_window.get("lower_thr"),
+                    self.config_window.get("upper_thr"),
+                    self.config_window.get("auto_sens"),
+                )
             ),
-            lambda: self.send_msg("M104 ;auto off"),
+            lambda: self.run_device(self.device.auto_off()),
+            self.program_window.open,
         ]
 
         for i, (name, widget_class, text, col, row, options) in enumerate(widget_settings):
             widget = widget_class(parent, text=text, width=9, command=commands[i])
             widget.grid(column=col, row=row, **options)
+            setattr(self, name, widget)
+
+    def render_ports(self, events) -> None:
+        # apply the changes reported by the port watcher
+        removed = set()
+        for event in events:
+            removed.update(event.removed)
+            self.serial_devices = [port for port in self.serial_devices if port not in event.removed]
+            self.serial_devices += [port for port in event.added if port not in self.serial_devices]
+        if self.device is not None and self.device.port in removed and not self.device.reconnect:
+            self.disconnect_device()
+            messagebox.showerror("Connection Lost!", message="Connection to device lost!")
+        self.update_serial_devices()
+
+    def render_connection(self, events) -> None:
+        # the device core lost the port and tries to re-attach
+        for event in events:
+            if event.event == "lost":
+                self.console.add_console_entries([ConsoleEvent(f"{event.reason}, reconnecting...", error=True)])
+            elif event.event == "reconnected":
+                self.console.add_console_entries([ConsoleEvent(f"Reconnected after {event.elapsed:.2f}s")])
+            elif self.device is not None:
+                self.disconnect_device()
+                messagebox.showerror("Connection Lost!", message=f"Connection to device lost! ({event.reason})")
+                return
 
     def update_serial_devices(self) -> None:
-        # Get the list of serial devices and update the dropdown
-        self.serial_devices = [str(port.device) for port in serial.tools.list_ports.comports()]
-        if self.device == None:
+        # update the dropdown from the list of serial devices
+        if self.replayer is not None:
+            # the controls belong to a replay, leave the device selection alone
+            pass
+        elif self.device == None:
             if len(self.serial_devices) > 0:
                 self.device_dropdown["values"] = self.serial_devices
                 self.device_dropdown.configure(state="readonly")
@@ -511,13 +1175,6 @@ class CubeControlApp:
                 self.device_dropdown.set("No Device Connected")
                 self.device_dropdown.configure(state="disabled")
                 self.connect_button.configure(state="disabled")
-        else:
-            if self.device.port not in self.serial_devices:
-                self.disconnect_device()
-                messagebox.showerror("Connection Lost!", message="Connection to device lost!")
-
-        # Schedule the next update
-        self.update_serial_handle = self.app.after(1000, self.update_serial_devices)
 
     def create_control_widgets(self) -> None:
         self.logo_text_label.grid(column=0, row=0, sticky="n")
@@ -537,69 +1194,239 @@ class CubeControlApp:
             frame.grid(column=0, row=idx, columnspan=3, sticky="nesw", padx=0, pady=5)
             setattr(self, name, frame)
 
-        self.adc_voltage_label = ttk.Label(self.adc_label_frame, text="ADC voltage: ?")
+        self.adc_voltage_label = ttk.Label(self.adc_label_frame, text="ADC voltage: ?", width=24)
         self.adc_voltage_label.grid(column=0, row=0, pady=5, padx=(10, 0))
+        self.adc_stats_label = ttk.Label(self.adc_label_frame, text="")
+        self.adc_stats_label.grid(column=0, row=1, columnspan=3, pady=(0, 5), padx=(10, 0), sticky="w")
+
+        self.recording_enabled = tk.BooleanVar(value=False)
+        self.record_button = ttk.Checkbutton(
+            self.adc_label_frame, text="Record", variable=self.recording_enabled, command=self.toggle_recording
+        )
+        self.record_button.grid(column=1, row=0, pady=5, padx=(30, 0))
+
+        if self.adc_aggregator is None:
+            from adcStats import AdcAggregator, AdcWindow  # Importing the windowed ADC statistics
+
+            # the label shows one summary per window instead of the last of many reports
+            self.adc_aggregator = AdcAggregator(
+                lambda: (
+                    self.config_window.get("adc_window"),
+                    self.config_window.get("lower_thr"),
+                    self.config_window.get("upper_thr"),
+                )
+            )
+            self.ui_pipeline.handlers[AdcWindow] = self.render_adc
+            self.ui_pipeline.coalesce += (AdcWindow,)
+        self.adc_aggregator.reset()
+
+        if self.plot_buffers is None:
+            from plotPanel import TelemetryBuffers, PlotWindow  # Importing the live strip charts
+
+            # telemetry history for the live plot, filled by the reader thread
+            self.plot_buffers = TelemetryBuffers()
+            self.plot_window = PlotWindow(self.app, self.plot_buffers, self.config_window)
+        self.plot_button = ttk.Button(self.adc_label_frame, text="Plot", command=self.plot_window.open)
+        self.plot_button.grid(column=2, row=0, pady=5, padx=(10, 0))
 
         self.fill_generator_frame(self.generator_label_frame)
         self.fill_movement_frame(self.movement_label_frame)
 
     def remove_control_widgets(self) -> None:
+        self.stop_recording()
+        self.program_window.abort()
         self.logo_text_label.grid(column=0, row=0, sticky="")
         self.control_frame.destroy()
+        self.control_frame = None
+
+    def toggle_recording(self) -> None:
+        if self.recording_enabled.get():
+            self.start_recording()
+        else:
+            self.stop_recording()
+
+    def start_recording(self) -> None:
+        from recorder import Recorder, WindowRecorder, WINDOWS_DIRECTORY  # Importing the telemetry recorders
+
+        path = os.path.join(recordings_path, time.strftime("%Y%m%d-%H%M%S"))
+        try:
+            self.recorder = Recorder(path)
+            self.window_recorder = WindowRecorder(os.path.join(path, WINDOWS_DIRECTORY))
+        except OSError as e:
+            self.stop_recording()
+            self.recording_enabled.set(False)
+            messagebox.showerror("Error starting recording!", message=f"Error starting recording: {e}")
+            return
+        self.ui_pipeline.post(ConsoleEvent(f"Recording to {path}"))
+
+    def stop_recording(self) -> None:
+        window_recorder, self.window_recorder = self.window_recorder, None
+        if window_recorder is not None:
+            window_recorder.close()
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+            self.ui_pipeline.post(ConsoleEvent(f"Recording stopped after {recorder.rows} samples"))
 
     def send_msg(self, input_data):
         if len(input_data) <= 0 or self.device is None:
             return
-        if input_data[-1] != "\n":
-            input_data += "\n"
-        self.device.write(input_data.encode())
-        self.console.update_console_text(f">>> {input_data}", True)
-
-    def parse_msg(self, msg):
-        match_adc_voltage = self.adc_pattern.search(msg)
-        if match_adc_voltage:
-            voltage = float(match_adc_voltage.group(1))
-            self.adc_voltage_label.configure(text=f"ADC voltage: {voltage}V")
-            return 1
-        pos_match = self.pos_pattern.search(msg)
-
-        if pos_match:
-            homed = bool(int(pos_match.group(1)))
-            steps = int(pos_match.group(2))
-            pos = float(pos_match.group(3))
-            self.current_steps_label.configure(text=f"Steps: {steps}")
-            self.current_position_label.configure(text=f"{pos:.4f}mm")
-            self.homed_label.configure(text="Homed" if homed else "Not Homed")
-            return 1
-        return 0
-
-    def read_serial(self):
-        while not self.stop_serial and self.device is not None:
-            if self.device.inWaiting() > 0:
-                data = None
-                try:
-                    data = self.device.readline().decode()
-                except UnicodeDecodeError as e:
-                    #print(e)
-                    pass
-                if self.parse_msg(data) == 0:
-                    self.console.update_console_text(data)
+        self.run_device(self.device.send(input_data))
+
+    def run_device(self, coro):
+        # run a device coroutine on the event loop, failures are reported in the console
+        future = self.loop_thread.submit(coro)
+        future.add_done_callback(self._device_done)
+        return future
+
+    def _device_done(self, future) -> None:
+        from cubeDevice import CommandError  # Importing the error of <ERROR> replies
+
+        if future.cancelled():
+            return
+        error = future.exception()
+        # <ERROR> replies of the firmware are already shown in the console
+        if error is not None and not isinstance(error, CommandError):
+            self.ui_pipeline.post(ConsoleEvent(f"Error: {type(error).__name__} {error}", error=True))
+
+    def read_serial(self, records):
+        # called by the device core (or a replay) with the decoded records of one received chunk
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.append_records(records)
+        plot_buffers = self.plot_buffers
+        if plot_buffers is not None:
+            plot_buffers.append_records(records)
+        self.ui_pipeline.post_many(records)
+        aggregator = self.adc_aggregator
+        if aggregator is not None:
+            windows = aggregator.append_records(records)
+            if windows:
+                window_recorder = self.window_recorder
+                if window_recorder is not None:
+                    window_recorder.append_records(windows)
+                self.ui_pipeline.post_many(windows)
+
+    def render_adc(self, window):
+        if self.control_frame is None:
+            return
+        if window.count == 1:
+            self.adc_voltage_label.configure(text=f"ADC voltage: {window.mean:.2f}V")
+            self.adc_stats_label.configure(text="")
+            return
+        self.adc_voltage_label.configure(text=f"ADC voltage: {window.mean:.2f}V ±{window.std:.2f}")
+        self.adc_stats_label.configure(
+            text=f"{window.min:.2f}..{window.max:.2f}V  below: {window.below:.0%}  above: {window.above:.0%}"
+            f"  ({window.count} samples)"
+        )
+
+    def _state_changed(self, state, changes) -> None:
+        # device loop
+        self.ui_pipeline.post(state.copy())
+
+    def render_state(self, state) -> None:
+        if self.control_frame is None or self.device is None:
+            return
+        buttons = (
+            (self.generator_enable_button, "M100"),
+            (self.generator_disable_button, "M101"),
+            (self.generator_auto_button, "M103"),
+            (self.generator_auto_disable_button, "M104"),
+            (self.touch_button, "M102"),
+        )
+        for button, word in buttons:
+            button.configure(state="enabled" if state.check(word) is None else "disabled")
+
+    def render_pos(self, event):
+        if self.control_frame is None:
+            return
+        self.current_steps_label.configure(text=f"Steps: {event.steps}")
+        self.current_position_label.configure(text=f"{event.pos_mm:.4f}mm")
+        self.homed_label.configure(text="Homed" if event.homed else "Not Homed")
+
+    def render_console(self, events):
+        if self.control_frame is None:
+            return
+        # LogLines, SentLines and ConsoleEvents of one frame, classified by the log store
+        self.console.add_console_entries(events)
+
+    def start_telemetry_server(self) -> None:
+        from telemetryServer import TelemetryServer  # Importing the local telemetry fan-out
+
+        # observers only, the operator keeps control of the machine
+        server = TelemetryServer(self.device)
+        try:
+            self.loop_thread.submit(server.start(self.serve)).result(timeout=5)
+        except Exception as e:
+            self.ui_pipeline.post(ConsoleEvent(f"Error: telemetry server on {self.serve}: {e}", error=True))
+            return
+        self.telemetry_server = server
+        self.ui_pipeline.post(ConsoleEvent(f"Sharing telemetry on {self.serve}"))
+
+    def close_device(self) -> None:
+        hold_jog = self.hold_jog
+        if hold_jog is not None:
+            hold_jog.release()
+        if self.telemetry_server is not None:
+            try:
+                self.loop_thread.submit(self.telemetry_server.close()).result(timeout=5)
+            except Exception as e:
+                print(f"Error while closing the telemetry server: {e}")
+            self.telemetry_server = None
         if self.device is not None:
-            self.device.close()
+            self.device.remove_listener(self.read_serial)
+            self.device.state.remove_listener(self._state_changed)
+            try:
+                self.loop_thread.submit(self.device.disconnect()).result(timeout=5)
+            except Exception as e:
+                print(f"Error while disconnecting: {e}")
         self.device = None
 
+    def toggle_stats(self) -> None:
+        if self.stats_window is None:
+            from statsWindow import StatsWindow  # Importing the live performance panel
+
+            self.stats_window = StatsWindow(self.app)
+        self.stats_window.open()
+
     def start(self):
         self.app.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.app.mainloop()
 
     def on_closing(self):
         print("closing all threads...")
-        self.stop_serial = True
-        if hasattr(self, "serial_thread"):
-            self.serial_thread.join()
+        if self.replayer is not None:
+            self.replayer.stop()
+        if self.port_watcher is not None:
+            self.port_watcher.stop()
+        self.stop_recording()
+        if self.plot_window is not None:
+            self.plot_window.close()
+        if self.stats_window is not None:
+            self.stats_window.close()
+        self.program_window.close()
+        self.close_device()
+        self.ui_pipeline.stop()
+        if self.loop_thread is not None:
+            self.loop_thread.stop()
         self.app.destroy()
 
 
 if __name__ == "__main__":
-    app = CubeControlApp()
+    import argparse  # Importing argparse for the development options
+
+    parser = argparse.ArgumentParser(description="CUBEcontrol")
+    parser.add_argument(
+        "--ports", nargs="+", default=[], help='extra port patterns, e.g. "/tmp/ttyCUBE*" for the simulator'
+    )
+    parser.add_argument("--replay-speed", default="1x", help='preselected replay factor, e.g. "10x" or "max"')
+    parser.add_argument(
+        "--console-lines", type=int, default=1_000_000, help="lines kept in the console log, 0 keeps all of them"
+    )
+    args = parser.parse_args()
+    app = CubeControlApp(
+        port_patterns=tuple(args.ports),
+        replay_speed=parse_replay_speed(args.replay_speed),
+        console_lines=args.console_lines or None,
+    )
     app.start()
@@ -0,0 +1,629 @@
+"""Headless CUBE device core
+Everything needed to talk to the CUBE firmware without Tkinter: opening the port,
+the init sequence, sending commands and waiting for their result and async
+iterators over the decoded telemetry.
+
+    async def main():
+        device = CubeDevice("/dev/ttyUSB0")
+        await device.connect()
+        await device.initialize()
+        await device.home()
+        await device.move_z(-100)
+        async for frame in device.adc():
+            print(frame.volts)
+
+The firmware answers every received line with exactly one println() of the command
+parser response (a "\\r\\n" terminated line, see readSerial() in serialParser.cpp).
+Lines are processed strictly in order, so commands are matched to their replies
+first-in first-out. Notices ("-> G1 Z10") and <ERROR> lines logged while a command
+is processed are collected into its Reply. Older firmware printed "end auto mode\\n"
+with println(), the empty "\\r\\n" line after it is not a response and skipped.
+
+Lines are written by a SerialWriter thread, send() only queues them. Jogs that are
+merged by the writer share one Reply. Received data is read by a SerialReader thread
+per device, or by a SerialSelector shared by many devices. Binary report frames
+(M105, see binaryTelemetry.py) are decoded in any mode, so it doesn't matter whether
+the firmware still has them switched on from an earlier connection.
+
+device.state mirrors the mode flags of the firmware (see deviceState.py). While no
+other command is in flight, send() raises CommandRejected for lines the firmware
+would refuse in that state instead of sending them, or with queue=True waits until
+homing or touch mode is over.
+
+Opening the port doesn't reset the ESP32, initialize(restart=False) attaches to the
+running firmware: the state is read with M114 and only the settings that differ are
+sent, so homing survives a reconnect. Firmware without M114 raises AttachError, a
+restart is up to the caller. With reconnect=seconds a lost connection is re-attached
+the same way, with a short backoff, the listeners get ConnectionEvents and the
+subscriptions stay open until the device gives up.
+"""
+import asyncio  # Importing asyncio for the awaitable device api
+import threading  # Importing threading to run an event loop next to the Tk mainloop
+import time  # Importing time for the command timestamps
+from collections import deque  # Importing deque for the queue of commands waiting for a reply
+import serial  # Importing the PySerial library for communicating with serial devices
+from serialReader import SerialReader  # Importing the blocking, chunked serial reader thread
+from serialWriter import SerialWriter, jog_line  # Importing the queued serial writer thread
+from binaryTelemetry import FrameSplitter  # Importing the splitter for binary report frames
+from deviceState import DeviceState, CommandRejected  # Importing the mirror of the firmware state
+from telemetry import decode_lines, AdcFrame, PosFrame, LogLine, Record, ESP  # Importing the line decoder
+from instrumentation import metrics  # Importing the process-wide latency metrics
+
+
+# first line logged by logInit() after every boot of the firmware
+BOOT_LINE = "CubeFW compiled at"
+# first and longest pause between two reconnect attempts in seconds
+RECONNECT_DELAY = 0.05
+RECONNECT_MAX_DELAY = 1.0
+
+
+class CommandError(Exception):
+    """The firmware answered a command with an <ERROR> line."""
+
+    def __init__(self, reply):
+        super().__init__(f"{reply.command.strip()}: {reply.error.text}")
+        self.reply = reply
+
+
+class AttachError(Exception):
+    """The running firmware sent no status report (M114), only a restart tells its state."""
+
+
+class SentLine(Record):
+    """A line written to the device, handed to the listeners like received records."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class ConnectionEvent(Record):
+    """Connection change of a device with reconnect, handed to the listeners like received records.
+
+    event is "lost", "reconnected" or "failed" (gave up), elapsed the seconds since the loss.
+    """
+
+    __slots__ = ("event", "reason", "elapsed")
+
+    def __init__(self, event, reason=None, elapsed=0.0):
+        self.event = event
+        self.reason = reason
+        self.elapsed = elapsed
+
+
+class Reply(Record):
+    """Everything the firmware logged while processing one command.
+
+    The *_at fields are time.perf_counter() values of queueing, writing, the first
+    notice and the parser response (None if it did not happen).
+    """
+
+    __slots__ = ("command", "notice", "error", "lines", "queued_at", "written_at", "notice_at", "acked_at")
+
+    def __init__(self, command):
+        self.command = command
+        self.notice = None
+        self.error = None
+        self.lines = []
+        self.queued_at = time.perf_counter()
+        self.written_at = None
+        self.notice_at = None
+        self.acked_at = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class Subscription:
+    """Async iterator over one kind of record with a bounded queue.
+
+    If the consumer falls behind the oldest records are dropped, the reader is never blocked.
+    """
+
+    def __init__(self, device, cls, maxsize=1000):
+        self.device = device
+        self.cls = cls
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, record) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            if metrics.enabled:
+                metrics.count("subscription_dropped")
+        self.queue.put_nowait(record)
+
+    def close(self) -> None:
+        self.device._unsubscribe(self)
+        while self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        record = await self.queue.get()
+        if record is None:
+            raise StopAsyncIteration
+        return record
+
+
+def command_word(line: str) -> str:
+    # "g1 z10 ;move" -> "G1", the same way the firmware strips comments
+    words = line.split(";", 1)[0].split()
+    return words[0].upper() if words else ""
+
+
+def _chain(source, target) -> None:
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    else:
+        target.set_result(source.result())
+
+
+class CubeDevice:
+    def __init__(self, port, baudrate=115200, timeout=5.0, write_timeout=1.0, selector=None, reconnect=0.0):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        self.serial = None
+        self.reader = None
+        self.writer = None
+        self.selector = selector
+        # seconds to try re-attaching after the connection was lost, 0 to give up at once
+        self.reconnect = reconnect
+        self.loop = None
+        self.connected = False
+        # mirror of the firmware flags, updated on the event loop
+        self.state = DeviceState()
+        # last <POS> report, updated on the event loop
+        self.position = None
+        self.framer = None
+
+        # callbacks receiving lists of records, called from the reader thread
+        # (received records), the writer thread (SentLine) or the event loop (ConnectionEvent)
+        self.listeners = []
+
+        self._pending = deque()
+        self._restarting = False
+        # older firmware follows "end auto mode" with an empty "\r" line that is no parser response
+        self._stray_response = False
+        self._booted = None
+        self._closing = False
+        self._reconnect_task = None
+        # report_interval and binary of the last initialize(), restored on a reconnect
+        self._session = {}
+        self._subscriptions = {AdcFrame: [], PosFrame: [], LogLine: []}
+
+    # ------------------------------------------------------------------ connection
+
+    async def connect(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.serial = await self.loop.run_in_executor(None, self._open)
+        self._closing = False
+        self.writer = SerialWriter(self.serial, self._on_sent, self._on_write_failed, self._on_error)
+        self.connected = True
+        self.state.forget()
+        self.framer = FrameSplitter()
+        if self.selector is not None:
+            await self.loop.run_in_executor(
+                None, self.selector.register, self.serial, self._on_lines, self._on_error, self.framer
+            )
+        else:
+            self.reader = SerialReader(self.serial, self._on_lines, self._on_error, framer=self.framer)
+            self.reader.start()
+        self.writer.start()
+
+    def _open(self):
+        # DTR and RTS drive EN and IO0 of ESP32 boards, opening with them asserted resets the firmware
+        port = serial.Serial(None, self.baudrate, timeout=1, write_timeout=self.write_timeout)
+        port.port = self.port
+        port.dtr = False
+        port.rts = False
+        port.open()
+        return port
+
+    async def disconnect(self) -> None:
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        await self._close_port()
+        self._connection_closed("disconnected")
+
+    async def _close_port(self) -> None:
+        if self.reader is not None:
+            self.reader.stop()
+            await self.loop.run_in_executor(None, self.reader.join)
+            self.reader = None
+        if self.selector is not None and self.serial is not None:
+            await self.loop.run_in_executor(None, self.selector.unregister, self.serial)
+        if self.writer is not None:
+            self.writer.stop()
+            await self.loop.run_in_executor(None, self.writer.join, self.write_timeout + 1)
+            self.writer = None
+        if self.serial is not None:
+            await self.loop.run_in_executor(None, self.serial.close)
+            self.serial = None
+
+    async def initialize(self, restart=True, report_interval=500, binary=False) -> None:
+        """Restart or attach to the running firmware, then relative positioning, report interval and format.
+
+        Settings the firmware already has are not sent again.
+        """
+        self._session = {"report_interval": report_interval, "binary": binary}
+        if restart:
+            await self.restart()
+        else:
+            await self.resync()
+        if self.state.relative is not True:
+            await self.set_relative(True)
+        if self.state.interval != report_interval:
+            await self.set_report_interval(report_interval)
+        if self.state.binary != binary:
+            await self.set_binary_reports(binary)
+
+    async def resync(self) -> None:
+        """Read the state of the running firmware, raises AttachError for firmware without M114."""
+        error = None
+        try:
+            await self.status()
+        except (CommandError, asyncio.TimeoutError) as e:
+            error = e
+        if self.state.relative is None:
+            # no status report (or the device booted meanwhile and the boot line set the state)
+            raise AttachError(f"{self.port}: no status report (M114), restart the device") from error
+
+    def add_listener(self, callback) -> None:
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback) -> None:
+        self.listeners.remove(callback)
+
+    @property
+    def relative(self):
+        # positioning mode, None until known
+        return self.state.relative
+
+    @property
+    def binary(self):
+        # report format, None until known
+        return self.state.binary
+
+    # ------------------------------------------------------------------ commands
+
+    async def send(self, line: str, jog=None, queue=False) -> asyncio.Future:
+        """Queue one line and return a future which resolves to its Reply.
+
+        jog is the relative distance in µm of a "G1 Z" line, queued jogs are merged.
+        Lines the firmware would refuse raise CommandRejected, with queue=True they
+        wait up to timeout seconds for homing or touch mode to end. Commands in flight
+        may still change the state, then the line is sent and the firmware decides.
+        """
+        if not self.connected:
+            raise ConnectionError(f"{self.port} is not connected")
+        reason = None if self._pending else self.state.check(line)
+        if reason is not None:
+            if not queue:
+                raise CommandRejected(line, reason)
+            await self.state.wait_allowed(line, self.timeout)
+            # the port may have been lost or closed while waiting
+            if not self.connected or self.writer is None:
+                raise ConnectionError(f"{self.port} is not connected")
+        if not line.endswith("\n"):
+            line += "\n"
+        future = self.loop.create_future()
+        reply = Reply(line)
+        # the writer thread reads the context as soon as the line is written
+        writer = self.writer
+        outbound, merged = writer.put(line, jog, (reply, future))
+        if metrics.enabled:
+            metrics.count("commands_merged" if merged else "commands_queued")
+            metrics.observe("writer_queue", writer.depth, "lines")
+        if merged:
+            # one line, one reply: resolve with the reply of the line this jog was merged into
+            reply, first = outbound.context
+            reply.command = outbound.text
+            first.add_done_callback(lambda done: _chain(done, future))
+            return future
+        if command_word(line) == "M0":
+            # a restart never gets a reply, everything sent after it is lost
+            self._restarting = True
+            self.state.forget()
+            future.set_result(reply)
+        else:
+            self._pending.append((reply, future))
+        if jog is not None:
+            # the writer the jog was queued in, self.writer is gone or replaced after a reconnect
+            future.add_done_callback(lambda done: writer.jog_done())
+        return future
+
+    async def command(self, line: str, timeout=None, queue=False) -> Reply:
+        """Send a line and wait for its reply, raises CommandError on an <ERROR> reply."""
+        future = await self.send(line, queue=queue)
+        reply = await asyncio.wait_for(future, timeout or self.timeout)
+        if reply.error is not None:
+            raise CommandError(reply)
+        return reply
+
+    async def restart(self, timeout=10.0) -> None:
+        # M0 calls ESP.restart(), wait until the firmware logged its first line again
+        self._booted = self.loop.create_future()
+        await self.send("M0 ;restart device")
+        try:
+            await asyncio.wait_for(self._booted, timeout)
+        except asyncio.TimeoutError:
+            # no boot line: stop ignoring the received lines, the commands sent meanwhile are lost
+            self._restarting = False
+            self._fail_pending("no boot line after restart")
+            raise
+        finally:
+            self._booted = None
+
+    async def status(self) -> Reply:
+        # the "-> M114 ..." notice updates self.state
+        return await self.command("M114")
+
+    async def move_z(self, um) -> Reply:
+        return await self.command(f"G1 Z{um}")
+
+    async def jog(self, um) -> Reply:
+        # relative move which may be merged with other queued jogs
+        if self.relative:
+            future = await self.send(jog_line(um), jog=um)
+        else:
+            future = await self.send(jog_line(um))
+        reply = await asyncio.wait_for(future, self.timeout)
+        if reply.error is not None:
+            raise CommandError(reply)
+        return reply
+
+    async def home(self) -> Reply:
+        return await self.command("G28")
+
+    async def set_relative(self, relative=True) -> Reply:
+        reply = await self.command("G91" if relative else "G90")
+        self.state.update(relative=relative)
+        return reply
+
+    async def set_report_interval(self, ms) -> Reply:
+        return await self.command(f"M1 {int(ms)}")
+
+    async def set_binary_reports(self, binary=True) -> Reply:
+        reply = await self.command(f"M105 {int(binary)}")
+        self.state.update(binary=binary)
+        return reply
+
+    async def generator_on(self, ontime, offtime) -> Reply:
+        return await self.command(f"M100 {int(ontime)} {int(offtime)}")
+
+    async def generator_off(self) -> Reply:
+        return await self.command("M101")
+
+    async def touch(self, lower, upper) -> Reply:
+        return await self.command(f"M102 {lower} {upper}")
+
+    async def auto_mode(self, lower, upper, sens) -> Reply:
+        return await self.command(f"M103 {lower} {upper} {int(sens)}")
+
+    async def auto_off(self) -> Reply:
+        return await self.command("M104")
+
+    # ------------------------------------------------------------------ telemetry
+
+    def adc(self, maxsize=1000) -> Subscription:
+        return self._subscribe(AdcFrame, maxsize)
+
+    def positions(self, maxsize=1000) -> Subscription:
+        return self._subscribe(PosFrame, maxsize)
+
+    def logs(self, maxsize=1000) -> Subscription:
+        return self._subscribe(LogLine, maxsize)
+
+    def _subscribe(self, cls, maxsize) -> Subscription:
+        subscription = Subscription(self, cls, maxsize)
+        self._subscriptions[cls].append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription) -> None:
+        subscriptions = self._subscriptions[subscription.cls]
+        if subscription in subscriptions:
+            subscriptions.remove(subscription)
+
+    # ------------------------------------------------------------------ reader side
+
+    def _on_lines(self, lines) -> None:
+        # reader thread: decode once, hand the records to the listeners and the event loop
+        if metrics.enabled:
+            started = time.perf_counter()
+            records = decode_lines(lines)
+            metrics.observe("decode_us_per_chunk", (time.perf_counter() - started) * 1e6, "µs")
+            metrics.count("lines_received", len(lines))
+            metrics.count(
+                "lines_undecodable", sum(1 for record in records if type(record) is LogLine and record.level is None)
+            )
+        else:
+            records = decode_lines(lines)
+        for callback in self.listeners:
+            callback(records)
+        self.loop.call_soon_threadsafe(self._dispatch, records)
+
+    def _on_sent(self, outbound) -> None:
+        # writer thread
+        reply = outbound.context[0]
+        reply.written_at = time.perf_counter()
+        if metrics.enabled:
+            metrics.observe("command_write_ms", (reply.written_at - reply.queued_at) * 1000)
+        records = [SentLine(outbound.text)]
+        for callback in self.listeners:
+            callback(records)
+
+    def _on_write_failed(self, outbound, error) -> None:
+        self.loop.call_soon_threadsafe(self._write_failed, outbound, error)
+
+    def _write_failed(self, outbound, error) -> None:
+        # the line never made it to the device, so there will be no reply for it
+        reply, future = outbound.context
+        for entry in self._pending:
+            if entry[0] is reply:
+                self._pending.remove(entry)
+                break
+        reply.error = LogLine("ERROR", f"write timeout: {error}")
+        if not future.done():
+            future.set_result(reply)
+
+    def _on_error(self, error) -> None:
+        self.loop.call_soon_threadsafe(self._lost, f"connection lost: {error}")
+
+    def _lost(self, reason) -> None:
+        # reader or writer failed, both may report the same loss
+        if self._closing or not self.connected:
+            return
+        self._connection_closed(reason, final=not self.reconnect)
+        if self.reconnect and (self._reconnect_task is None or self._reconnect_task.done()):
+            self._reconnect_task = self.loop.create_task(self._reconnect(reason))
+
+    async def _reconnect(self, reason) -> None:
+        lost = time.monotonic()
+        self._notify(ConnectionEvent("lost", reason))
+        await self._close_port()
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                await self.connect()
+                await self.initialize(restart=False, **self._session)
+            except (OSError, ConnectionError, CommandError, AttachError, asyncio.TimeoutError) as e:
+                reason = f"{type(e).__name__}: {e}"
+                await self._close_port()
+                self._connection_closed(reason, final=False)
+                if time.monotonic() - lost + delay > self.reconnect:
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            self._notify(ConnectionEvent("reconnected", elapsed=time.monotonic() - lost))
+            return
+        self._close_subscriptions()
+        self._notify(ConnectionEvent("failed", reason, time.monotonic() - lost))
+
+    def _notify(self, record) -> None:
+        records = [record]
+        for callback in self.listeners:
+            callback(records)
+
+    def _dispatch(self, records) -> None:
+        subscriptions = self._subscriptions
+        state = self.state
+        for record in records:
+            cls = type(record)
+            if cls is LogLine:
+                self._handle_log(record)
+            elif cls is PosFrame:
+                self.position = record
+                if record.homed != state.homed and not self._restarting:
+                    state.update(homed=record.homed)
+            for subscription in subscriptions[cls]:
+                subscription.put(record)
+
+    def _handle_log(self, line) -> None:
+        if line.level == "TRACE" and line.text.startswith(BOOT_LINE):
+            # also after a reset nobody asked for (reset button, brownout)
+            self._restarting = False
+            self._stray_response = False
+            self.state.booted()
+            self._fail_pending("lost by device restart")
+            if self._booted is not None and not self._booted.done():
+                self._booted.set_result(line)
+            return
+        if self._restarting:
+            # ignore the boot rom output until the firmware is up again
+            return
+        self.state.apply_log(line)
+        if line.level is None and line.text == "end auto mode":
+            self._stray_response = True
+        elif line.level == ESP and self._stray_response and not line.text:
+            self._stray_response = False
+            return
+        if not self._pending:
+            return
+        reply, future = self._pending[0]
+        if line.level == ESP:
+            # println() of the command parser, this command is finished
+            self._pending.popleft()
+            reply.acked_at = time.perf_counter()
+            if "parse" in line.text and reply.error is None:
+                reply.error = LogLine("ERROR", line.text)
+            if metrics.enabled:
+                self._observe_reply(reply)
+            if not future.done():
+                future.set_result(reply)
+            return
+        reply.lines.append(line)
+        if line.is_error:
+            if reply.error is None:
+                reply.error = line
+        elif reply.notice is None and line.text.startswith("-> "):
+            reply.notice = line
+            reply.notice_at = time.perf_counter()
+
+    def _observe_reply(self, reply) -> None:
+        # send to notice ("-> G28") and send to parser response per command word
+        word = command_word(reply.command)
+        metrics.count("commands_acked")
+        if reply.error is not None:
+            metrics.count("commands_failed")
+        if reply.notice_at is not None:
+            metrics.observe(f"notice_ms.{word}", (reply.notice_at - reply.queued_at) * 1000)
+        metrics.observe(f"ack_ms.{word}", (reply.acked_at - reply.queued_at) * 1000)
+
+    def _fail_pending(self, reason) -> None:
+        while self._pending:
+            reply, future = self._pending.popleft()
+            reply.error = LogLine("ERROR", reason)
+            if not future.done():
+                future.set_result(reply)
+
+    def _connection_closed(self, reason, final=True) -> None:
+        # final: no reconnect follows, the subscribers are told the stream ended
+        self.connected = False
+        self._restarting = False
+        self._stray_response = False
+        self._fail_pending(reason)
+        self.state.forget()
+        self.state.cancel_waiters(ConnectionError(reason))
+        if self._booted is not None and not self._booted.done():
+            self._booted.set_exception(ConnectionError(reason))
+        if final:
+            self._close_subscriptions()
+
+    def _close_subscriptions(self) -> None:
+        for subscriptions in self._subscriptions.values():
+            for subscription in list(subscriptions):
+                subscription.close()
+
+
+class LoopThread(threading.Thread):
+    """Runs an asyncio event loop in a daemon thread for synchronous callers like the Tk gui."""
+
+    def __init__(self):
+        super().__init__(name="CubeLoop", daemon=True)
+        self.loop = asyncio.new_event_loop()
+
+    def run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        # returns a concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join()
@@ -0,0 +1,198 @@
+"""Headless G-code job runner for CUBEcontrol
+Runs G-code programs on one machine without the gui. Only the device core is
+imported (no Tk, sv_ttk, numpy or theme assets), so it starts in a fraction of a
+second on headless boxes, e.g. from cron or the MES:
+
+    python cubeJob.py /dev/ttyUSB0 electrode.gcode finish.gcode
+    generate_job | python cubeJob.py /dev/ttyUSB0 - --lines --telemetry
+
+The machine is attached without a restart unless --restart is given (M0, loses
+homing), firmware without M114 can't be attached and needs --restart. Every file ("-" or no file for stdin) is streamed with programStreamer.py.
+Output goes to stdout as one JSON object per line:
+
+    {"type": "connected", "port": "/dev/ttyUSB0", "restart": false, "ms": 112.4, "state": {...}}
+    {"type": "line", "file": "job.gcode", "line": 12, "text": "G1 Z-100", "ok": true, "ack_ms": 14.2, ...}
+    {"type": "adc", "t": 1718000000.123, "raw": 1543, "volts": 11.91}
+    {"type": "program", "file": "job.gcode", "state": "done", "lines": 40, "errors": 0, "elapsed_s": 3.1, ...}
+    {"type": "error", "file": "job.gcode", "line": 13, "text": "G1 X1", "error": "Only Z-Axis is supported!"}
+    {"type": "summary", "status": "ok", "programs": 1, "lines": 40, "errors": 0, "elapsed_s": 3.4}
+
+"line" records are written with --lines, telemetry (adc, pos, log, sent, see
+telemetryServer.py) with --telemetry.
+
+Exit codes: 0 all lines ok, 1 <ERROR> replies of the firmware, 2 invalid programs
+or arguments, 3 connection lost or timed out, 130 interrupted.
+"""
+import argparse  # Importing argparse for the command line interface
+import asyncio  # Importing asyncio for the awaitable device api
+import json  # Importing json for the output lines
+import os  # Importing the OS module to silence a closed stdout
+import sys  # Importing sys for stdin and stdout
+import threading  # Importing threading to serialize the output of the reader thread and the loop
+import time  # Importing time for the timings
+from cubeDevice import CubeDevice, CommandError, AttachError  # Importing the headless device core
+from deviceState import BOOT_STATE  # Importing the mirror of the firmware state
+from programStreamer import ProgramStreamer, parse_program, DEFAULT_WINDOW  # Importing the program streamer
+from telemetryServer import encode_records  # Importing the JSON encoding of the telemetry
+
+EXIT_OK = 0
+EXIT_ERRORS = 1
+EXIT_USAGE = 2
+EXIT_CONNECTION = 3
+
+
+class Output:
+    """JSON lines on a binary stream, written from the event loop and the reader thread.
+
+    The job goes on when the reader of the stream went away (e.g. "| head").
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def emit(self, message) -> None:
+        self.write((json.dumps(message) + "\n").encode("utf-8"))
+
+    def write(self, data) -> None:
+        if not data:
+            return
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.stream.write(data)
+                self.stream.flush()
+            except BrokenPipeError:
+                self.closed = True
+                # keep the interpreter from flushing into the closed pipe at exit
+                os.dup2(os.open(os.devnull, os.O_WRONLY), self.stream.fileno())
+
+
+def load_programs(paths) -> list:
+    """(name, program) per path, "-" reads stdin. Raises ValueError with the file name."""
+    programs = []
+    for path in paths or ["-"]:
+        try:
+            if path == "-":
+                source = sys.stdin.read()
+            else:
+                with open(path, encoding="utf-8") as f:
+                    source = f.read()
+            programs.append((path, parse_program(source)))
+        except (OSError, ValueError) as e:
+            raise ValueError(f"{path}: {e}") from e
+    return programs
+
+
+def line_message(name, line, reply) -> dict:
+    message = {"type": "line", "file": name, "line": line.number, "text": line.text, "ok": reply.error is None}
+    if reply.notice is not None:
+        message["notice"] = reply.notice.text
+    if reply.error is not None:
+        message["error"] = reply.error.text
+    if reply.written_at is not None:
+        message["write_ms"] = round((reply.written_at - reply.queued_at) * 1000, 2)
+    if reply.acked_at is not None:
+        message["ack_ms"] = round((reply.acked_at - reply.queued_at) * 1000, 2)
+    return message
+
+
+async def run_job(args, programs, out) -> int:
+    device = CubeDevice(args.port, timeout=args.timeout)
+    if args.telemetry:
+        device.add_listener(lambda records: out.write(encode_records(records, time.time())))
+    started = time.perf_counter()
+    await device.connect()
+    try:
+        await device.initialize(restart=args.restart, report_interval=args.interval, binary=args.binary)
+        state = device.state
+        out.emit(
+            {
+                "type": "connected",
+                "port": args.port,
+                "restart": args.restart,
+                "ms": round((time.perf_counter() - started) * 1000, 1),
+                "state": {name: getattr(state, name) for name in BOOT_STATE},
+            }
+        )
+        lines = errors = 0
+        status = "ok"
+        for name, program in programs:
+            streamer = ProgramStreamer(device, program, window=args.window, stop_on_error=not args.keep_going)
+            if args.lines:
+                streamer.listeners.append(lambda line, reply, name=name: out.emit(line_message(name, line, reply)))
+            program_started = time.perf_counter()
+            result = await streamer.run()
+            elapsed = round(time.perf_counter() - program_started, 3)
+            out.emit({"type": "program", "file": name, **result, "elapsed_s": elapsed})
+            lines += result["done"]
+            errors += result["errors"]
+            if streamer.first_error is not None:
+                line, error = streamer.first_error
+                out.emit({"type": "error", "file": name, "line": line.number, "text": line.text, "error": error.text})
+            if result["state"] != "done":
+                status = "failed"
+                if not args.keep_going:
+                    break
+    finally:
+        await device.disconnect()
+    out.emit(
+        {
+            "type": "summary",
+            "status": status,
+            "programs": len(programs),
+            "lines": lines,
+            "errors": errors,
+            "elapsed_s": round(time.perf_counter() - started, 3),
+        }
+    )
+    return EXIT_ERRORS if errors or status != "ok" else EXIT_OK
+
+
+async def run_limited(args, programs, out) -> int:
+    if args.max_seconds is None:
+        return await run_job(args, programs, out)
+    return await asyncio.wait_for(run_job(args, programs, out), args.max_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("port", help="serial port of the machine")
+    parser.add_argument("programs", nargs="*", help='G-code files, "-" or none for stdin')
+    parser.add_argument("--restart", action="store_true", help="restart the firmware (M0) before the job")
+    parser.add_argument("--interval", type=int, default=500, help="report interval in ms (default 500)")
+    parser.add_argument("--binary", action="store_true", help="binary ADC/POS reports (M105)")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="unanswered bytes in flight")
+    parser.add_argument("--keep-going", action="store_true", help="don't stop at the first <ERROR> reply")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds to wait for the reply of a line")
+    parser.add_argument("--max-seconds", type=float, help="limit of the whole job")
+    parser.add_argument("--lines", action="store_true", help="write a record for every answered line")
+    parser.add_argument("--telemetry", action="store_true", help="write the ADC/POS reports and the log")
+    args = parser.parse_args()
+
+    out = Output(sys.stdout.buffer)
+    try:
+        programs = load_programs(args.programs)
+    except ValueError as e:
+        out.emit({"type": "summary", "status": "invalid", "error": str(e)})
+        raise SystemExit(EXIT_USAGE)
+    try:
+        raise SystemExit(asyncio.run(run_limited(args, programs, out)))
+    except asyncio.TimeoutError:
+        # --max-seconds, or a line the firmware never answered
+        out.emit({"type": "summary", "status": "timeout"})
+        raise SystemExit(EXIT_CONNECTION)
+    except (OSError, ConnectionError, CommandError, AttachError) as e:
+        # serial.SerialException is an OSError, a CommandError here is a failed initialize(),
+        # an AttachError firmware without M114 that needs --restart
+        out.emit({"type": "summary", "status": "connection", "error": f"{type(e).__name__}: {e}"})
+        raise SystemExit(EXIT_CONNECTION)
+    except KeyboardInterrupt:
+        out.emit({"type": "summary", "status": "interrupted"})
+        raise SystemExit(130)
+
+
+if __name__ == "__main__":
+    main()
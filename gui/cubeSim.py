@@ -0,0 +1,737 @@
+"""Virtual CUBE firmware
+Opens a pseudo-terminal and speaks the serial protocol of src/serialParser.cpp so
+CUBEcontrol can be load tested and benchmarked without an ESP32 (Linux only).
+
+    python -m cubeSim --rate 1000 --noise 0.01 --link /tmp/ttyCUBE
+    python cubeControl.py --ports "/tmp/ttyCUBE*"
+
+Like the firmware the simulator handles one received line per parser tick (100ms),
+answers every line with a "\\r\\n" terminated response and logs with the level
+prefixes of printLogLevel(). <ADC> and <POS> reports are sent every M1 interval,
+or at --rate Hz, as binary frames after "M105 1". Movement, homing, touch and auto
+mode are simulated against a virtual workpiece surface.
+"""
+import argparse  # Importing argparse for the command line interface
+import os  # Importing the OS module for the pseudo-terminal file descriptors
+import pty  # Importing pty to create the pseudo-terminal pair
+import random  # Importing random for the adc noise and the injected garbage
+import select  # Importing select to wait for input with a timeout
+import signal  # Importing signal to clean up when terminated
+import sys  # Importing sys to exit on SIGTERM
+import threading  # Importing threading to run the simulator next to a benchmark
+import time  # Importing time for the simulated clock
+import tty  # Importing tty to put the pseudo-terminal into raw mode
+from binaryTelemetry import encode_adc, encode_pos  # Importing the binary report frames of M105
+
+# constants from include/movement.h, include/pinDefs.h and src/funcGen.cpp
+ENCODER_STEPS_PER_MM = 4000
+STEPPER_SPEED_DEFAULT = 1.5
+STEPPER_LEN_LINEAR_AXIS = 25
+PIN_Z_MIN_DEC = 26
+VOLTAGE_DIVIDER_FACTOR = 31.57
+ADC_VREF = 5.0
+ADC_NUM_BITS = 12
+MIN_WIDTH_NS = 62
+ERROR_RATIO = 0.1
+# CommandParser<24> of src/serialParser.cpp, registerCommand() fails beyond it
+COMMAND_LIMIT = 24
+
+# size of the esp32 uart rx buffer, bytes beyond it are lost like on the real device
+RX_BUFFER_SIZE = 256
+BOOT_MESSAGE = (
+    b"ets Jun  8 2016 00:22:57\r\n\r\n"
+    b"rst:0xc (SW_CPU_RESET),boot:0x13 (SPI_FAST_FLASH_BOOT)\r\n"
+    b"entry 0x400805e4\r\n"
+)
+
+
+def calc_voltage(raw) -> float:
+    # calcVoltage() from adc.h
+    return VOLTAGE_DIVIDER_FACTOR * (max(raw, 0) >> 4) * (ADC_VREF / ((1 << ADC_NUM_BITS) - 1))
+
+
+def calc_adc_input_voltage(voltage) -> int:
+    # calcADCInputVoltage() from adc.h
+    return int((voltage / VOLTAGE_DIVIDER_FACTOR) / (ADC_VREF / ((1 << ADC_NUM_BITS) - 1)) * (1 << 4))
+
+
+class CubeSimulator:
+    """Simulated CUBE firmware on the master side of a pseudo-terminal.
+
+    rate overrides the report interval of M1 with a fixed report rate in Hz, noise and
+    invalid_utf8 are the probabilities per report to inject a garbage line or a line
+    with invalid UTF-8. baud limits the output like the real uart (0 = unlimited).
+    Only the first command_limit commands are registered like in registerCommands(),
+    the others are answered with a parse error.
+    """
+
+    def __init__(
+        self,
+        report_interval=1000,
+        rate=None,
+        parser_tick=0.1,
+        noise=0.0,
+        invalid_utf8=0.0,
+        baud=0,
+        speed=STEPPER_SPEED_DEFAULT,
+        surface=12.0,
+        open_voltage=45.0,
+        spark_gap=0.01,
+        erosion_rate=0.002,
+        seed=None,
+        command_limit=COMMAND_LIMIT,
+    ):
+        self.parser_tick = parser_tick
+        self.noise = noise
+        self.invalid_utf8 = invalid_utf8
+        self.baud = baud
+        self.speed = speed
+        self.surface = surface
+        self.open_voltage = open_voltage
+        self.spark_gap = spark_gap
+        self.erosion_rate = erosion_rate
+        self.rate = rate
+        self.default_interval = report_interval
+        self.random = random.Random(seed)
+        self.command_limit = command_limit
+        self.registered = {}
+
+        self.master = None
+        self.slave = None
+        self.link = None
+        self.thread = None
+        self._stop_event = threading.Event()
+
+        # statistics
+        self.lines_received = 0
+        self.reports_sent = 0
+        self.rx_overruns = 0
+        self.tx_dropped = 0
+
+        self.reset_state()
+        # boot() registers them again and logs the failures, start(boot=False) keeps these
+        self.register_commands()
+
+    # ------------------------------------------------------------------ pty handling
+
+    def open(self, link=None) -> str:
+        """Create the pseudo-terminal and return the path of its slave side."""
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        path = os.ttyname(self.slave)
+        if link is not None:
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(path, link)
+            self.link = link
+        return link or path
+
+    def close(self) -> None:
+        if self.link is not None and os.path.lexists(self.link):
+            os.remove(self.link)
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+    def start(self, link=None, boot=True) -> str:
+        """Open the pty and run the simulator in a background thread."""
+        path = self.open(link)
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self.run, args=(boot,), name="CubeSimulator", daemon=True)
+        self.thread.start()
+        return path
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.close()
+
+    def replug(self, downtime=0.0) -> str:
+        """Close the pty and open a new one at the same link like a USB glitch, without a reboot."""
+        link = self.link
+        self.stop()
+        time.sleep(downtime)
+        return self.start(link, boot=False)
+
+    # ------------------------------------------------------------------ firmware state
+
+    def reset_state(self) -> None:
+        now = time.monotonic()
+        self.homing_flag = False
+        self.homing_started = False
+        self.homed = False
+        self.relative = True
+        self.steps = 0.0
+        self.target_steps = 0
+        self.move_started = False
+        self.stepper_enabled = True
+        self.generator_active = False
+        self.f1 = self.f2 = False
+        self.auto_mode = False
+        self.touch_mode = None
+        self.threshold_l = calc_adc_input_voltage(5)
+        self.threshold_h = calc_adc_input_voltage(30)
+        self.auto_sens = 10
+        self.adc_interval = self.pos_interval = self.default_interval
+        self.binary = False
+        self.adc_seq = self.pos_seq = 0
+        self.rx = bytearray()
+        self.tx = bytearray()
+        self.next_parse = now
+        self.next_auto = now
+        self.last_update = now
+        self.last_flush = now
+        self.next_adc = self.next_pos = now
+        self.tx_credit = 0.0
+        self.booting_until = 0.0
+
+    def boot(self) -> None:
+        self.reset_state()
+        self.write(BOOT_MESSAGE)
+        self.log("TRACE", f"CubeFW compiled at {time.strftime('%b %d %Y %H:%M:%S')}")
+        self.register_commands()
+        self.log("TRACE", "serialParserTask started on core 1...")
+        self.log("INFO", "stepper Initialized")
+        self.log("TRACE", "movementTask started on core 1...")
+        self.log("TRACE", "adcTask started on core 0 ...")
+        self.log("INFO", f"ADC started... {calc_voltage(self.adc_raw()):.2f}")
+
+    @property
+    def steps_int(self) -> int:
+        return int(round(self.steps))
+
+    @property
+    def pos_mm(self) -> float:
+        return self.steps / ENCODER_STEPS_PER_MM
+
+    def gap_voltage(self) -> float:
+        if not (self.generator_active or (self.f1 and self.f2)):
+            voltage = 0.3
+        else:
+            gap = self.surface - self.pos_mm
+            if gap <= 0:
+                voltage = 1.0  # short circuit
+            elif gap < self.spark_gap:
+                voltage = 18.0  # discharge
+            else:
+                voltage = self.open_voltage
+        return max(0.0, voltage + self.random.gauss(0, 0.3))
+
+    def adc_raw(self) -> int:
+        return calc_adc_input_voltage(self.gap_voltage())
+
+    # ------------------------------------------------------------------ output
+
+    def write(self, data) -> None:
+        self.tx += data
+
+    def log(self, level, text) -> None:
+        # Log.xxx() with printPrefix() and "\n" from the format string
+        self.write(f"<{level}> {text}\n".encode())
+
+    def flush(self, now) -> None:
+        if not self.tx or self.master is None:
+            return
+        size = len(self.tx)
+        if self.baud:
+            # 10 bit per byte on the uart
+            self.tx_credit = min(self.tx_credit + (now - self.last_flush) * self.baud / 10, self.baud / 10)
+            size = min(size, int(self.tx_credit))
+        self.last_flush = now
+        if size <= 0:
+            return
+        try:
+            written = os.write(self.master, self.tx[:size])
+        except BlockingIOError:
+            written = 0
+        except OSError:
+            # slave side closed, nobody is listening
+            written = len(self.tx)
+        del self.tx[:written]
+        self.tx_credit -= written
+        if len(self.tx) > 1 << 20:
+            # nobody reads the port: drop like an uart without flow control
+            self.tx_dropped += len(self.tx)
+            self.tx.clear()
+
+    # ------------------------------------------------------------------ main loop
+
+    def run(self, boot=True) -> None:
+        if boot:
+            self.boot()
+        else:
+            # clocks of a running firmware, nothing received or sent while unplugged survives
+            self.rx.clear()
+            self.tx.clear()
+            self.last_update = self.last_flush = time.monotonic()
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            self.receive()
+            if now >= self.booting_until:
+                self.parse(now)
+                self.update_motion(now)
+                self.report(now)
+            self.flush(now)
+            timeout = max(0.0, min(self.next_parse, self.next_adc, self.next_pos, now + 0.01) - time.monotonic())
+            if self.tx:
+                timeout = min(timeout, 0.001)
+            try:
+                select.select([self.master], [], [], timeout)
+            except (OSError, ValueError):
+                break
+
+    def receive(self) -> None:
+        try:
+            data = os.read(self.master, 4096)
+        except (BlockingIOError, OSError):
+            return
+        free = RX_BUFFER_SIZE - len(self.rx)
+        if len(data) > free:
+            self.rx_overruns += len(data) - free
+            data = data[:free]
+        self.rx += data
+
+    def parse(self, now) -> None:
+        # serialParserTask: one line per tick
+        if now < self.next_parse:
+            return
+        self.next_parse = now + self.parser_tick
+        end = self.rx.find(b"\n")
+        if end < 0:
+            if len(self.rx) < 127:
+                return
+            end = 127
+        line = bytes(self.rx[:end])
+        del self.rx[: end + 1 if end < len(self.rx) and self.rx[end] == 0x0A else end]
+        self.lines_received += 1
+        self.process_command(line.decode(errors="replace").split(";", 1)[0])
+
+    def process_command(self, line) -> None:
+        words = line.split()
+        name = words[0].upper() if words else ""
+        handler = self.registered.get(name)
+        if handler is None:
+            response = "parse error: unknown command name" if words else "parse error: empty command"
+        else:
+            args = words[1:]
+            try:
+                response = handler(self, *args) or ""
+            except (TypeError, ValueError, IndexError):
+                response = "parse error: invalid arguments"
+        if name == "M0":
+            return
+        # Serial.println(response)
+        self.write(response.encode() + b"\r\n")
+
+    # ------------------------------------------------------------------ commands
+
+    def register_commands(self) -> None:
+        # registerCommands() in the order of the commands dict
+        self.registered = {}
+        for name, handler in self.commands.items():
+            if len(self.registered) >= self.command_limit:
+                self.log("ERROR", f"Can't register command {name} (limit: {self.command_limit} commands)")
+                continue
+            self.registered[name] = handler
+
+    def _check_homing(self) -> bool:
+        if self.homing_flag:
+            self.log("ERROR", "Can't do this during homing...")
+            return False
+        return True
+
+    def cmd_G1(self, arg):
+        self.log("INFO", f"-> G1 {arg}")
+        if arg[:1].upper() != "Z":
+            self.log("ERROR", "Only Z-Axis is supported!")
+            return
+        coord = float(arg[1:] or 0)
+        self.log("INFO", f"Read Parameter: {coord:.2f}")
+        new_steps = int(coord * (ENCODER_STEPS_PER_MM / 1000.0))
+        if self.relative:
+            new_steps += self.target_steps
+        if new_steps < 0:
+            self.log("ERROR", "Target position can't be negative!")
+            return
+        self.log("INFO", f"New target steps: {new_steps}")
+        self.target_steps = new_steps
+
+    def cmd_G28(self):
+        self.log("INFO", "-> G28")
+        self.homing_flag = True
+        self.homing_started = False
+
+    def cmd_G90(self):
+        if self._check_homing():
+            self.log("INFO", "-> G90 enable absolute Positioning")
+            self.relative = False
+
+    def cmd_G91(self):
+        if self._check_homing():
+            self.log("INFO", "-> G91 enable relative Positioning")
+            self.relative = True
+
+    def cmd_M0(self):
+        self.log("INFO", "Reset....")
+        self.boot()
+        self.booting_until = time.monotonic() + 0.3
+
+    def cmd_M1(self, value):
+        interval = int(value)
+        self.log("INFO", f"Set new report interval to {interval}ms")
+        self.adc_interval = self.pos_interval = interval
+        self.rate = None
+
+    def cmd_M17(self):
+        self.log("INFO", "-> M17 enable Stepper")
+        self.stepper_enabled = True
+
+    def cmd_M18(self):
+        self.log("INFO", "-> M18 disable Stepper")
+        self.stepper_enabled = False
+
+    def cmd_M20(self, value):
+        self.f1 = bool(int(value))
+        self.log("INFO", f"-> M20 set Mosfet T1: {'on' if self.f1 else 'off'}")
+
+    def cmd_M21(self, value):
+        self.f2 = bool(int(value))
+        self.log("INFO", f"-> M21 set Mosfet T2: {'on' if self.f2 else 'off'}")
+
+    def cmd_M100(self, ontime, offtime):
+        if not self._check_homing():
+            return
+        self.set_func(int(ontime), int(offtime))
+
+    def cmd_M101(self):
+        if not self._check_homing():
+            return
+        if self.auto_mode:
+            self.log("ERROR", "Can't do this during auto mode...")
+            return
+        self.log("INFO", "-> M101 set PWM off")
+        self.set_output_off()
+
+    def cmd_M102(self, lower, upper):
+        if not self._check_homing():
+            return
+        if self.auto_mode:
+            self.log("ERROR", "Can't do this during auto mode...")
+            return
+        lower, upper = float(lower), float(upper)
+        self.log("INFO", f"-> M102 touch mode with upper: {upper:.2f}, lower: {lower:.2f}")
+        self.set_output_off()
+        self.f1 = self.f2 = True
+        # delay(1000) blocks the parser task
+        self.next_parse += 1.0
+        self.threshold_l = calc_adc_input_voltage(lower)
+        self.threshold_h = calc_adc_input_voltage(upper)
+        if self.adc_raw() <= self.threshold_l:
+            self.log("ERROR", "Can't do touch mode: ADC Voltage too low!")
+            self.f1 = self.f2 = False
+            return
+        self.touch_mode = "down"
+        self.log("INFO", "start drive towards touch")
+
+    def cmd_M103(self, lower, upper, sens):
+        if not self._check_homing():
+            return
+        if self.touch_mode:
+            self.log("ERROR", "Can't do this during touch mode...")
+            return
+        if not self.generator_active:
+            self.log("ERROR", "Generator must be active for auto Mode...")
+            return
+        lower, upper = float(lower), float(upper)
+        self.auto_sens = int(sens)
+        self.log("INFO", f"-> M103 start auto mode with upper: {upper:.2f}, lower: {lower:.2f}, sens: {self.auto_sens}")
+        self.threshold_l = calc_adc_input_voltage(lower)
+        self.threshold_h = calc_adc_input_voltage(upper)
+        self.next_parse += 0.1
+        self.auto_mode = True
+        self.log("INFO", "start auto Mode")
+
+    def cmd_M104(self):
+        if not self._check_homing():
+            return
+        if self.touch_mode:
+            self.log("ERROR", "Can't do this during touch mode...")
+            return
+        self.log("INFO", "-> M103 stop auto mode :...")
+        if self.auto_mode:
+            self.auto_mode = False
+            self.target_steps = self.steps_int
+            self.log("INFO", "end auto mode")
+
+    def cmd_M105(self, value):
+        self.binary = bool(int(value))
+        self.log("INFO", f"-> M105 binary reports {'on' if self.binary else 'off'}")
+
+    def cmd_M114(self):
+        self.log(
+            "INFO",
+            f"-> M114 homing:{int(self.homing_flag)} homed:{int(self.homed)} touch:{int(bool(self.touch_mode))} "
+            f"auto:{int(self.auto_mode)} generator:{int(self.generator_active)} relative:{int(self.relative)} "
+            f"binary:{int(self.binary)} steps:{self.steps_int} target:{self.target_steps} interval:{self.pos_interval}",
+        )
+
+    def cmd_M410(self):
+        if not self._check_homing():
+            return
+        self.log("INFO", f"-> M410 stop at steps: {self.steps_int}")
+        self.target_steps = self.steps_int
+
+    commands = {
+        "G0": cmd_G1,
+        "G1": cmd_G1,
+        "G28": cmd_G28,
+        "G90": cmd_G90,
+        "G91": cmd_G91,
+        "M0": cmd_M0,
+        "M1": cmd_M1,
+        "M17": cmd_M17,
+        "M18": cmd_M18,
+        "M20": cmd_M20,
+        "M21": cmd_M21,
+        "M100": cmd_M100,
+        "M101": cmd_M101,
+        "M102": cmd_M102,
+        "M103": cmd_M103,
+        "M104": cmd_M104,
+        "M105": cmd_M105,
+        "M114": cmd_M114,
+        "M410": cmd_M410,
+    }
+
+    # ------------------------------------------------------------------ function generator
+
+    def set_output_off(self) -> None:
+        self.log("INFO", "stopping output")
+        self.generator_active = False
+        self.f1 = self.f2 = False
+
+    def set_func(self, ontime, offtime) -> bool:
+        # setFunc() from funcGen.cpp
+        if ontime >= 1000 and offtime >= 1000:
+            self.log("INFO", f"set ontime: {ontime / 1000.0:.2f}µs offtime: {offtime / 1000.0:.2f}µs")
+        else:
+            self.log("INFO", f"set ontime: {ontime}ns offtime: {offtime}ns")
+        if ontime == 0:
+            self.write(b"<WARNING> ontime is 0 -> set output off \n")
+            self.set_output_off()
+            return True
+        if offtime == 0:
+            self.write(b"<WARNING> offtime is 0 -> set output on \n")
+            self.set_output_off()
+            return True
+        if ontime < MIN_WIDTH_NS or offtime < MIN_WIDTH_NS:
+            self.log("ERROR", f"ontime and offtime must not be < {MIN_WIDTH_NS}!")
+            return False
+        for width in (ontime, offtime):
+            if (width - (width // MIN_WIDTH_NS) * MIN_WIDTH_NS) / width > ERROR_RATIO:
+                self.log("ERROR", "expected pulse length error to high!")
+                return False
+        freq = 1000000000 // (ontime + offtime)
+        if freq <= 80000:
+            bitres = 10
+        elif freq <= 300000:
+            bitres = 8
+        elif freq < 1200000:
+            bitres = 6
+        elif freq < 5000000:
+            bitres = 4
+        elif ontime == offtime:
+            bitres = 1
+        else:
+            self.log("ERROR", "requested frequency too high!")
+            bitres = 0
+        duty = int(ontime * 2**bitres / (ontime + offtime))
+        if duty == 0:
+            self.log("ERROR", "dutycycle must not be 0!")
+            return False
+        self.log("INFO", f"freq: {freq}hz bitres {bitres} duty: {duty}")
+        self.generator_active = True
+        return True
+
+    # ------------------------------------------------------------------ movement task
+
+    def update_motion(self, now) -> None:
+        dt = now - self.last_update
+        self.last_update = now
+        step_rate = self.speed * ENCODER_STEPS_PER_MM
+
+        if self.homing_flag:
+            self.update_homing(dt * step_rate)
+            return
+        if self.touch_mode:
+            self.update_touch(dt * step_rate)
+            return
+        if self.auto_mode:
+            self.update_auto(now)
+            return
+        if not self.stepper_enabled:
+            return
+
+        remaining = self.target_steps - self.steps
+        if abs(remaining) < 0.5:
+            if self.move_started:
+                self.steps = float(self.target_steps)
+                coords = round(self.steps_int * 1000.0 / ENCODER_STEPS_PER_MM)
+                self.log("INFO", f"move finished curr: {self.steps_int}, tar: {self.target_steps} ({coords})")
+                self.move_started = False
+            return
+        if not self.move_started:
+            if abs(remaining) < ENCODER_STEPS_PER_MM:
+                self.log("INFO", "move using slower speeds")
+            else:
+                self.log("INFO", "move using faster speeds")
+            self.log("INFO", f"move started curr: {self.steps_int}, tar: {self.target_steps} steps:{int(remaining)}")
+            self.move_started = True
+        if abs(remaining) < ENCODER_STEPS_PER_MM:
+            step_rate /= 3.0
+        self.steps += max(-dt * step_rate, min(dt * step_rate, remaining))
+        if self.pos_mm > STEPPER_LEN_LINEAR_AXIS:
+            self.log("ERROR", "Movement canceld because max endstop was triggered!")
+            self.steps = self.target_steps = STEPPER_LEN_LINEAR_AXIS * ENCODER_STEPS_PER_MM
+
+    def update_homing(self, distance) -> None:
+        if not self.homing_started:
+            self.log("INFO", "homing to min ...")
+            self.log("INFO", "moving towards switch...")
+            self.homing_started = True
+        self.steps = max(0.0, self.steps - distance)
+        if self.steps > 0:
+            return
+        self.log("INFO", f"endstop {PIN_Z_MIN_DEC} triggered min:1, max:0")
+        self.log("INFO", "set new pos: 0.00")
+        self.log("INFO", "homing complete")
+        self.log("INFO", "encoder set to 0")
+        self.homed = True
+        self.homing_flag = False
+        self.target_steps = 0
+        self.move_started = False
+
+    def update_touch(self, distance) -> None:
+        raw = self.adc_raw()
+        if self.touch_mode == "down":
+            if raw > self.threshold_l:
+                self.steps += distance
+                return
+            self.log("TRACE", "Touch activated: Stopping movement")
+            self.log("TRACE", "move back...")
+            self.touch_mode = "back"
+        elif raw < self.threshold_l:
+            self.steps -= distance
+        else:
+            self.target_steps = self.steps_int
+            self.log("TRACE", f"move back finished steps: {self.target_steps}")
+            self.touch_mode = None
+            self.f1 = self.f2 = False
+
+    def update_auto(self, now) -> None:
+        # autoMode(): one decision every 10ms, +1 step on flagH, -10 steps on flagL
+        if now < self.next_auto:
+            return
+        self.next_auto = now + 0.01
+        raw = self.adc_raw()
+        if raw > self.threshold_h:
+            self.steps += 1
+        elif raw < self.threshold_l:
+            self.steps = max(0.0, self.steps - 10)
+        elif self.generator_active and self.surface - self.pos_mm < self.spark_gap:
+            # material removal while discharging
+            self.surface += self.erosion_rate * 0.01
+
+    # ------------------------------------------------------------------ reports
+
+    def report(self, now) -> None:
+        if self.rate:
+            adc_interval = pos_interval = 1.0 / self.rate
+        else:
+            adc_interval = max(self.adc_interval, 1) / 1000.0
+            pos_interval = max(self.pos_interval, 1) / 1000.0
+        if now >= self.next_adc:
+            # send every report that is due since the last loop, at most one second worth
+            count = min(int((now - self.next_adc) / adc_interval) + 1, int(1 / adc_interval) + 1)
+            for _ in range(count):
+                raw = self.adc_raw()
+                if self.binary:
+                    self.write(encode_adc(self.adc_seq, raw))
+                    self.adc_seq += 1
+                else:
+                    self.write(f"<ADC> raw:{raw} calc:{calc_voltage(raw):.2f}V \n".encode())
+                self.inject()
+            self.next_adc = max(self.next_adc + count * adc_interval, now - 1.0)
+            self.reports_sent += count
+        if now >= self.next_pos:
+            count = min(int((now - self.next_pos) / pos_interval) + 1, int(1 / pos_interval) + 1)
+            line = f"<POS> homed:{int(self.homed)} steps:{self.steps_int} pos:{self.pos_mm:.4f}\n".encode()
+            for _ in range(count):
+                if self.binary:
+                    self.write(encode_pos(self.pos_seq, self.homed, self.steps_int))
+                    self.pos_seq += 1
+                else:
+                    self.write(line)
+                self.inject()
+            self.next_pos = max(self.next_pos + count * pos_interval, now - 1.0)
+            self.reports_sent += count
+
+    def inject(self) -> None:
+        if self.noise and self.random.random() < self.noise:
+            garbage = "".join(self.random.choice("abcdefgh<>:. 0123456789") for _ in range(self.random.randint(1, 40)))
+            self.write(garbage.encode() + b"\n")
+        if self.invalid_utf8 and self.random.random() < self.invalid_utf8:
+            self.write(b"<INFO> \xff\xfe invalid \xc3\x28 utf-8\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--link", help="create a symlink to the pty slave, e.g. /tmp/ttyCUBE")
+    parser.add_argument("--rate", type=float, help="report rate in Hz, overrides the M1 interval until the next M1")
+    parser.add_argument("--interval", type=int, default=1000, help="initial report interval in ms (default 1000)")
+    parser.add_argument("--parser-tick", type=float, default=0.1, help="seconds per parsed line (default 0.1)")
+    parser.add_argument("--noise", type=float, default=0.0, help="probability of a garbage line per report")
+    parser.add_argument("--invalid-utf8", type=float, default=0.0, help="probability of invalid utf-8 per report")
+    parser.add_argument("--baud", type=int, default=0, help="limit the output to this baud rate (0 = unlimited)")
+    parser.add_argument("--speed", type=float, default=STEPPER_SPEED_DEFAULT, help="axis speed in mm/s")
+    parser.add_argument("--surface", type=float, default=12.0, help="position of the workpiece surface in mm")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--command-limit", type=int, default=COMMAND_LIMIT, help=f"commands of the parser (default {COMMAND_LIMIT})"
+    )
+    args = parser.parse_args()
+
+    simulator = CubeSimulator(
+        report_interval=args.interval,
+        rate=args.rate,
+        parser_tick=args.parser_tick,
+        noise=args.noise,
+        invalid_utf8=args.invalid_utf8,
+        baud=args.baud,
+        speed=args.speed,
+        surface=args.surface,
+        seed=args.seed,
+        command_limit=args.command_limit,
+    )
+    path = simulator.open(args.link)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"CUBE simulator listening on {path}", flush=True)
+    try:
+        simulator.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.close()
+        print(
+            f"lines received: {simulator.lines_received}, reports sent: {simulator.reports_sent}, "
+            f"rx overruns: {simulator.rx_overruns} bytes, tx dropped: {simulator.tx_dropped} bytes"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Client side mirror of the CUBE firmware state
+The firmware refuses commands depending on homingFlag, autoModeFlag, touchModeFlag
+and generatorAciveFlag (see serialParser.cpp), the gui used to find out one serial
+round trip and a parser tick later. DeviceState follows the flags from the notices
+and reports the device core receives anyway:
+
+    homing      "-> G28" .. "encoder set to 0"
+    touch_mode  "-> M102" .. "move back finished" or "Can't do touch mode"
+    auto_mode   "-> M103 start" .. "-> M103 stop" / "end auto mode"
+    generator   "freq: ..." of setOutput() .. "stopping output" of setOutputOff()
+    relative    "-> G91" / "-> G90"
+    binary      "-> M105 binary reports on/off"
+    interval    "Set new report interval to ...ms" (M1)
+    homed       <POS> reports
+
+Every flag is None while it is unknown (after connecting to a running firmware),
+the boot line sets them to the values after a restart and the status report of
+M114 to the values of the running firmware:
+
+    -> M114 homing:0 homed:1 touch:0 auto:0 generator:1 relative:1 binary:0 steps:40211 target:40211 interval:100
+
+Unknown flags never reject a command. Listeners get (state, changes) with a dict
+of the changed flags.
+"""
+import asyncio  # Importing asyncio to wait until a command is allowed
+
+
+class CommandRejected(Exception):
+    """The firmware would refuse the command in the current state, it was not sent."""
+
+    def __init__(self, command, reason):
+        super().__init__(f"{command.strip()}: {reason}")
+        self.command = command
+        self.reason = reason
+
+
+# flags after every boot: movement.cpp, funcGen.cpp, binaryReport.cpp
+BOOT_STATE = {
+    "homing": False,
+    "homed": False,
+    "touch_mode": False,
+    "auto_mode": False,
+    "generator": False,
+    "relative": True,
+    "binary": False,
+    "interval": 1000,
+}
+
+# fields of the M114 status report
+STATUS_FIELDS = {
+    "homing": "homing",
+    "homed": "homed",
+    "touch": "touch_mode",
+    "auto": "auto_mode",
+    "generator": "generator",
+    "relative": "relative",
+    "binary": "binary",
+    "interval": "interval",
+}
+
+# (start of the log text, changes), M104 logs "-> M103 stop auto mode"
+NOTICES = (
+    ("-> G28", {"homing": True}),
+    ("encoder set to 0", {"homing": False}),
+    ("-> G90", {"relative": False}),
+    ("-> G91", {"relative": True}),
+    ("freq: ", {"generator": True}),
+    ("stopping output", {"generator": False}),
+    ("-> M102", {"touch_mode": True}),
+    ("Can't do touch mode", {"touch_mode": False}),
+    ("move back finished", {"touch_mode": False}),
+    ("-> M103 start", {"auto_mode": True}),
+    ("-> M103 stop", {"auto_mode": False}),
+    ("end auto mode", {"auto_mode": False}),
+    ("-> M105 binary reports on", {"binary": True}),
+    ("-> M105 binary reports off", {"binary": False}),
+)
+
+HOMING = ("homing", True, "Can't do this during homing...")
+AUTO_MODE = ("auto_mode", True, "Can't do this during auto mode...")
+TOUCH_MODE = ("touch_mode", True, "Can't do this during touch mode...")
+NO_GENERATOR = ("generator", False, "Generator must be active for auto Mode...")
+
+# checks of the command handlers in serialParser.cpp, in their order: (flag, refused value, message)
+RULES = {
+    "G90": (HOMING,),
+    "G91": (HOMING,),
+    "M100": (HOMING,),
+    "M101": (HOMING, AUTO_MODE),
+    "M102": (HOMING, AUTO_MODE),
+    "M103": (HOMING, TOUCH_MODE, NO_GENERATOR),
+    "M104": (HOMING, TOUCH_MODE),
+    "M410": (HOMING,),
+}
+
+# modes the firmware leaves by itself, the others only end with another command (M104, M101)
+SETTLING = ("homing", "touch_mode")
+
+
+class DeviceState:
+    __slots__ = tuple(BOOT_STATE) + ("listeners", "_waiters")
+
+    def __init__(self):
+        for name in BOOT_STATE:
+            setattr(self, name, None)
+        # callbacks receiving (state, changes), called from the thread updating the state
+        self.listeners = []
+        self._waiters = []
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in BOOT_STATE)
+        return f"{type(self).__name__}({fields})"
+
+    @property
+    def mode(self) -> str:
+        if self.homing:
+            return "homing"
+        if self.touch_mode:
+            return "touch"
+        if self.auto_mode:
+            return "auto"
+        return "manual"
+
+    def add_listener(self, callback) -> None:
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback) -> None:
+        self.listeners.remove(callback)
+
+    def copy(self):
+        """Snapshot of the flags without listeners, e.g. to hand it to another thread."""
+        state = DeviceState()
+        for name in BOOT_STATE:
+            setattr(state, name, getattr(self, name))
+        return state
+
+    def update(self, **values) -> dict:
+        changes = {name: value for name, value in values.items() if getattr(self, name) != value}
+        if not changes:
+            return changes
+        for name, value in changes.items():
+            setattr(self, name, value)
+        for callback in self.listeners:
+            callback(self, changes)
+        self._wake()
+        return changes
+
+    def booted(self) -> None:
+        self.update(**BOOT_STATE)
+
+    def forget(self) -> None:
+        # nothing is known about a device that is restarting or not connected
+        self.update(**dict.fromkeys(BOOT_STATE))
+
+    def apply_log(self, line) -> None:
+        text = line.text
+        if text.startswith("-> M114 "):
+            self.update(**parse_status(text))
+            return
+        if text.startswith("Set new report interval to "):
+            interval = text[27:].rstrip().removesuffix("ms")
+            if interval.isdigit():
+                self.update(interval=int(interval))
+            return
+        for notice, changes in NOTICES:
+            if text.startswith(notice):
+                self.update(**changes)
+                return
+
+    def check(self, line):
+        """The error message the firmware would answer line with, None if it is allowed (or unknown)."""
+        refusal = self._refusal(line)
+        return None if refusal is None else refusal[1]
+
+    def _refusal(self, line):
+        # (flag, message) of the first failing check, flag None for checks no mode change fixes
+        words = line.split(";", 1)[0].split()
+        if not words:
+            return None
+        word = words[0].upper()
+        if word in ("G0", "G1") and len(words) > 1 and words[1][:1].upper() != "Z":
+            return None, "Only Z-Axis is supported!"
+        for name, refused, message in RULES.get(word, ()):
+            if getattr(self, name) is refused:
+                return name, message
+        return None
+
+    async def wait_allowed(self, line, timeout=None) -> None:
+        """Wait until check(line) passes, e.g. to queue a command behind homing.
+
+        Only homing and touch mode end by themselves, CommandRejected is raised as soon
+        as line is refused for another reason (generator off, auto mode running).
+        """
+        refusal = self._refusal(line)
+        if refusal is None:
+            return
+        if refusal[0] not in SETTLING:
+            raise CommandRejected(line, refusal[1])
+        future = asyncio.get_running_loop().create_future()
+        entry = (line, future)
+        self._waiters.append(entry)
+        try:
+            await asyncio.wait_for(future, timeout)
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+
+    def cancel_waiters(self, error) -> None:
+        waiters, self._waiters = self._waiters, []
+        for _, future in waiters:
+            if not future.done():
+                future.set_exception(error)
+
+    def _wake(self) -> None:
+        for line, future in list(self._waiters):
+            if future.done():
+                continue
+            refusal = self._refusal(line)
+            if refusal is None:
+                future.set_result(None)
+            elif refusal[0] not in SETTLING:
+                # e.g. homing is over, but the generator is still off
+                future.set_exception(CommandRejected(line, refusal[1]))
+
+
+def parse_status(text) -> dict:
+    """State changes of an M114 status report, unknown or malformed fields are left out."""
+    changes = {}
+    for field in text[8:].split():
+        key, _, value = field.partition(":")
+        name = STATUS_FIELDS.get(key)
+        if name is None or not value.isdigit():
+            continue
+        changes[name] = int(value) if name == "interval" else value != "0"
+    return changes
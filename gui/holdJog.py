@@ -0,0 +1,194 @@
+"""Hold-to-jog for CUBEcontrol
+Moves the Z axis for as long as a button or key is held. The firmware has no
+continuous move, so small relative moves ("G1 Z50") are streamed: the distance
+commanded ahead of the axis (the lead) is kept at about two round trips of the
+link at the travel speed, measured from the replies of the jogs, so the axis
+never waits for the next move. The travelled distance is taken from the <POS>
+reports and extrapolated at the travel speed in between.
+
+On release the rest of the lead is dropped with M410 (quick stop), firmware
+without M410 runs it out. The overshoot is bounded by the lead at the release,
+the measured overshoot is the distance travelled after it.
+
+    jog = HoldJog(device, 1)
+    task = asyncio.ensure_future(jog.run())
+    ...
+    jog.release()
+    result = await task
+"""
+import asyncio  # Importing asyncio for the awaitable device api
+import time  # Importing time for the latency and the position estimate
+from cubeDevice import CommandError  # Importing the error of <ERROR> replies
+from deviceState import CommandRejected  # Importing the error of refused commands
+from serialWriter import jog_line  # Importing the line format of relative moves
+
+# constants from include/movement.h, moves shorter than 1mm run at a third of the default speed
+ENCODER_STEPS_PER_MM = 4000
+STEPPER_SPEED_DEFAULT = 1.5
+SPEED_UM_PER_S = STEPPER_SPEED_DEFAULT / 3 * 1000
+MAX_MOVE_UM = 900
+MIN_MOVE_UM = 1
+# until the first reply: one parser tick (100ms) plus the link
+DEFAULT_LATENCY = 0.15
+LEAD_ROUND_TRIPS = 2.0
+# report interval while the button is held
+FEEDBACK_INTERVAL = 50
+
+
+class HoldJog:
+    """Streams relative moves in direction (1 or -1) until release() is called.
+
+    run() is a coroutine on the device loop, release() may be called from any
+    thread, also before run() started.
+    """
+
+    def __init__(self, device, direction, speed=SPEED_UM_PER_S, feedback_interval=FEEDBACK_INTERVAL):
+        self.device = device
+        self.direction = 1 if direction > 0 else -1
+        self.speed = speed
+        self.feedback_interval = feedback_interval
+        self.loop = None
+        self.latency = DEFAULT_LATENCY
+        self.moves = 0
+        self.commanded = 0.0
+        self._start_steps = None
+        # travelled distance of the last <POS> report and when it arrived
+        self._travelled = 0.0
+        self._travelled_at = None
+        self._released = None
+        self._release_requested = False
+        self._moved = None
+
+    # ------------------------------------------------------------------ control
+
+    def release(self) -> None:
+        self._release_requested = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._released.set)
+
+    # ------------------------------------------------------------------ position
+
+    def travelled(self, now=None) -> float:
+        """Estimated distance in µm since the start, never beyond the commanded distance."""
+        if self._travelled_at is None:
+            return 0.0
+        now = time.perf_counter() if now is None else now
+        return min(self.commanded, self._travelled + self.speed * (now - self._travelled_at))
+
+    def lead(self) -> float:
+        return self.commanded - self.travelled()
+
+    async def _watch(self, positions) -> None:
+        async for frame in positions:
+            if self._start_steps is None:
+                self._start_steps = frame.steps
+            travelled = self.direction * (frame.steps - self._start_steps) * 1000 / ENCODER_STEPS_PER_MM
+            if self._travelled_at is None or travelled != self._travelled:
+                # standing still at the last position is not extrapolated further than one report
+                self._travelled_at = time.perf_counter()
+            self._travelled = travelled
+            self._moved.set()
+
+    # ------------------------------------------------------------------ streaming
+
+    async def run(self) -> dict:
+        device = self.device
+        if device.relative is not True:
+            raise CommandRejected("G1", "hold-to-jog needs relative positioning (G91)")
+        # the event exists before the loop is published, release() checks only the loop, and
+        # the flag is read after publishing it, so a release in between is not lost
+        self._released = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        if self._release_requested:
+            self._released.set()
+        self._moved = asyncio.Event()
+        if device.position is not None:
+            self._start_steps = device.position.steps
+        positions = device.positions(maxsize=100)
+        watcher = asyncio.ensure_future(self._watch(positions))
+        interval = device.state.interval
+        faster = self.feedback_interval and interval is not None and interval > self.feedback_interval
+        restore = False
+        released = asyncio.ensure_future(self._released.wait())
+        started = time.perf_counter()
+        error = None
+        try:
+            while not self._released.is_set():
+                lead = self.lead()
+                target = self.speed * self.latency * LEAD_ROUND_TRIPS
+                if target - lead >= MIN_MOVE_UM:
+                    um = round(min(MAX_MOVE_UM, target - lead))
+                    future = await device.send(jog_line(self.direction * um), jog=self.direction * um)
+                    self.commanded += um
+                    self.moves += 1
+                    if faster and not restore:
+                        # after the first move, so it doesn't wait for another parser tick
+                        await device.send(f"M1 {self.feedback_interval}")
+                        restore = True
+                    await asyncio.wait((future, released), timeout=device.timeout, return_when=asyncio.FIRST_COMPLETED)
+                    if not future.done():
+                        if released.done():
+                            # the stop is parsed right after this move
+                            break
+                        raise asyncio.TimeoutError(f"no reply to {jog_line(self.direction * um).strip()}")
+                    reply = future.result()
+                    if reply.error is not None:
+                        # e.g. "Target position can't be negative!", the firmware dropped the move
+                        self.commanded -= um
+                        error = reply.error.text
+                        break
+                    latency = reply.acked_at - reply.queued_at
+                    self.latency = latency if self.moves == 1 else 0.7 * self.latency + 0.3 * latency
+                    if self._travelled_at is None:
+                        # no report yet, the firmware starts the move when it parsed the line
+                        self._travelled_at = reply.acked_at
+                    continue
+                # sleep until the next move is worth sending, or the button is released
+                delay = (lead - target + MIN_MOVE_UM) / self.speed
+                await asyncio.wait((released,), timeout=max(delay, 0.005))
+            held = time.perf_counter() - started
+            travelled = self.travelled()
+            bound = self.commanded - travelled
+            stop = await self._stop() if bound > 0 else "none"
+            if self.moves:
+                await self._settle(bound)
+        finally:
+            positions.close()
+            watcher.cancel()
+            released.cancel()
+            if restore and device.connected:
+                await device.send(f"M1 {interval}")
+        return {
+            "direction": self.direction,
+            "held_s": round(held, 3),
+            "moves": self.moves,
+            "commanded_um": round(self.commanded, 2),
+            "distance_um": round(self._travelled, 2),
+            "latency_ms": round(self.latency * 1000, 1),
+            "overshoot_um": round(max(0.0, self._travelled - travelled), 2),
+            "overshoot_bound_um": round(max(0.0, bound), 2),
+            "stop": stop,
+            "error": error,
+        }
+
+    async def _stop(self) -> str:
+        try:
+            await self.device.command("M410")
+        except (CommandError, CommandRejected):
+            # firmware without M410: the lead runs out
+            return "lead"
+        return "M410"
+
+    async def _settle(self, lead) -> None:
+        # wait until two reports in a row show the same position
+        deadline = time.perf_counter() + 1.0 + max(lead, 0.0) / self.speed
+        last = None
+        while time.perf_counter() < deadline:
+            self._moved.clear()
+            try:
+                await asyncio.wait_for(self._moved.wait(), deadline - time.perf_counter())
+            except asyncio.TimeoutError:
+                return
+            if self._travelled == last:
+                return
+            last = self._travelled
@@ -0,0 +1,118 @@
+"""Latency instrumentation for CUBEcontrol
+A process-wide registry of counters and log-bucketed histograms. The hooks in the
+device core, the ui pipeline and the writer only check metrics.enabled while it is
+off, so they can stay in the code and be switched on in production:
+
+    CUBE_METRICS=1 python cubeControl.py
+
+Histograms keep one counter per bucket, every bucket is 4% wider than the previous
+one, so percentiles are accurate to a few percent for anything from 1µs to hours.
+Updates are not locked, a concurrent update may very rarely be lost.
+"""
+import json  # Importing json for the export
+import math  # Importing math for the bucket index
+import os  # Importing the OS module for the environment switch
+import time  # Importing time for the timestamps
+
+
+GROWTH = 1.04
+LOWEST = 1e-3
+BUCKETS = int(math.log(1e7 / LOWEST) / math.log(GROWTH)) + 2
+
+
+class Histogram:
+    """Counts values in logarithmic buckets, values are in the unit given (ms by default)."""
+
+    __slots__ = ("unit", "counts", "count", "total", "min", "max")
+
+    _scale = 1 / math.log(GROWTH)
+
+    def __init__(self, unit="ms"):
+        self.unit = unit
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value) -> None:
+        if value <= LOWEST:
+            index = 0
+        else:
+            index = min(int(math.log(value / LOWEST) * self._scale) + 1, BUCKETS - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q) -> float:
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                # geometric middle of the bucket, clamped to the values seen
+                value = LOWEST * GROWTH ** (index - 0.5) if index else LOWEST
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "unit": self.unit,
+            "count": self.count,
+            "min": round(self.min, 4) if self.count else 0.0,
+            "mean": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50": round(self.percentile(50), 4),
+            "p95": round(self.percentile(95), 4),
+            "p99": round(self.percentile(99), 4),
+            "max": round(self.max, 4),
+        }
+
+
+class Metrics:
+    """Registry of counters, gauges and histograms, see the module docstring."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self) -> None:
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def count(self, name, n=1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value) -> None:
+        self.gauges[name] = value
+
+    def observe(self, name, value, unit="ms") -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(unit)
+        histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "started": self.started,
+            "uptime_s": round(time.time() - self.started, 3),
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "histograms": {name: histogram.summary() for name, histogram in list(self.histograms.items())},
+        }
+
+    def export(self, path) -> None:
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+# the registry used by all hooks
+metrics = Metrics(enabled=os.environ.get("CUBE_METRICS", "") not in ("", "0"))
@@ -0,0 +1,238 @@
+"""Session log store for CUBEcontrol
+Every console line of a session is appended to one utf-8 byte buffer, its start
+offset, level, kind and timestamp go into growing numpy columns. The console is
+a window over the store:
+
+    level   firmware log level (printLogLevel() in src/logging.cpp), ESP for the
+            "\\r\\n" responses of the command parser, PLAIN for lines without prefix
+            and HOST for lines written by CUBEcontrol
+    kind    log, notice ("-> ..."), response, sent, app
+
+Filters are numpy masks over the columns, a regex search runs on the byte buffer
+and maps match offsets back to lines with a binary search, so both stay fast with
+millions of lines. The store is not locked, it is used from the Tk thread only.
+
+With max_lines the store keeps at least the last max_lines lines and drops the
+oldest ones in chunks of max_lines // 8, so one compaction is paid every chunk
+lines instead of one per line. Line indices then shift down by the dropped count,
+append_lines returns it so a window can rebase its own indices. Without a cap
+nothing is ever removed and memory grows by roughly the text plus 18 bytes per line.
+"""
+import re  # Importing re for the search
+import time  # Importing time for the line timestamps
+import numpy as np  # Importing numpy for the index columns
+from telemetry import LOG_LEVELS, ESP, LogLine  # Importing the firmware log levels
+
+# level codes, the firmware levels keep their number so "code <= WARNING" means "warning or worse"
+LEVEL_CODES = {level: code for code, level in enumerate(LOG_LEVELS)}
+FATAL = LEVEL_CODES["FATAL"]
+ERROR = LEVEL_CODES["ERROR"]
+LEVEL_ESP = len(LOG_LEVELS)
+LEVEL_PLAIN = LEVEL_ESP + 1
+LEVEL_HOST = LEVEL_ESP + 2
+LEVEL_CODES[ESP] = LEVEL_ESP
+LEVEL_CODES[None] = LEVEL_PLAIN
+
+KIND_LOG = 0
+KIND_NOTICE = 1
+KIND_RESPONSE = 2
+KIND_SENT = 3
+KIND_APP = 4
+
+
+class Column:
+    """numpy array that grows by doubling, values holds the filled part."""
+
+    __slots__ = ("array", "count")
+
+    def __init__(self, dtype, capacity=4096):
+        self.array = np.zeros(capacity, dtype)
+        self.count = 0
+
+    def append(self, value) -> None:
+        if self.count == len(self.array):
+            self._grow(self.count + 1)
+        self.array[self.count] = value
+        self.count += 1
+
+    def extend(self, values) -> None:
+        n = len(values)
+        if self.count + n > len(self.array):
+            self._grow(self.count + n)
+        self.array[self.count : self.count + n] = values
+        self.count += n
+
+    def _grow(self, size) -> None:
+        array = np.zeros(max(size, 2 * len(self.array)), self.array.dtype)
+        array[: self.count] = self.array[: self.count]
+        self.array = array
+
+    def clear(self) -> None:
+        self.count = 0
+
+    def drop(self, n) -> None:
+        """Remove the first n values, the rest moves to the front."""
+        self.array[: self.count - n] = self.array[n : self.count]
+        self.count -= n
+
+    def search(self, value) -> int:
+        """Position of value in the (sorted) filled part."""
+        return int(np.searchsorted(self.values, value))
+
+    @property
+    def values(self):
+        return self.array[: self.count]
+
+
+class LogStore:
+    def __init__(self, max_lines=None):
+        self.max_lines = max_lines
+        self.trim = max(max_lines // 8, 1) if max_lines else 0
+        self.data = bytearray()
+        # start offset of every line plus the end of the last one
+        self.offsets = Column(np.int64)
+        self.offsets.append(0)
+        self.levels = Column(np.uint8)
+        self.kinds = Column(np.uint8)
+        self.times = Column(np.float64)
+
+    def __len__(self) -> int:
+        return self.levels.count
+
+    def append_lines(self, lines, t=None) -> int:
+        """Append (text, level code, kind) tuples, text without the trailing newline.
+
+        Returns the number of old lines dropped to stay under max_lines.
+        """
+        if not lines:
+            return 0
+        if t is None:
+            t = time.time()
+        data = self.data
+        ends = []
+        levels = []
+        kinds = []
+        for text, level, kind in lines:
+            data += text.encode("utf-8", "replace")
+            data += b"\n"
+            ends.append(len(data))
+            levels.append(level)
+            kinds.append(kind)
+        self.offsets.extend(ends)
+        self.levels.extend(levels)
+        self.kinds.extend(kinds)
+        self.times.extend(np.full(len(ends), t))
+        if self.max_lines and len(self) >= self.max_lines + self.trim:
+            return self.drop(len(self) - self.max_lines)
+        return 0
+
+    def drop(self, n) -> int:
+        """Remove the n oldest lines, the others move down by n."""
+        n = min(n, len(self))
+        if n:
+            start = int(self.offsets.array[n])
+            del self.data[:start]
+            self.offsets.drop(n)
+            self.offsets.values[:] -= start
+            self.levels.drop(n)
+            self.kinds.drop(n)
+            self.times.drop(n)
+        return n
+
+    def append_records(self, records, t=None) -> int:
+        """Append LogLines and SentLines, other records are skipped."""
+        return self.append_lines([line for line in map(classify, records) if line is not None], t)
+
+    def line(self, index) -> str:
+        offsets = self.offsets.array
+        return self.data[offsets[index] : offsets[index + 1] - 1].decode("utf-8", "replace")
+
+    def lines(self, indices) -> list:
+        offsets = self.offsets.array
+        data = self.data
+        return [data[offsets[i] : offsets[i + 1] - 1].decode("utf-8", "replace") for i in indices]
+
+    def select(self, mask_function, start=0, stop=None) -> np.ndarray:
+        """Indices of the lines in start..stop for which mask_function(levels, kinds) is True."""
+        stop = len(self) if stop is None else stop
+        mask = mask_function(self.levels.array[start:stop], self.kinds.array[start:stop])
+        return np.flatnonzero(mask) + start
+
+    def find(self, pattern, start=0, stop=None, mask_function=None, block=1 << 16):
+        """Index of the first line in start..stop matching the compiled bytes regex, or None.
+
+        With a mask_function only lines passing it count, the buffer is then searched
+        block lines at a time so a hit near start returns early.
+        """
+        stop = len(self) if stop is None else stop
+        offsets = self.offsets.array
+        data = self.data
+        while start < stop:
+            end = stop if mask_function is None else min(start + block, stop)
+            if mask_function is None:
+                match = pattern.search(data, int(offsets[start]), int(offsets[end]))
+                positions = [match.start()] if match is not None else []
+            else:
+                matches = pattern.finditer(data, int(offsets[start]), int(offsets[end]))
+                positions = [match.start() for match in matches]
+            if positions:
+                lines = np.searchsorted(offsets[: end + 1], positions, "right") - 1
+                if mask_function is not None:
+                    lines = lines[mask_function(self.levels.array[lines], self.kinds.array[lines])]
+                if len(lines):
+                    return int(lines[0])
+            start = end
+        return None
+
+    def rfind(self, pattern, start=0, stop=None, mask_function=None, block=1 << 16):
+        """Index of the last line in start..stop matching the regex (and the mask), or None."""
+        stop = len(self) if stop is None else stop
+        offsets = self.offsets.array
+        while stop > start:
+            begin = max(stop - block, start)
+            matches = pattern.finditer(self.data, int(offsets[begin]), int(offsets[stop]))
+            positions = [match.start() for match in matches]
+            if positions:
+                lines = np.searchsorted(offsets[: stop + 1], positions, "right") - 1
+                if mask_function is not None:
+                    lines = lines[mask_function(self.levels.array[lines], self.kinds.array[lines])]
+                if len(lines):
+                    return int(lines[-1])
+            stop = begin
+        return None
+
+    def find_level(self, max_level, start=0, stop=None):
+        """Index of the first firmware line with a level code from FATAL to max_level, or None."""
+        stop = len(self) if stop is None else stop
+        levels = self.levels.array[start:stop]
+        hits = np.flatnonzero((levels >= FATAL) & (levels <= max_level))
+        return int(hits[0]) + start if len(hits) else None
+
+    def at_time(self, t) -> int:
+        """Index of the first line logged at or after t (seconds since the epoch)."""
+        return int(np.searchsorted(self.times.values, t, "left"))
+
+
+def classify(record):
+    """(text, level code, kind) of a LogLine or SentLine, None for anything else."""
+    if type(record) is LogLine:
+        text = str(record)
+        level = LEVEL_CODES.get(record.level, LEVEL_PLAIN)
+        if level == LEVEL_ESP:
+            # parser errors come as the response of the command
+            return text, ERROR if "parse" in text else level, KIND_RESPONSE
+        return text, level, KIND_NOTICE if record.text.startswith("-> ") else KIND_LOG
+    if hasattr(record, "text"):
+        # SentLine of the device core
+        return f">>> {record.text}", LEVEL_HOST, KIND_SENT
+    return None
+
+
+def compile_search(text):
+    """Compile the search text of the console as a regex on the utf-8 bytes of the store.
+
+    Smart case: only lower case text ignores the case, a case sensitive search of the
+    buffer is about ten times faster.
+    """
+    flags = re.MULTILINE | (re.IGNORECASE if text == text.lower() else 0)
+    return re.compile(text.encode("utf-8"), flags)
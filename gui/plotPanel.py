@@ -0,0 +1,239 @@
+"""Live strip charts for CUBEcontrol
+ADC voltage and Z position are kept in fixed-size ring buffers that are filled from
+the serial reader thread. The charts are drawn with min/max decimation: every pixel
+column gets one vertical min..max stroke, so the drawing cost depends on the width
+of the chart and not on the number of samples. Canvas items are created once and
+only their coordinates are updated on redraw.
+"""
+import threading  # Importing threading for the lock between reader thread and Tk thread
+import time  # Importing time for the sample timestamps
+import tkinter as tk  # Importing the Tkinter library for the canvas
+from tkinter import ttk  # Importing the themed Tkinter widgets
+import numpy as np  # Importing numpy for the ring buffers and the decimation
+from telemetry import AdcFrame, PosFrame  # Importing the decoded telemetry records
+
+
+class RingBuffer:
+    """Fixed-size buffer of (t, value) samples, the oldest samples are overwritten."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.t = np.zeros(capacity)
+        self.v = np.zeros(capacity)
+        self.head = 0
+        self.count = 0
+
+    def extend(self, t, values) -> None:
+        values = np.asarray(values, dtype=float)[-self.capacity :]
+        n = len(values)
+        if n == 0:
+            return
+        first = min(n, self.capacity - self.head)
+        self.t[self.head : self.head + first] = t
+        self.v[self.head : self.head + first] = values[:first]
+        if first < n:
+            self.t[: n - first] = t
+            self.v[: n - first] = values[first:]
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def since(self, t0):
+        """Copies of the samples with t >= t0 in chronological order.
+
+        Only the samples in the window are copied, the ring is searched in its two
+        chronological parts (oldest from head to the end, newest from 0 to head).
+        """
+        if self.count < self.capacity:
+            start = int(np.searchsorted(self.t[: self.count], t0, "left"))
+            return self.t[start : self.count].copy(), self.v[start : self.count].copy()
+        head = self.head
+        if head == 0 or self.t[0] >= t0:
+            # the window starts in the older part
+            start = head + int(np.searchsorted(self.t[head:], t0, "left"))
+            return (
+                np.concatenate((self.t[start:], self.t[:head])),
+                np.concatenate((self.v[start:], self.v[:head])),
+            )
+        start = int(np.searchsorted(self.t[:head], t0, "left"))
+        return self.t[start:head].copy(), self.v[start:head].copy()
+
+
+class TelemetryBuffers:
+    """Ring buffers for ADC voltage and position, filled by the serial reader thread."""
+
+    def __init__(self, capacity=100000):
+        self.lock = threading.Lock()
+        self.volts = RingBuffer(capacity)
+        self.pos = RingBuffer(capacity)
+        self.version = 0
+
+    def append_records(self, records, t=None) -> None:
+        if t is None:
+            t = time.monotonic()
+        volts = [record.volts for record in records if type(record) is AdcFrame]
+        pos = [record.pos_mm for record in records if type(record) is PosFrame]
+        if not volts and not pos:
+            return
+        with self.lock:
+            self.volts.extend(t, volts)
+            self.pos.extend(t, pos)
+            self.version += 1
+
+    def since(self, t0):
+        with self.lock:
+            return self.volts.since(t0), self.pos.since(t0)
+
+
+def decimate_minmax(t, v, t0, span, width):
+    """Reduce samples to one (min, max) pair per pixel column.
+
+    Returns x (pixel column, repeated for min and max) and y (alternating min and max).
+    """
+    if len(t) == 0:
+        return np.zeros(0), np.zeros(0)
+    columns = ((t - t0) * (width / span)).astype(np.int64)
+    np.clip(columns, 0, width - 1, out=columns)
+    starts = np.flatnonzero(np.concatenate(([True], columns[1:] != columns[:-1])))
+    vmin = np.minimum.reduceat(v, starts)
+    vmax = np.maximum.reduceat(v, starts)
+    x = np.repeat(columns[starts], 2)
+    y = np.empty(len(x))
+    y[0::2] = vmin
+    y[1::2] = vmax
+    return x, y
+
+
+class StripChart:
+    """Canvas with one decimated trace and optional horizontal overlay lines."""
+
+    def __init__(self, parent, title, unit, width=560, height=180, color="#1f77b4", overlays=()):
+        self.title = title
+        self.unit = unit
+        self.width = width
+        self.height = height
+        self.margin = 50
+        self.canvas = tk.Canvas(parent, width=width + self.margin, height=height, bg="white", highlightthickness=0)
+
+        # all canvas items are created once and only moved on redraw
+        self.trace = self.canvas.create_line(0, 0, 0, 0, fill=color, width=1, state="hidden")
+        self.overlays = {
+            name: (
+                self.canvas.create_line(0, 0, 0, 0, fill=overlay_color, dash=(4, 2), state="hidden"),
+                self.canvas.create_text(0, 0, text=name, fill=overlay_color, anchor="sw", state="hidden"),
+            )
+            for name, overlay_color in overlays
+        }
+        self.canvas.create_line(self.margin, 0, self.margin, height, fill="#888888")
+        self.canvas.create_text(self.margin + 5, 2, text=title, anchor="nw", font=("Arial", 9, "bold"))
+        self.top_label = self.canvas.create_text(self.margin - 4, 2, anchor="ne", font=("Arial", 8))
+        self.bottom_label = self.canvas.create_text(self.margin - 4, height - 2, anchor="se", font=("Arial", 8))
+        self.last_label = self.canvas.create_text(
+            width + self.margin - 4, 2, anchor="ne", font=("Arial", 9), fill=color
+        )
+
+    def grid(self, **options) -> None:
+        self.canvas.grid(**options)
+
+    def draw(self, t, v, now, span, overlays=None) -> None:
+        overlays = overlays or {}
+        if len(v) == 0:
+            self.canvas.itemconfigure(self.trace, state="hidden")
+            return
+        x, y = decimate_minmax(t, v, now - span, span, self.width)
+
+        # y range from the visible data and the overlay lines
+        values = [y.min(), y.max(), *overlays.values()]
+        low, high = min(values), max(values)
+        pad = (high - low) * 0.05 or 1.0
+        low, high = low - pad, high + pad
+        scale = (self.height - 4) / (high - low)
+
+        px = x + self.margin
+        py = self.height - 2 - (y - low) * scale
+        if len(px) < 2:
+            px, py = np.repeat(px, 2), np.repeat(py, 2)
+        self.canvas.coords(self.trace, np.column_stack((px, py)).ravel().tolist())
+        self.canvas.itemconfigure(self.trace, state="normal")
+
+        for name, (line, label) in self.overlays.items():
+            value = overlays.get(name)
+            if value is None:
+                self.canvas.itemconfigure(line, state="hidden")
+                self.canvas.itemconfigure(label, state="hidden")
+                continue
+            oy = self.height - 2 - (value - low) * scale
+            self.canvas.coords(line, self.margin, oy, self.margin + self.width, oy)
+            self.canvas.coords(label, self.margin + 4, oy)
+            self.canvas.itemconfigure(line, state="normal")
+            self.canvas.itemconfigure(label, state="normal", text=f"{name} {value:g}{self.unit}")
+
+        self.canvas.itemconfigure(self.top_label, text=f"{high:.2f}")
+        self.canvas.itemconfigure(self.bottom_label, text=f"{low:.2f}")
+        self.canvas.itemconfigure(self.last_label, text=f"{v[-1]:.4g}{self.unit}")
+
+
+class PlotWindow:
+    """Toplevel with the voltage and position charts, opened and closed like the ConfigWindow."""
+
+    def __init__(self, parent, buffers, config_window, span=30.0, fps=20):
+        self.window = None
+        self.parent = parent
+        self.buffers = buffers
+        self.config_window = config_window
+        self.span = span
+        self.interval = int(1000 / fps)
+        self.after_handle = None
+        self.drawn_version = -1
+        self.drawn_at = None
+
+    def open(self) -> None:
+        # Check if the window already exists, and if so, destroy it
+        if self.window and self.window.winfo_exists():
+            self.close()
+            return
+
+        self.window = tk.Toplevel(self.parent)
+        self.window.title("Plot")
+        self.window.resizable(False, False)
+        self.window.transient(self.parent)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        inner_frame = ttk.Frame(self.window, padding=(10, 10, 10, 10))
+        inner_frame.pack(fill="both", expand=True)
+        self.voltage_chart = StripChart(
+            inner_frame,
+            "ADC voltage",
+            "V",
+            overlays=(("lower", "#d62728"), ("upper", "#2ca02c")),
+        )
+        self.voltage_chart.grid(column=0, row=0, pady=(0, 10))
+        self.position_chart = StripChart(inner_frame, "Position", "mm", color="#ff7f0e")
+        self.position_chart.grid(column=0, row=1)
+
+        self.drawn_version = -1
+        self.drawn_at = None
+        self.redraw()
+
+    def close(self) -> None:
+        if self.after_handle is not None:
+            self.parent.after_cancel(self.after_handle)
+            self.after_handle = None
+        if self.window is not None:
+            self.window.destroy()
+            self.window = None
+
+    def redraw(self) -> None:
+        # redraw if new samples arrived or the time axis moved by a pixel column since the last frame
+        now = time.monotonic()
+        scrolled = self.drawn_at is None or now - self.drawn_at >= self.span / self.voltage_chart.width
+        if self.buffers.version != self.drawn_version or scrolled:
+            self.drawn_version = self.buffers.version
+            self.drawn_at = now
+            (vt, vv), (pt, pv) = self.buffers.since(now - self.span)
+            thresholds = {
+                "lower": self.config_window.get("lower_thr"),
+                "upper": self.config_window.get("upper_thr"),
+            }
+            self.voltage_chart.draw(vt, vv, now, self.span, thresholds)
+            self.position_chart.draw(pt, pv, now, self.span)
+        self.after_handle = self.parent.after(self.interval, self.redraw)
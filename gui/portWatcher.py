@@ -0,0 +1,162 @@
+"""Serial port watcher for CUBEcontrol
+Keeps the list of serial ports up to date from a background thread and reports only
+the ports that were added or removed. On Linux the port list is rescanned when
+inotify reports a change in /dev (or in the directories of the extra patterns),
+everywhere else the ports are polled, but never on the Tk thread.
+
+Extra glob patterns add ports that comports() does not list, e.g. the pty link of
+the simulator:
+
+    watcher = PortWatcher(print, patterns=("/tmp/ttyCUBE*",))
+    watcher.start()
+"""
+import ctypes  # Importing ctypes for the inotify calls of the C library
+import ctypes.util  # Importing ctypes.util to find the C library
+import fnmatch  # Importing fnmatch to filter the changes in the pattern directories
+import glob  # Importing glob for the extra port patterns
+import os  # Importing the OS module for reading the inotify file descriptor
+import select  # Importing select to wait for inotify events with a timeout
+import struct  # Importing struct to decode the inotify events
+import sys  # Importing sys to detect the platform
+import threading  # Importing the threading module for the background watcher thread
+import serial.tools.list_ports  # Importing a utility to list available serial ports
+from telemetry import Record  # Importing the record base class for the ui events
+
+
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+DEVICE_DIRECTORIES = ("/dev", "/dev/serial/by-id")
+
+
+class PortChange(Record):
+    """Ports that appeared or disappeared since the last change."""
+
+    __slots__ = ("added", "removed")
+
+    def __init__(self, added, removed):
+        self.added = added
+        self.removed = removed
+
+
+def list_ports(patterns=()) -> list:
+    ports = [str(port.device) for port in serial.tools.list_ports.comports()]
+    for pattern in patterns:
+        ports += sorted(path for path in glob.glob(pattern) if path not in ports)
+    return ports
+
+
+class Inotify:
+    """Minimal inotify binding, reports which entries of the watched directories changed."""
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = directory
+        if not self.watches:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "no directory could be watched")
+
+    def wait(self, timeout) -> list:
+        """Wait for changes, returns (directory, name) of the changed entries (empty on timeout)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        changes = []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changes
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0").decode(errors="replace")
+            changes.append((self.watches.get(wd), name))
+            offset += length
+        return changes
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PortWatcher(threading.Thread):
+    """Background thread calling on_change(added, removed) whenever the serial ports change.
+
+    The first scan reports all present ports as added. ports is the current list and
+    may be read from any thread.
+    """
+
+    def __init__(self, on_change, patterns=(), poll_interval=1.0, debounce=0.05, use_inotify=True):
+        super().__init__(name="PortWatcher", daemon=True)
+        self.on_change = on_change
+        self.patterns = tuple(patterns)
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+        self.ports = []
+        self.scans = 0
+        self.inotify = None
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        if self.use_inotify:
+            directories = set(DEVICE_DIRECTORIES)
+            directories.update(os.path.dirname(pattern) for pattern in self.patterns)
+            try:
+                self.inotify = Inotify(sorted(directories))
+            except (OSError, AttributeError):
+                # no inotify (e.g. not available in a container), fall back to polling
+                self.inotify = None
+        try:
+            self.scan()
+            while not self._stop_event.is_set():
+                if self.inotify is None:
+                    self._stop_event.wait(self.poll_interval)
+                elif self.relevant(self.inotify.wait(self.poll_interval)):
+                    # devices show up with several events (node, by-id link, permissions)
+                    self._stop_event.wait(self.debounce)
+                    while self.inotify.wait(0):
+                        pass
+                else:
+                    # nothing of interest happened, the timeout only lets the thread notice stop()
+                    continue
+                if not self._stop_event.is_set():
+                    self.scan()
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+
+    def relevant(self, changes) -> bool:
+        # everything in /dev counts, other directories (e.g. /tmp) only for names matching a pattern
+        for directory, name in changes:
+            if directory in DEVICE_DIRECTORIES:
+                return True
+            for pattern in self.patterns:
+                if os.path.dirname(pattern) == directory and fnmatch.fnmatch(name, os.path.basename(pattern)):
+                    return True
+        return False
+
+    def scan(self) -> None:
+        ports = list_ports(self.patterns)
+        self.scans += 1
+        added = [port for port in ports if port not in self.ports]
+        removed = [port for port in self.ports if port not in ports]
+        self.ports = ports
+        if added or removed:
+            self.on_change(added, removed)
+
+    def stop(self) -> None:
+        self._stop_event.set()
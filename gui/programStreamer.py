@@ -0,0 +1,235 @@
+"""G-code program streaming for CUBEcontrol
+Sends a program line by line to a CubeDevice while keeping the number of unanswered
+bytes below a window. The firmware reads one line per parser tick from a 256 byte
+receive buffer, lines written faster than that are lost once the buffer overruns.
+A line leaves the window when its reply (the println() of the command parser) has
+arrived, notices ("-> G1 Z10") and <ERROR> lines of the replies are counted.
+Commands the firmware refuses in some modes (G90 during homing, M103 without the
+generator, see deviceState.py) wait for the lines before them and until the mode
+allows them, so "G28" followed by "G90" works without a dwell. Lines refused in a
+mode that doesn't end by itself (M103 with the generator off) are not sent and
+count as <ERROR> replies.
+
+    streamer = ProgramStreamer(device, load_program("electrode.gcode"))
+    status = await streamer.run()
+"""
+import asyncio  # Importing asyncio for the awaitable device api
+import time  # Importing time for the line rate
+from collections import deque  # Importing deque for the lines in flight
+from cubeDevice import Reply, command_word  # Importing the reply and command word helper of the device core
+from deviceState import RULES, CommandRejected  # Importing the mode checks of the firmware
+from telemetry import LogLine  # Importing the log line record for refused lines
+
+
+# receive buffer of the ESP32 uart driver, keep some room for commands of the gui
+RX_BUFFER = 256
+DEFAULT_WINDOW = 192
+# CommandParser reads lines into a 128 byte buffer including the terminator
+MAX_LINE = 127
+
+
+class ProgramLine:
+    """One line of a program, number is the line number in the source file."""
+
+    __slots__ = ("number", "text")
+
+    def __init__(self, number, text):
+        self.number = number
+        self.text = text
+
+    def __repr__(self) -> str:
+        return f"ProgramLine({self.number}, {self.text!r})"
+
+
+def parse_program(source) -> list:
+    """Split program text into lines to send, comments after ";" and empty lines are dropped.
+
+    Raises ValueError for lines the firmware can't take (too long, M0 restart).
+    """
+    program = []
+    for number, line in enumerate(source.splitlines(), 1):
+        text = line.split(";", 1)[0].strip()
+        if not text:
+            continue
+        if len(text.encode()) + 1 > MAX_LINE:
+            raise ValueError(f"line {number}: longer than {MAX_LINE} bytes")
+        if command_word(text) == "M0":
+            raise ValueError(f"line {number}: M0 would restart the device")
+        program.append(ProgramLine(number, text))
+    return program
+
+
+def load_program(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return parse_program(f.read())
+
+
+class ProgramStreamer:
+    """Streams a program to a connected CubeDevice with byte based flow control.
+
+    run() is a coroutine on the device loop, pause(), resume() and abort() may be
+    called from any thread. With stop_on_error the program stops at the first <ERROR>
+    reply, lines already in flight are still executed by the firmware.
+    """
+
+    def __init__(self, device, program, window=DEFAULT_WINDOW, stop_on_error=True):
+        self.device = device
+        self.program = program
+        self.window = min(window, RX_BUFFER)
+        self.stop_on_error = stop_on_error
+        self.loop = None
+        self.state = "idle"
+        self.sent = 0
+        self.done = 0
+        self.notices = 0
+        self.errors = 0
+        self.first_error = None
+        self.bytes_in_flight = 0
+        self.lines_in_flight = 0
+        self.started = None
+        self.finished = None
+        # callbacks receiving (line, reply) of every answered line, called on the device loop
+        self.listeners = []
+        self._resumed = None
+        self._aborted = False
+        # send() of the current line while it waits for the mode to allow it
+        self._sending = None
+
+    # ------------------------------------------------------------------ control
+
+    def pause(self) -> None:
+        self._call(self._set_paused, True)
+
+    def resume(self) -> None:
+        self._call(self._set_paused, False)
+
+    def abort(self) -> None:
+        self._aborted = True
+        self._call(self._set_paused, False)
+        self._call(self._cancel_send)
+
+    def _call(self, callback, *args) -> None:
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _set_paused(self, paused) -> None:
+        if self.state not in ("running", "paused"):
+            return
+        if paused:
+            self._resumed.clear()
+            self.state = "paused"
+        else:
+            self._resumed.set()
+            self.state = "running"
+
+    def _cancel_send(self) -> None:
+        if self._sending is not None:
+            self._sending.cancel()
+
+    # ------------------------------------------------------------------ status
+
+    @property
+    def queued(self) -> int:
+        return len(self.program) - self.sent
+
+    @property
+    def lines_per_s(self) -> float:
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "lines": len(self.program),
+            "sent": self.sent,
+            "done": self.done,
+            "queued": self.queued,
+            "in_flight": self.lines_in_flight,
+            "bytes_in_flight": self.bytes_in_flight,
+            "notices": self.notices,
+            "errors": self.errors,
+            "lines_per_s": round(self.lines_per_s, 2),
+        }
+
+    # ------------------------------------------------------------------ streaming
+
+    async def run(self) -> dict:
+        self.loop = asyncio.get_running_loop()
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self.state = "running"
+        self.started = time.monotonic()
+        in_flight = deque()
+        try:
+            for line in self.program:
+                await self._resumed.wait()
+                if self._aborted or (self.stop_on_error and self.errors):
+                    break
+                data = line.text + "\n"
+                size = len(data.encode())
+                # wait for replies until the line fits into the window
+                while in_flight and self.bytes_in_flight + size > self.window:
+                    await self._complete(in_flight)
+                if command_word(data) in RULES:
+                    # the mode after the lines in flight decides, the firmware reports it on the way
+                    while in_flight:
+                        await self._complete(in_flight)
+                if self._aborted or (self.stop_on_error and self.errors):
+                    break
+                self._sending = asyncio.ensure_future(self.device.send(data, queue=True))
+                try:
+                    future = await self._sending
+                except asyncio.CancelledError:
+                    if not self._aborted:
+                        raise
+                    break
+                except CommandRejected as e:
+                    # the reply the firmware would have sent, after the replies of the lines before
+                    while in_flight:
+                        await self._complete(in_flight)
+                    reply = Reply(data)
+                    reply.error = LogLine("ERROR", e.reason)
+                    self.sent += 1
+                    self._answered(line, reply)
+                    continue
+                finally:
+                    self._sending = None
+                in_flight.append((line, size, future))
+                self.bytes_in_flight += size
+                self.lines_in_flight += 1
+                self.sent += 1
+            while in_flight:
+                await self._complete(in_flight)
+        except Exception:
+            self.state = "failed"
+            raise
+        finally:
+            self.finished = time.monotonic()
+        if self._aborted:
+            self.state = "aborted"
+        elif self.errors:
+            self.state = "failed"
+        else:
+            self.state = "done"
+        return self.status()
+
+    async def _complete(self, in_flight) -> None:
+        line, size, future = in_flight[0]
+        reply = await asyncio.wait_for(future, self.device.timeout)
+        in_flight.popleft()
+        self.bytes_in_flight -= size
+        self.lines_in_flight -= 1
+        self._answered(line, reply)
+
+    def _answered(self, line, reply) -> None:
+        self.done += 1
+        if reply.notice is not None:
+            self.notices += 1
+        if reply.error is not None:
+            self.errors += 1
+            if self.first_error is None:
+                self.first_error = (line, reply.error)
+        for callback in self.listeners:
+            callback(line, reply)
@@ -0,0 +1,382 @@
+"""Telemetry recorder for CUBEcontrol
+Appends every decoded ADC and POS sample to preallocated typed columns which are
+flushed in chunks to memory-mapped column files. A recording is a directory:
+
+    meta.json           column names, dtypes, number of rows and the start time
+    t.f8 kind.u1 ...    one raw little-endian file per column
+
+Every row carries the host monotonic timestamp and the last known values of all
+fields (raw, volts, steps, pos, homed), kind tells whether an ADC or a POS frame
+produced the row. Recordings are opened with numpy.memmap, so multi-hour runs open
+instantly and time ranges are sliced without reading the whole file.
+
+The windowed ADC statistics (see adcStats.py) are written by a WindowRecorder into
+the "windows" directory of a recording, one row per window.
+
+    python -m recorder info recordings/20230402-120000
+    python -m recorder info recordings/20230402-120000/windows
+    python -m recorder replay recordings/20230402-120000 --speed max
+    python -m recorder replay recordings/20230402-120000 --speed max --out - | jq .volts
+
+replay decodes the rows back into records and counts them, with --out they are
+written as JSON lines like the telemetry of cubeJob.py and telemetryServer.py.
+"""
+import argparse  # Importing argparse for the command line interface
+import json  # Importing json for the meta data file
+import os  # Importing the OS module for file handling
+import sys  # Importing sys for the replay output on stdout
+import threading  # Importing threading for the lock and the replay thread
+import time  # Importing time for the timestamps
+import numpy as np  # Importing numpy for the typed columns and memory mapping
+from telemetry import AdcFrame, PosFrame  # Importing the decoded telemetry records
+from adcStats import AdcWindow  # Importing the windowed ADC statistics
+
+COLUMNS = (
+    ("t", "<f8"),
+    ("kind", "u1"),
+    ("raw", "<u2"),
+    ("volts", "<f4"),
+    ("steps", "<i4"),
+    ("pos", "<f8"),
+    ("homed", "u1"),
+)
+WINDOW_COLUMNS = (
+    ("t", "<f8"),
+    ("count", "<u4"),
+    ("min", "<f4"),
+    ("max", "<f4"),
+    ("mean", "<f4"),
+    ("std", "<f4"),
+    ("below", "<f4"),
+    ("above", "<f4"),
+    ("counter_l", "<u4"),
+    ("counter_h", "<u4"),
+)
+KIND_ADC = 0
+KIND_POS = 1
+META_FILE = "meta.json"
+WINDOWS_DIRECTORY = "windows"
+
+
+def column_file(path, name, dtype) -> str:
+    return os.path.join(path, f"{name}.{np.dtype(dtype).kind}{np.dtype(dtype).itemsize}")
+
+
+class Recorder:
+    """Writes ADC/POS records into a new recording directory.
+
+    append_records() may be called from the serial reader thread, samples are kept in
+    preallocated chunk arrays and copied into the memory-mapped files every chunk_size rows,
+    or with the first append flush_interval seconds after the last flush, so meta.json
+    never lags more than that behind a slow stream.
+    """
+
+    columns = COLUMNS
+
+    def __init__(self, path, chunk_size=4096, grow_rows=1 << 20, flush_interval=5.0):
+        os.makedirs(path)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.flushed_at = time.monotonic()
+        self.grow_rows = grow_rows
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.capacity = 0
+        self.count = 0
+        self.started = time.time()
+        self.chunk = [np.zeros(chunk_size, dtype) for _, dtype in self.columns]
+        self.maps = None
+        self.closed = False
+        # last known values, every row is filled with them
+        self.raw = 0
+        self.volts = 0.0
+        self.steps = 0
+        self.pos = 0.0
+        self.homed = 0
+        self._write_meta()
+
+    def append_records(self, records, t=None) -> None:
+        if t is None:
+            t = time.monotonic()
+        t_col, kind_col, raw_col, volts_col, steps_col, pos_col, homed_col = self.chunk
+        with self.lock:
+            if self.closed:
+                return
+            for record in records:
+                cls = type(record)
+                if cls is AdcFrame:
+                    kind = KIND_ADC
+                    self.raw = record.raw
+                    self.volts = record.volts
+                elif cls is PosFrame:
+                    kind = KIND_POS
+                    self.steps = record.steps
+                    self.pos = record.pos_mm
+                    self.homed = record.homed
+                else:
+                    continue
+                i = self.count
+                t_col[i] = t
+                kind_col[i] = kind
+                raw_col[i] = self.raw
+                volts_col[i] = self.volts
+                steps_col[i] = self.steps
+                pos_col[i] = self.pos
+                homed_col[i] = self.homed
+                self.count = i + 1
+                if self.count == self.chunk_size:
+                    self._flush()
+            self._flush_due()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            self._flush()
+            self.closed = True
+            self._close_maps()
+            # cut the preallocated files down to the written rows (created empty if nothing was recorded)
+            for name, dtype in self.columns:
+                with open(column_file(self.path, name, dtype), "ab") as f:
+                    f.truncate(self.rows * np.dtype(dtype).itemsize)
+
+    def _flush_due(self) -> None:
+        if self.count and time.monotonic() - self.flushed_at >= self.flush_interval:
+            self._flush()
+
+    def _flush(self) -> None:
+        self.flushed_at = time.monotonic()
+        count = self.count
+        if count == 0:
+            return
+        if self.rows + count > self.capacity:
+            self._grow(self.rows + count)
+        for column, chunk in zip(self.maps, self.chunk):
+            column[self.rows : self.rows + count] = chunk[:count]
+        self.rows += count
+        self.count = 0
+        self._write_meta()
+
+    def _grow(self, rows) -> None:
+        self._close_maps()
+        self.capacity = max(rows, self.capacity + self.grow_rows)
+        self.maps = []
+        for name, dtype in self.columns:
+            filename = column_file(self.path, name, dtype)
+            with open(filename, "ab") as f:
+                f.truncate(self.capacity * np.dtype(dtype).itemsize)
+            self.maps.append(np.memmap(filename, dtype=dtype, mode="r+", shape=(self.capacity,)))
+
+    def _close_maps(self) -> None:
+        if self.maps is not None:
+            for column in self.maps:
+                column.flush()
+            self.maps = None
+
+    def _write_meta(self) -> None:
+        meta = {
+            "columns": [[name, dtype] for name, dtype in self.columns],
+            "rows": self.rows,
+            "started": self.started,
+        }
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+
+class WindowRecorder(Recorder):
+    """Writes AdcWindow records, one row per window, all other records are ignored."""
+
+    columns = WINDOW_COLUMNS
+
+    def append_records(self, records, t=None) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            for record in records:
+                if type(record) is not AdcWindow:
+                    continue
+                i = self.count
+                for column, name in zip(self.chunk, AdcWindow.__slots__):
+                    column[i] = getattr(record, name)
+                self.count = i + 1
+                if self.count == self.chunk_size:
+                    self._flush()
+            self._flush_due()
+
+
+class Recording:
+    """Read-only view of a recording, columns are memory-mapped numpy arrays."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self.started = self.meta["started"]
+        self.columns = {}
+        for name, dtype in self.meta["columns"]:
+            if self.rows:
+                column = np.memmap(column_file(path, name, dtype), dtype=dtype, mode="r", shape=(self.rows,))
+            else:
+                column = np.zeros(0, dtype)
+            self.columns[name] = column
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def duration(self) -> float:
+        t = self.columns["t"]
+        return float(t[-1] - t[0]) if self.rows else 0.0
+
+    def index_range(self, start=None, stop=None):
+        # start/stop in seconds since the first sample, binary search on the time column
+        t = self.columns["t"]
+        if not self.rows:
+            return 0, 0
+        t0 = t[0]
+        first = 0 if start is None else int(np.searchsorted(t, t0 + start, "left"))
+        last = self.rows if stop is None else int(np.searchsorted(t, t0 + stop, "right"))
+        return first, last
+
+    def slice(self, start=None, stop=None) -> dict:
+        """Columns of the rows between start and stop seconds, as views into the files."""
+        first, last = self.index_range(start, stop)
+        return {name: column[first:last] for name, column in self.columns.items()}
+
+
+def rows_to_records(columns, first, last) -> list:
+    # turn rows back into the records the decoder produced
+    kind = columns["kind"][first:last].tolist()
+    raw = columns["raw"][first:last].tolist()
+    volts = columns["volts"][first:last].round(2).tolist()
+    steps = columns["steps"][first:last].tolist()
+    pos = columns["pos"][first:last].tolist()
+    homed = columns["homed"][first:last].tolist()
+    return [
+        AdcFrame(raw[i], volts[i]) if kind[i] == KIND_ADC else PosFrame(bool(homed[i]), steps[i], pos[i])
+        for i in range(last - first)
+    ]
+
+
+class Replayer(threading.Thread):
+    """Feeds a recording back to a listener callback (same signature as CubeDevice listeners).
+
+    speed is the replay factor, 1.0 replays in real time, None or 0 as fast as possible.
+    """
+
+    def __init__(self, recording, callback, speed=1.0, start=None, stop=None, batch=1024, on_done=None):
+        super().__init__(name="Replayer", daemon=True)
+        self.recording = recording
+        self.callback = callback
+        self.speed = speed
+        self.range = recording.index_range(start, stop)
+        self.batch = batch
+        self.on_done = on_done
+        self.replayed = 0
+        # time.perf_counter() when the replay started
+        self.started = None
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        columns = self.recording.columns
+        t = columns["t"]
+        first, last = self.range
+        self.started = time.perf_counter()
+        begin = time.monotonic()
+        index = first
+        while index < last and not self._stop_event.is_set():
+            end = min(index + self.batch, last)
+            if self.speed:
+                # deliver everything that is due, then sleep until the next row
+                elapsed = (time.monotonic() - begin) * self.speed
+                end = int(np.searchsorted(t[index:end], t[first] + elapsed, "right")) + index
+                if end == index:
+                    wait = (t[index] - t[first] - elapsed) / self.speed
+                    self._stop_event.wait(min(wait, 0.1))
+                    continue
+            self.callback(rows_to_records(columns, index, end))
+            self.replayed += end - index
+            index = end
+        if self.on_done is not None:
+            self.on_done(self)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("info", "replay"))
+    parser.add_argument("path")
+    parser.add_argument("--start", type=float, help="seconds since the first sample")
+    parser.add_argument("--stop", type=float, help="seconds since the first sample")
+    parser.add_argument("--speed", default="1", help="replay factor or 'max'")
+    parser.add_argument("--out", help="write the replayed records as JSON lines to this file, - for stdout")
+    args = parser.parse_args()
+
+    recording = Recording(args.path)
+    if args.command == "info" and "kind" not in recording.columns:
+        data = recording.slice(args.start, args.stop)
+        print(f"windows: {len(data['t'])}, duration: {recording.duration:.1f}s, samples: {data['count'].sum()}")
+        if len(data["t"]):
+            print(
+                f"voltage min/mean/max: {data['min'].min():.2f} / {np.average(data['mean'], weights=data['count']):.2f}"
+                f" / {data['max'].max():.2f} V, below: {np.average(data['below'], weights=data['count']):.1%}"
+                f", above: {np.average(data['above'], weights=data['count']):.1%}"
+            )
+        return
+    if args.command == "info":
+        data = recording.slice(args.start, args.stop)
+        adc = data["kind"] == KIND_ADC
+        print(f"rows: {len(data['t'])}, duration: {recording.duration:.1f}s, adc: {adc.sum()}, pos: {(~adc).sum()}")
+        if adc.any():
+            volts = data["volts"][adc]
+            print(f"voltage min/mean/max: {volts.min():.2f} / {volts.mean():.2f} / {volts.max():.2f} V")
+        return
+
+    if "kind" not in recording.columns:
+        parser.error("only sample recordings can be replayed")
+    speed = None if args.speed == "max" else float(args.speed)
+    counts = {AdcFrame: 0, PosFrame: 0}
+    out = None
+    if args.out:
+        from telemetryServer import encode_records  # Importing the JSON encoding of the telemetry
+
+        out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+
+    def replayed(records):
+        for record in records:
+            counts[type(record)] += 1
+        if out is not None:
+            out.write(encode_records(records, time.time()))
+
+    replayer = Replayer(recording, replayed, speed, args.start, args.stop)
+    try:
+        replayer.start()
+        replayer.join()
+    finally:
+        if out is not None:
+            out.flush()
+            if out is not sys.stdout.buffer:
+                out.close()
+    elapsed = time.perf_counter() - replayer.started
+    print(
+        f"replayed {replayer.replayed} rows (adc: {counts[AdcFrame]}, pos: {counts[PosFrame]}) in {elapsed:.3f}s"
+        f" ({replayer.replayed / max(elapsed, 1e-9):.0f} rows/s)",
+        file=sys.stderr if args.out == "-" else sys.stdout,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Serial reader engine for CUBEcontrol
+Blocks on the serial port instead of polling it, reads everything that arrived
+in one chunk and splits the chunk into lines with an incremental byte buffer.
+SerialSelector does the same for many ports from a single thread.
+"""
+import os  # Importing the OS module for reading the port file descriptors
+import selectors  # Importing selectors to wait on many ports at once
+import threading  # Importing the threading module for the background reader thread
+from collections import deque  # Importing deque for the registration requests
+import serial  # Importing the PySerial library for communicating with serial devices
+from instrumentation import metrics  # Importing the process-wide latency metrics
+
+
+class LineFramer:
+    """Incremental byte-level line splitter.
+
+    Bytes are appended as they arrive, every complete line is returned decoded
+    without its trailing "\\n" ("\\r" from println() is kept). Invalid bytes are
+    replaced instead of dropping the whole line.
+    """
+
+    def __init__(self, encoding="utf-8", max_line=4096):
+        self.encoding = encoding
+        self.max_line = max_line
+        self.buffer = bytearray()
+
+    def feed(self, data) -> list:
+        buffer = self.buffer
+        buffer += data
+        end = buffer.rfind(b"\n")
+        if end < 0:
+            # never let a stream without line breaks grow the buffer forever
+            if len(buffer) > self.max_line:
+                line = buffer.decode(self.encoding, "replace")
+                buffer.clear()
+                return [line]
+            return []
+        # decode all complete lines at once, split points are always on a "\n"
+        # so multi-byte characters can never be cut in half
+        text = buffer[:end].decode(self.encoding, "replace")
+        del buffer[: end + 1]
+        return text.split("\n")
+
+    def reset(self) -> None:
+        self.buffer.clear()
+
+
+class SerialReader(threading.Thread):
+    """Background thread that blocks on the serial port and hands complete lines to a callback.
+
+    on_lines is called from the reader thread with a list of lines per received chunk.
+    on_error is called once if the port fails (e.g. the device was unplugged).
+    framer replaces the LineFramer, e.g. with a binaryTelemetry.FrameSplitter.
+    """
+
+    def __init__(self, device, on_lines, on_error=None, chunk_size=4096, framer=None):
+        super().__init__(name=f"SerialReader({device.port})", daemon=True)
+        self.device = device
+        self.on_lines = on_lines
+        self.on_error = on_error
+        self.chunk_size = chunk_size
+        self.framer = framer if framer is not None else LineFramer()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        device = self.device
+        framer = self.framer
+        chunk_size = self.chunk_size
+        try:
+            while not self._stop_event.is_set():
+                # read(1) blocks until at least one byte arrived (or the timeout passed),
+                # everything that is already waiting is fetched in the same call
+                data = device.read(min(max(device.in_waiting, 1), chunk_size))
+                if not data:
+                    continue
+                if metrics.enabled:
+                    metrics.count("bytes_read", len(data))
+                lines = framer.feed(data)
+                if lines:
+                    self.on_lines(lines)
+        except (serial.SerialException, OSError, TypeError) as e:
+            # TypeError is raised by pyserial if the port gets closed while reading
+            if not self._stop_event.is_set() and self.on_error is not None:
+                self.on_error(e)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        try:
+            # wake up a blocking read() so the thread can terminate right away
+            self.device.cancel_read()
+        except (AttributeError, NotImplementedError, serial.SerialException, OSError):
+            pass
+
+
+class _Channel:
+    __slots__ = ("device", "fd", "framer", "on_lines", "on_error", "bytes", "lines", "registered")
+
+    def __init__(self, device, on_lines, on_error, framer):
+        self.device = device
+        self.fd = device.fileno()
+        self.framer = framer if framer is not None else LineFramer()
+        self.on_lines = on_lines
+        self.on_error = on_error
+        self.bytes = 0
+        self.lines = 0
+        # set by the selector thread once the port is watched
+        self.registered = False
+
+
+class SerialSelector(threading.Thread):
+    """One thread receiving from many serial ports (POSIX only, ports need a fileno()).
+
+    register() and unregister() may be called from any thread, unregister() returns
+    once the selector thread no longer touches the port, so it can be closed safely.
+    register() raises RuntimeError once the selector is stopped. on_lines and on_error of a port are called from the selector thread like the
+    callbacks of a SerialReader.
+    """
+
+    def __init__(self, chunk_size=4096):
+        super().__init__(name="SerialSelector", daemon=True)
+        self.chunk_size = chunk_size
+        self.selector = selectors.DefaultSelector()
+        self.channels = {}
+        self.wakeups = 0
+        self._requests = deque()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        self.selector.register(self._wakeup_read, selectors.EVENT_READ)
+        self._stop_event = threading.Event()
+        # guards the wake-up pipe against writes after it was closed
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def register(self, device, on_lines, on_error=None, framer=None) -> None:
+        if not self.is_alive():
+            raise RuntimeError("the selector thread is not running")
+        channel = _Channel(device, on_lines, on_error, framer)
+        done = self._request("add", channel)
+        if done is not None:
+            done.wait()
+        if not channel.registered:
+            raise RuntimeError("the selector was stopped before the port was registered")
+
+    def unregister(self, device, timeout=5.0) -> None:
+        done = self._request("remove", device)
+        if done is not None:
+            done.wait(timeout)
+        elif self.is_alive() and threading.current_thread() is not self:
+            # stopping, the thread touches no port once it ended
+            self.join(timeout)
+
+    def _request(self, action, item):
+        # the event set once the request was handled, None if the selector is stopping or closed
+        done = threading.Event()
+        with self._lock:
+            if self._closed or self._stop_event.is_set():
+                return None
+            self._requests.append((action, item, done))
+            os.write(self._wakeup_write, b"\0")
+        return done
+
+    def _handle_requests(self) -> None:
+        try:
+            os.read(self._wakeup_read, 4096)
+        except BlockingIOError:
+            pass
+        while self._requests:
+            action, item, done = self._requests.popleft()
+            if action == "add":
+                self.selector.register(item.fd, selectors.EVENT_READ, item)
+                self.channels[item.device] = item
+                item.registered = True
+            else:
+                channel = self.channels.pop(item, None)
+                if channel is not None:
+                    self.selector.unregister(channel.fd)
+            done.set()
+
+    def run(self) -> None:
+        chunk_size = self.chunk_size
+        try:
+            while not self._stop_event.is_set():
+                for key, _ in self.selector.select():
+                    channel = key.data
+                    if channel is None:
+                        self._handle_requests()
+                        continue
+                    if channel.device not in self.channels:
+                        # removed by an earlier event of the same select() call
+                        continue
+                    self.wakeups += 1
+                    try:
+                        data = os.read(channel.fd, chunk_size)
+                        if not data:
+                            raise serial.SerialException("device reports readiness to read but returned no data")
+                    except BlockingIOError:
+                        continue
+                    except (serial.SerialException, OSError) as e:
+                        # e.g. the device was unplugged, stop watching the port and report it once
+                        del self.channels[channel.device]
+                        self.selector.unregister(channel.fd)
+                        if channel.on_error is not None:
+                            channel.on_error(e)
+                        continue
+                    channel.bytes += len(data)
+                    if metrics.enabled:
+                        metrics.count("bytes_read", len(data))
+                    lines = channel.framer.feed(data)
+                    if lines:
+                        channel.lines += len(lines)
+                        channel.on_lines(lines)
+        finally:
+            self._close()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._stop_event.set()
+            os.write(self._wakeup_write, b"\0")
+        if self.ident is None:
+            # never started, nobody else closes the selector
+            self._close()
+
+    def _close(self) -> None:
+        # the selector and the wake-up pipe, by the selector thread when it ends
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            # release everybody waiting for a request, register() sees its port was not added
+            while self._requests:
+                self._requests.popleft()[2].set()
+            self.selector.close()
+            os.close(self._wakeup_read)
+            os.close(self._wakeup_write)
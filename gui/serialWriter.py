@@ -0,0 +1,139 @@
+"""Serial writer engine for CUBEcontrol
+Writes queued lines to the serial port from a background thread, so a stalled
+USB-serial adapter can never block the caller. Relative Z jogs which are still
+waiting in the queue are merged into one summed move, everything else is written
+strictly in the order it was queued.
+
+The firmware parses one line per 100 ms, so a jog is held back while the previous
+jog is still unanswered. Clicks arriving in that time end up as one move.
+"""
+import threading  # Importing the threading module for the background writer thread
+from collections import deque  # Importing deque for the outbound queue
+import serial  # Importing the PySerial library for communicating with serial devices
+
+
+def jog_line(um) -> str:
+    # relative Z move as sent by the gui, the firmware parses the value with strtod()
+    return f"G1 Z{round(um, 6):.12g}\n"
+
+
+class OutboundLine:
+    """A queued line, jog is the distance in µm if the line may be merged with further jogs.
+
+    context is passed in by the owner of the writer, e.g. to find the reply belonging to the line.
+    """
+
+    __slots__ = ("text", "jog", "merged", "context")
+
+    def __init__(self, text, jog=None):
+        self.text = text
+        self.jog = jog
+        self.merged = 0
+        self.context = None
+
+
+class SerialWriter(threading.Thread):
+    """Background thread that writes queued lines to the serial port.
+
+    on_sent(line) is called from the writer thread after a line was written.
+    on_write_failed(line, error) is called if a write timed out, the line is dropped.
+    on_error(error) is called once if the port fails.
+    jog_done() has to be called by the owner when the reply of a written jog arrived,
+    a jog is never held longer than hold_timeout seconds.
+    """
+
+    def __init__(self, device, on_sent=None, on_write_failed=None, on_error=None, hold_timeout=1.0):
+        super().__init__(name=f"SerialWriter({device.port})", daemon=True)
+        self.device = device
+        self.on_sent = on_sent
+        self.on_write_failed = on_write_failed
+        self.on_error = on_error
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.queued = 0
+        self.merged = 0
+        self.sent = 0
+        self.timeouts = 0
+        self.hold_timeout = hold_timeout
+        self.jogs_in_flight = 0
+        self._stop_event = threading.Event()
+
+    def put(self, text, jog=None, context=None):
+        """Queue a line with its context, returns (line, merged).
+
+        A jog is merged into the last queued line if that is a jog as well and was not
+        written yet, the returned line is then the one already in the queue (with its
+        own context).
+        """
+        with self.condition:
+            self.queued += 1
+            if jog is not None and self.queue and self.queue[-1].jog is not None:
+                line = self.queue[-1]
+                line.jog += jog
+                line.text = jog_line(line.jog)
+                line.merged += 1
+                self.merged += 1
+                return line, True
+            line = OutboundLine(text, jog)
+            line.context = context
+            self.queue.append(line)
+            self.condition.notify()
+            return line, False
+
+    def jog_done(self) -> None:
+        with self.condition:
+            self.jogs_in_flight = max(self.jogs_in_flight - 1, 0)
+            self.condition.notify()
+
+    @property
+    def depth(self) -> int:
+        return len(self.queue)
+
+    def run(self) -> None:
+        device = self.device
+        queue = self.queue
+        condition = self.condition
+        while True:
+            with condition:
+                while not queue and not self._stop_event.is_set():
+                    condition.wait()
+                if self._stop_event.is_set():
+                    return
+                if queue[0].jog is not None and self.jogs_in_flight:
+                    # hold the jog (and everything behind it) until the previous one was answered
+                    if not condition.wait_for(
+                        lambda: not self.jogs_in_flight or self._stop_event.is_set(), self.hold_timeout
+                    ):
+                        self.jogs_in_flight = 0
+                    if self._stop_event.is_set():
+                        return
+                # taken under the lock, a jog can't be merged into a line that is being written
+                line = queue.popleft()
+                data = line.text.encode()
+                if line.jog is not None:
+                    self.jogs_in_flight += 1
+            try:
+                device.write(data)
+            except serial.SerialTimeoutException as e:
+                # the adapter stalled, drop whatever is left of the line in the output buffer
+                self.timeouts += 1
+                try:
+                    device.reset_output_buffer()
+                except (serial.SerialException, OSError):
+                    pass
+                if self.on_write_failed is not None:
+                    self.on_write_failed(line, e)
+                continue
+            except (serial.SerialException, OSError, TypeError) as e:
+                if not self._stop_event.is_set() and self.on_error is not None:
+                    self.on_error(e)
+                return
+            self.sent += 1
+            if self.on_sent is not None:
+                self.on_sent(line)
+
+    def stop(self) -> None:
+        # lines which were not written yet are discarded
+        with self.condition:
+            self._stop_event.set()
+            self.condition.notify()
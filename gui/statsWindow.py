@@ -0,0 +1,145 @@
+"""Live performance panel for CUBEcontrol
+Shows the counters and latency histograms of the instrumentation module once per
+second: count, rate since the last refresh and the p50/p95/p99/max of every
+histogram. Opening the panel switches the metrics on, they stay on until the
+"Enabled" box is cleared, so a closed panel does not reset a running measurement.
+"""
+import time  # Importing time for the counter rates
+import tkinter as tk  # Importing the Tkinter library for the window
+from tkinter import ttk, filedialog  # Importing the themed widgets and the save dialog
+from instrumentation import metrics as default_metrics  # Importing the process-wide latency metrics
+
+
+COLUMNS = (
+    ("count", "Count", 80),
+    ("rate", "Rate/s", 70),
+    ("p50", "p50", 70),
+    ("p95", "p95", 70),
+    ("p99", "p99", 70),
+    ("max", "Max", 70),
+    ("unit", "Unit", 45),
+)
+
+
+def _format(value) -> str:
+    if value >= 100:
+        return f"{value:.0f}"
+    if value >= 1:
+        return f"{value:.2f}"
+    return f"{value:.3f}"
+
+
+class StatsWindow:
+    """Toplevel with the metrics table, opened and closed like the ConfigWindow."""
+
+    def __init__(self, parent, metrics=None, interval=1000):
+        self.window = None
+        self.parent = parent
+        self.metrics = metrics if metrics is not None else default_metrics
+        self.interval = interval
+        self.after_handle = None
+        self.enabled = None
+        self.last_counters = {}
+        self.last_refresh = None
+
+    def open(self) -> None:
+        # Check if the window already exists, and if so, destroy it
+        if self.window and self.window.winfo_exists():
+            self.close()
+            return
+
+        self.metrics.enabled = True
+        self.window = tk.Toplevel(self.parent)
+        self.window.title("Stats")
+        self.window.transient(self.parent)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        inner_frame = ttk.Frame(self.window, padding=(10, 10, 10, 10))
+        inner_frame.pack(fill="both", expand=True)
+        inner_frame.columnconfigure(0, weight=1)
+        inner_frame.rowconfigure(0, weight=1)
+
+        self.table = ttk.Treeview(inner_frame, columns=[column[0] for column in COLUMNS], height=18)
+        self.table.heading("#0", text="Metric", anchor="w")
+        self.table.column("#0", width=210, stretch=True)
+        for name, text, width in COLUMNS:
+            self.table.heading(name, text=text)
+            self.table.column(name, width=width, anchor="e", stretch=False)
+        self.table.grid(column=0, row=0, columnspan=4, sticky="nesw")
+        scrollbar = ttk.Scrollbar(inner_frame, orient="vertical", command=self.table.yview)
+        scrollbar.grid(column=4, row=0, sticky="ns")
+        self.table.configure(yscrollcommand=scrollbar.set)
+
+        self.enabled = tk.BooleanVar(value=True)
+        ttk.Checkbutton(inner_frame, text="Enabled", variable=self.enabled, command=self.toggle).grid(
+            column=0, row=1, sticky="w", pady=(10, 0)
+        )
+        ttk.Button(inner_frame, text="Reset", command=self.reset).grid(column=2, row=1, pady=(10, 0), padx=5)
+        ttk.Button(inner_frame, text="Export JSON", command=self.export).grid(column=3, row=1, pady=(10, 0))
+
+        self.last_counters = {}
+        self.last_refresh = None
+        self.refresh()
+
+    def close(self) -> None:
+        if self.after_handle is not None:
+            self.parent.after_cancel(self.after_handle)
+            self.after_handle = None
+        if self.window is not None:
+            self.window.destroy()
+            self.window = None
+
+    def toggle(self) -> None:
+        self.metrics.enabled = self.enabled.get()
+
+    def reset(self) -> None:
+        self.metrics.reset()
+        self.last_counters = {}
+        self.table.delete(*self.table.get_children())
+        self.refresh(reschedule=False)
+
+    def export(self) -> None:
+        path = filedialog.asksaveasfilename(
+            parent=self.window,
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json")],
+            initialfile=time.strftime("cube-metrics-%Y%m%d-%H%M%S.json"),
+        )
+        if path:
+            self.metrics.export(path)
+
+    def refresh(self, reschedule=True) -> None:
+        now = time.monotonic()
+        elapsed = now - self.last_refresh if self.last_refresh else None
+        self.last_refresh = now
+
+        rows = {}
+        counters = dict(self.metrics.counters)
+        for name, value in counters.items():
+            rate = ""
+            if elapsed:
+                rate = _format((value - self.last_counters.get(name, 0)) / elapsed)
+            rows[name] = (value, rate, "", "", "", "", "")
+        for name, value in dict(self.metrics.gauges).items():
+            rows[name] = (_format(value), "", "", "", "", "", "")
+        for name, histogram in list(self.metrics.histograms.items()):
+            summary = histogram.summary()
+            rows[name] = (
+                summary["count"],
+                "",
+                _format(summary["p50"]),
+                _format(summary["p95"]),
+                _format(summary["p99"]),
+                _format(summary["max"]),
+                summary["unit"],
+            )
+        self.last_counters = counters
+
+        # rows are only inserted once and updated in place, so the selection and scrolling stay put
+        for index, name in enumerate(sorted(rows)):
+            if self.table.exists(name):
+                self.table.item(name, values=rows[name])
+            else:
+                self.table.insert("", index, iid=name, text=name, values=rows[name])
+        if reschedule:
+            self.after_handle = self.parent.after(self.interval, self.refresh)
@@ -0,0 +1,320 @@
+"""Parameter sweep runner for CUBEcontrol
+Runs every combination of a parameter grid as one auto mode run and spreads the
+runs over all connected machines, one run per machine at a time. A run is
+
+    M100 ontime offtime             generator on
+    M103 lower upper sens           auto mode on
+    ... for --duration seconds or until the axis advanced --depth mm
+    M104, M101                      auto mode and generator off, also on errors
+
+The grid is a JSON object of lists, missing parameters take the ConfigWindow defaults:
+
+    {"ontime": [2000, 4000], "offtime": [12000], "auto_sens": [5, 10, 20]}
+
+Every run gets its own telemetry recording in <out>/runs/<run id> and one line in
+<out>/results.jsonl with the parameters, the machine and the summary of the run.
+Runs with status "ok" in results.jsonl are skipped, so an interrupted sweep is
+resumed by starting it again with the same --out. Depth limited runs that hit
+--max-duration before --depth are "incomplete" and run again on a resume.
+
+The axis is not moved between runs: a run starts where the previous run on the
+same machine left it (--home homes once before the first run). start_pos_mm and
+start_homed of a result are the position and homing state when the run started.
+
+    python sweepRunner.py /dev/ttyUSB0 /dev/ttyUSB1 --grid grid.json --out sweeps/s1 --duration 60
+"""
+import argparse  # Importing argparse for the command line interface
+import asyncio  # Importing asyncio to run one worker per machine
+import itertools  # Importing itertools to expand the parameter grid
+import json  # Importing json for the grid, the plan and the results
+import os  # Importing the OS module for the result files
+import time  # Importing time for the run timestamps
+from connectionManager import ConnectionManager  # Importing the multi machine connection manager
+from recorder import Recorder, Recording, KIND_ADC  # Importing the memory-mapped telemetry recorder
+
+# order of the parameters in the run ids, defaults of the ConfigWindow
+PARAMETERS = {
+    "ontime": 4000,
+    "offtime": 12000,
+    "lower_thr": 3.5,
+    "upper_thr": 30.0,
+    "auto_sens": 10,
+}
+PLAN_FILE = "plan.json"
+RESULTS_FILE = "results.jsonl"
+RUNS_DIRECTORY = "runs"
+
+
+class SweepRun:
+    __slots__ = ("run_id", "params", "repeat")
+
+    def __init__(self, run_id, params, repeat=0):
+        self.run_id = run_id
+        self.params = params
+        self.repeat = repeat
+
+
+def expand_grid(grid, repeats=1) -> list:
+    """All combinations of the grid as SweepRuns, the run ids only depend on the parameters."""
+    unknown = set(grid) - set(PARAMETERS)
+    if unknown:
+        raise ValueError(f"unknown parameters: {', '.join(sorted(unknown))}")
+    values = [grid.get(name, [default]) for name, default in PARAMETERS.items()]
+    runs = []
+    for combination in itertools.product(*values):
+        params = dict(zip(PARAMETERS, combination))
+        key = "_".join(f"{name}={value}" for name, value in params.items())
+        for repeat in range(repeats):
+            runs.append(SweepRun(f"{key}_r{repeat}" if repeats > 1 else key, params, repeat))
+    return runs
+
+
+def load_results(path) -> dict:
+    """Latest result line per run id, lines cut off by a crash are ignored."""
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            results[result["run"]] = result
+    return results
+
+
+def summarize_recording(path) -> dict:
+    recording = Recording(path)
+    data = recording.slice()
+    adc = data["kind"] == KIND_ADC
+    volts = data["volts"][adc]
+    pos = data["pos"][~adc]
+    summary = {"samples": int(adc.sum()), "positions": int(len(pos))}
+    if len(volts):
+        summary.update(
+            volts_mean=round(float(volts.mean()), 3),
+            volts_std=round(float(volts.std()), 3),
+            volts_min=round(float(volts.min()), 3),
+            volts_max=round(float(volts.max()), 3),
+        )
+    if len(pos):
+        summary.update(pos_start=float(pos[0]), pos_end=float(pos[-1]), advance_mm=round(float(pos[-1] - pos[0]), 4))
+    return summary
+
+
+class SweepRunner:
+    """Distributes the runs of a sweep over the machines of a ConnectionManager.
+
+    duration limits every run in seconds, depth in mm of axis advance since the run
+    started (whatever comes first, at least one of them is needed). max_duration is
+    a safety limit for depth limited runs.
+    """
+
+    def __init__(self, manager, runs, out, duration=None, depth=None, max_duration=600.0, poll=0.1):
+        if duration is None and depth is None:
+            raise ValueError("a run needs a duration or a depth limit")
+        self.manager = manager
+        self.runs = runs
+        self.out = out
+        self.duration = duration
+        self.depth = depth
+        self.max_duration = max_duration
+        self.poll = poll
+        self.results_path = os.path.join(out, RESULTS_FILE)
+        self.completed = {}
+        # recorder per port of the runs in progress, filled from the reader side
+        self.recorders = {}
+        # callbacks receiving every result dict
+        self.listeners = []
+        os.makedirs(os.path.join(out, RUNS_DIRECTORY), exist_ok=True)
+        manager.listeners.append(self._record)
+
+    def pending(self) -> list:
+        self.completed = {
+            run_id: result for run_id, result in load_results(self.results_path).items() if result["status"] == "ok"
+        }
+        return [run for run in self.runs if run.run_id not in self.completed]
+
+    async def run(self, ports) -> list:
+        """Run all pending runs on the given (connected) ports, returns the results of this call.
+
+        A run given back by a lost machine and taken by another one is listed once, with the
+        result of its last attempt, results.jsonl keeps every attempt.
+        """
+        queue = asyncio.Queue()
+        for run in self.pending():
+            queue.put_nowait(run)
+        # run id -> result of the last attempt
+        results = {}
+        workers = [asyncio.ensure_future(self._worker(port, queue, results)) for port in ports]
+        finished = asyncio.ensure_future(queue.join())
+        waiting = {finished, *workers}
+        try:
+            # idle workers wait for runs given back by a lost machine until every run is done,
+            # or no machine is left to take the rest
+            while not finished.done() and not all(worker.done() for worker in workers):
+                done, waiting = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is not finished:
+                        task.result()
+        finally:
+            for task in (finished, *workers):
+                task.cancel()
+        return list(results.values())
+
+    async def _worker(self, port, queue, results) -> None:
+        device = self.manager.devices[port]
+        while device.connected:
+            run = await queue.get()
+            try:
+                result = await self.run_one(port, run)
+                results[run.run_id] = result
+                if result["status"] != "ok" and not device.connected:
+                    # give the run to the remaining machines, before it counts as done
+                    queue.put_nowait(run)
+            finally:
+                queue.task_done()
+
+    async def run_one(self, port, run) -> dict:
+        device = self.manager.devices[port]
+        summary = self.manager.summaries[port]
+        params = run.params
+        path = os.path.join(self.out, RUNS_DIRECTORY, run.run_id)
+        if os.path.exists(path):
+            # leftover of an interrupted attempt
+            os.rename(path, f"{path}.{int(time.time())}.partial")
+        result = {"run": run.run_id, "port": port, "repeat": run.repeat, **params, "started": time.time()}
+        # the axis is where the previous run left it
+        result["start_pos_mm"] = summary.pos_mm
+        result["start_homed"] = summary.homed
+        self.recorders[port] = Recorder(path)
+        try:
+            await device.generator_on(params["ontime"], params["offtime"])
+            await device.auto_mode(params["lower_thr"], params["upper_thr"], params["auto_sens"])
+            result["stop"] = await self._wait(device, summary)
+            # the safety limit ended the run before it reached --depth, a resume runs it again
+            result["status"] = "incomplete" if result["stop"] == "max_duration" else "ok"
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            await self._stop(device)
+            self.recorders.pop(port).close()
+        result["duration"] = round(time.time() - result["started"], 3)
+        result.update(summarize_recording(path))
+        with open(self.results_path, "a") as f:
+            f.write(json.dumps(result) + "\n")
+        if result["status"] == "ok":
+            self.completed[run.run_id] = result
+        for callback in self.listeners:
+            callback(result)
+        return result
+
+    async def _wait(self, device, summary) -> str:
+        started = time.monotonic()
+        start_pos = summary.pos_mm
+        limit = self.duration if self.duration is not None else self.max_duration
+        while True:
+            await asyncio.sleep(self.poll)
+            if not device.connected:
+                raise ConnectionError("machine disconnected")
+            if self.depth is not None and summary.pos_mm is not None:
+                if start_pos is None:
+                    start_pos = summary.pos_mm
+                elif summary.pos_mm - start_pos >= self.depth:
+                    return "depth"
+            if time.monotonic() - started >= limit:
+                return "duration" if self.duration is not None else "max_duration"
+
+    async def _stop(self, device) -> None:
+        # always try both, even if the run failed or was cancelled
+        for stop in (device.auto_off, device.generator_off):
+            if not device.connected:
+                return
+            try:
+                await stop()
+            except Exception:
+                pass
+
+    def _record(self, port, records) -> None:
+        # reader side
+        recorder = self.recorders.get(port)
+        if recorder is not None:
+            recorder.append_records(records)
+
+
+def load_plan(out, grid=None, repeats=1) -> list:
+    """Runs of the sweep in out, the grid is stored on the first start and must not change."""
+    path = os.path.join(out, PLAN_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            plan = json.load(f)
+        if grid is not None and (grid != plan["grid"] or repeats != plan["repeats"]):
+            raise ValueError(f"{out} belongs to a sweep with a different grid, use another --out")
+    elif grid is None:
+        raise ValueError(f"{out} has no sweep yet, a --grid is needed")
+    else:
+        os.makedirs(out, exist_ok=True)
+        plan = {"grid": grid, "repeats": repeats, "created": time.time()}
+        with open(path, "w") as f:
+            json.dump(plan, f, indent=2)
+    return expand_grid(plan["grid"], plan["repeats"])
+
+
+async def sweep(args) -> int:
+    grid = None
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    runs = load_plan(args.out, grid, args.repeats)
+    # the devices live on the loop of asyncio.run(), so Ctrl+C cancels the runs cleanly
+    manager = ConnectionManager()
+    runner = SweepRunner(manager, runs, args.out, args.duration, args.depth, args.max_duration)
+    runner.listeners.append(lambda result: print(json.dumps(result), flush=True))
+    pending = runner.pending()
+    print(json.dumps({"runs": len(runs), "done": len(runs) - len(pending), "machines": len(args.ports)}), flush=True)
+    if not pending:
+        return 0
+    try:
+        connected = await manager.connect_many(args.ports, args.restart, args.interval)
+        ports = [port for port, device in zip(args.ports, connected) if not isinstance(device, Exception)]
+        for port, device in zip(args.ports, connected):
+            if isinstance(device, Exception):
+                print(json.dumps({"port": port, "error": f"{type(device).__name__}: {device}"}), flush=True)
+        if args.home:
+            await asyncio.gather(*(manager.devices[port].home() for port in ports))
+        results = await runner.run(ports)
+    finally:
+        await manager.disconnect_all()
+        manager.shutdown()
+    failed = sum(1 for result in results if result["status"] != "ok")
+    return 1 if failed or runner.pending() else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("ports", nargs="+", help="serial ports of the machines")
+    parser.add_argument("--out", required=True, help="directory of the sweep, an existing sweep is resumed")
+    parser.add_argument("--grid", help="JSON file with the parameter grid (stored in the sweep on the first start)")
+    parser.add_argument("--repeats", type=int, default=1, help="runs per parameter combination")
+    parser.add_argument("--duration", type=float, help="seconds per run")
+    parser.add_argument("--depth", type=float, help="mm of axis advance per run")
+    parser.add_argument("--max-duration", type=float, default=600.0, help="safety limit of depth limited runs")
+    parser.add_argument("--interval", type=int, default=100, help="report interval in ms (default 100)")
+    parser.add_argument("--restart", action="store_true", help="restart the machines on connect")
+    parser.add_argument("--home", action="store_true", help="home all machines before the first run")
+    args = parser.parse_args()
+    if args.duration is None and args.depth is None:
+        parser.error("--duration or --depth is needed")
+    try:
+        raise SystemExit(asyncio.run(sweep(args)))
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        # the workers already stopped auto mode and generator of their runs
+        raise SystemExit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Telemetry decoder for CUBEcontrol
+Classifies every line sent by the firmware in a single pass by its prefix and turns
+it into a small typed record:
+
+    <ADC> raw:1543 calc:11.91V                  -> AdcFrame(raw, volts)
+    <POS> homed:1 steps:40211 pos:10.0527       -> PosFrame(homed, steps, pos_mm)
+    <ERROR> Only Z-Axis is supported!           -> LogLine("ERROR", text)
+
+The level prefixes are the ones written by printLogLevel() in src/logging.cpp.
+"""
+
+# log levels in the order of printLogLevel(), the index is the firmware log level
+LOG_LEVELS = ("SILENT", "FATAL", "ERROR", "WARNING", "INFO", "TRACE", "VERBOSE")
+
+# pseudo level for lines terminated by "\r\n": the println() of the command parser
+# response after every command and messages of the esp boot rom
+ESP = "ESP"
+
+
+class Record:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class AdcFrame(Record):
+    __slots__ = ("raw", "volts")
+
+    def __init__(self, raw, volts):
+        self.raw = raw
+        self.volts = volts
+
+
+class PosFrame(Record):
+    __slots__ = ("homed", "steps", "pos_mm")
+
+    def __init__(self, homed, steps, pos_mm):
+        self.homed = homed
+        self.steps = steps
+        self.pos_mm = pos_mm
+
+
+class LogLine(Record):
+    """Any line that is not telemetry.
+
+    level is one of LOG_LEVELS, ESP for "\\r\\n" terminated lines or None for
+    plain text without prefix (including malformed telemetry).
+    """
+
+    __slots__ = ("level", "text")
+
+    def __init__(self, level, text):
+        self.level = level
+        self.text = text
+
+    @property
+    def is_error(self) -> bool:
+        return self.level == "ERROR" or self.level == "FATAL"
+
+    def __str__(self) -> str:
+        # the line as it was printed by the firmware
+        if self.level is None or self.level == ESP:
+            return self.text
+        if self.level == "SILENT":
+            return f"SILENT {self.text}"
+        return f"<{self.level}> {self.text}"
+
+
+# "<ERROR>" -> "ERROR"
+_LEVELS = {f"<{level}>": level for level in LOG_LEVELS[1:]}
+
+
+def decode_line(line: str):
+    """Decode one line (without "\\n") into an AdcFrame, PosFrame or LogLine."""
+    # one partition for every kind of line, telemetry is compared first as it is most of the traffic
+    head, space, body = line.partition(" ")
+    if head == "<ADC>":
+        # "raw:1543 calc:11.91V "
+        raw, _, calc = body.partition(" calc:")
+        raw = raw[4:]
+        if raw.isdigit():
+            try:
+                return AdcFrame(int(raw), float(calc.rstrip()[:-1]))
+            except ValueError:
+                pass
+        return LogLine(None, line)
+    if head == "<POS>":
+        # "homed:1 steps:40211 pos:10.0527"
+        parts = body.split(" ")
+        try:
+            return PosFrame(parts[0] == "homed:1", int(parts[1][6:]), float(parts[2][4:]))
+        except (ValueError, IndexError):
+            return LogLine(None, line)
+    level = _LEVELS.get(head)
+    if level is not None:
+        return LogLine(level, body)
+    if line[:1] == "<":
+        return LogLine(None, line)
+    if line[-1:] == "\r":
+        return LogLine(ESP, line[:-1])
+    # the movement task prints single "." while waiting, they end up in front of the next line
+    if line[:1] == ".":
+        return decode_line(line.lstrip("."))
+    if head == "SILENT" and space:
+        return LogLine("SILENT", body)
+    return LogLine(None, line)
+
+
+def decode_lines(lines) -> list:
+    # binary frames arrive already decoded between the lines, see binaryTelemetry.py
+    return [decode_line(line) if type(line) is str else line for line in lines]
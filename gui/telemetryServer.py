@@ -0,0 +1,408 @@
+"""Local telemetry fan-out for CUBEcontrol
+One process owns the serial port (the gui or "telemetryServer.py serve") and
+broadcasts the decoded records of its CubeDevice to any number of local clients
+over TCP or a Unix socket, one JSON object per line:
+
+    {"type": "hello", "port": "/dev/ttyUSB0", "commands": false, "state": {...}}
+    {"type": "adc", "t": 1718000000.123, "raw": 1543, "volts": 11.91}
+    {"type": "pos", "t": 1718000000.123, "homed": true, "steps": 40211, "pos": 10.0527}
+    {"type": "log", "t": 1718000000.123, "level": "INFO", "text": "-> G1 Z10"}
+    {"type": "sent", "t": 1718000000.123, "text": "G1 Z10\\n"}
+    {"type": "connection", "event": "lost", "reason": "...", "elapsed": 0.0}
+    {"type": "state", "changes": {"homing": true}}
+    {"type": "dropped", "chunks": 12}
+
+Every received chunk is encoded once on the reader side and queued for every client
+in a bounded buffer, a client that doesn't keep up loses the oldest chunks (and gets
+a "dropped" line) but never stalls the reader or the other clients. Hello, state
+and replies are never dropped.
+
+Commands are arbitrated by the owner: they are only accepted when the server was
+started with commands=True, and then only from the one client holding control.
+They go through the FIFO of the owner's CubeDevice like its own commands:
+
+    {"op": "control"}                       -> {"type": "control", "granted": true}
+    {"op": "command", "id": 1, "line": "G28"} -> {"type": "reply", "id": 1, "ok": true, ...}
+    {"op": "release"}
+
+    python telemetryServer.py serve /dev/ttyUSB0 --listen 127.0.0.1:8765 --commands
+    python telemetryServer.py watch 127.0.0.1:8765
+"""
+import argparse  # Importing argparse for the command line interface
+import asyncio  # Importing asyncio for the socket server
+import json  # Importing json for the line protocol
+import os  # Importing the OS module to remove stale unix sockets
+import sys  # Importing sys to write the watched stream
+import time  # Importing time for the chunk timestamps
+from collections import deque  # Importing deque for the bounded client buffers
+from cubeDevice import CubeDevice, CommandError, ConnectionEvent, SentLine  # Importing the headless device core
+from deviceState import BOOT_STATE, CommandRejected  # Importing the mirror of the firmware state
+from telemetry import AdcFrame, PosFrame, LogLine  # Importing the decoded telemetry records
+from instrumentation import metrics  # Importing the process-wide latency metrics
+
+
+def parse_address(address):
+    """("unix", path) for paths and "unix:path", ("tcp", (host, port)) for "host:port" or a port."""
+    if address.startswith("unix:"):
+        return "unix", address[5:]
+    if "/" in address:
+        return "unix", address
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+def encode_message(message) -> bytes:
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def encode_records(records, t) -> bytes:
+    """One JSON line per record, telemetry is formatted without json.dumps."""
+    t = f"{t:.3f}"
+    lines = []
+    for record in records:
+        cls = type(record)
+        if cls is AdcFrame:
+            lines.append(f'{{"type":"adc","t":{t},"raw":{record.raw},"volts":{record.volts}}}\n')
+        elif cls is PosFrame:
+            homed = "true" if record.homed else "false"
+            lines.append(f'{{"type":"pos","t":{t},"homed":{homed},"steps":{record.steps},"pos":{record.pos_mm}}}\n')
+        elif cls is LogLine:
+            level = json.dumps(record.level)
+            lines.append(f'{{"type":"log","t":{t},"level":{level},"text":{json.dumps(record.text)}}}\n')
+        elif cls is SentLine:
+            lines.append(f'{{"type":"sent","t":{t},"text":{json.dumps(record.text)}}}\n')
+        elif cls is ConnectionEvent:
+            message = {"type": "connection", "event": record.event, "reason": record.reason, "elapsed": record.elapsed}
+            lines.append(json.dumps(message, separators=(",", ":")) + "\n")
+    return "".join(lines).encode("utf-8")
+
+
+class Client:
+    """One connected socket: bounded telemetry buffer plus the replies that are never dropped."""
+
+    __slots__ = ("name", "writer", "buffer", "replies", "dropped", "ready")
+
+    def __init__(self, name, writer, maxsize):
+        self.name = name
+        self.writer = writer
+        self.buffer = deque(maxlen=maxsize)
+        self.replies = deque()
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def put(self, data) -> bool:
+        # True if the oldest chunk was dropped for it
+        full = len(self.buffer) == self.buffer.maxlen
+        if full:
+            self.dropped += 1
+        self.buffer.append(data)
+        self.ready.set()
+        return full
+
+    def reply(self, message) -> None:
+        self.replies.append(encode_message(message))
+        self.ready.set()
+
+
+class TelemetryServer:
+    """Fans the records of a connected CubeDevice out to local socket clients.
+
+    Runs on the event loop of the device. buffer is the number of received chunks
+    queued per client before the oldest are dropped.
+    """
+
+    def __init__(self, device, commands=False, buffer=256):
+        self.device = device
+        self.commands = commands
+        self.buffer = buffer
+        self.clients = []
+        self.controller = None
+        self.server = None
+        self.path = None
+        self.loop = None
+        # chunks dropped for slow clients since the start
+        self.dropped = 0
+        self._served = 0
+
+    async def start(self, address) -> None:
+        self.loop = asyncio.get_running_loop()
+        kind, where = parse_address(address)
+        if kind == "unix":
+            if os.path.exists(where):
+                os.remove(where)
+            self.server = await asyncio.start_unix_server(self._serve, where)
+            self.path = where
+        else:
+            self.server = await asyncio.start_server(self._serve, *where)
+        self.device.add_listener(self._on_records)
+        self.device.state.add_listener(self._state_changed)
+
+    async def close(self) -> None:
+        self.device.remove_listener(self._on_records)
+        self.device.state.remove_listener(self._state_changed)
+        if self.server is not None:
+            self.server.close()
+            for client in list(self.clients):
+                client.writer.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    @property
+    def addresses(self) -> list:
+        return [socket.getsockname() for socket in self.server.sockets] if self.server is not None else []
+
+    # ------------------------------------------------------------------ broadcast
+
+    def _on_records(self, records) -> None:
+        # reader thread (writer thread for SentLine, event loop for ConnectionEvent)
+        if not self.clients:
+            return
+        data = encode_records(records, time.time())
+        if data:
+            self.loop.call_soon_threadsafe(self._broadcast, data)
+
+    def _broadcast(self, data) -> None:
+        dropped = 0
+        for client in self.clients:
+            dropped += client.put(data)
+        if dropped:
+            self.dropped += dropped
+            if metrics.enabled:
+                metrics.count("fanout_dropped", dropped)
+
+    def _state_changed(self, state, changes) -> None:
+        # event loop
+        for client in self.clients:
+            client.reply({"type": "state", "changes": changes})
+
+    # ------------------------------------------------------------------ clients
+
+    async def _serve(self, reader, writer) -> None:
+        self._served += 1
+        client = Client(f"client{self._served}", writer, self.buffer)
+        state = self.device.state
+        client.reply(
+            {
+                "type": "hello",
+                "port": self.device.port,
+                "client": client.name,
+                "commands": self.commands,
+                "state": {name: getattr(state, name) for name in BOOT_STATE},
+            }
+        )
+        self.clients.append(client)
+        sender = asyncio.create_task(self._send(client))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    client.reply({"type": "error", "error": "invalid JSON"})
+                    continue
+                self._request(client, request)
+        except (ConnectionError, ValueError):
+            # reset by the peer or a line over the stream limit
+            pass
+        finally:
+            self.clients.remove(client)
+            if self.controller is client:
+                self.controller = None
+            sender.cancel()
+            writer.close()
+
+    async def _send(self, client) -> None:
+        writer = client.writer
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                while client.replies or client.buffer:
+                    if client.replies:
+                        writer.write(client.replies.popleft())
+                    else:
+                        if client.dropped:
+                            writer.write(encode_message({"type": "dropped", "chunks": client.dropped}))
+                            client.dropped = 0
+                        writer.write(client.buffer.popleft())
+                    # waits only while the socket buffer of a slow client is full, meanwhile its buffer drops
+                    await writer.drain()
+        except ConnectionError:
+            pass
+
+    def _request(self, client, request) -> None:
+        op = request.get("op")
+        if op == "control":
+            if self.commands and self.controller in (None, client):
+                self.controller = client
+            holder = self.controller.name if self.controller is not None else None
+            client.reply({"type": "control", "granted": self.controller is client, "holder": holder})
+        elif op == "release":
+            if self.controller is client:
+                self.controller = None
+            client.reply({"type": "control", "granted": False, "holder": None})
+        elif op == "command":
+            asyncio.create_task(self._command(client, request.get("id"), str(request.get("line", ""))))
+        else:
+            client.reply({"type": "error", "error": f"unknown op {op!r}"})
+
+    async def _command(self, client, request_id, line) -> None:
+        reply = {"type": "reply", "id": request_id, "line": line, "ok": False}
+        if not self.commands:
+            reply["error"] = "commands are disabled on this server"
+        elif self.controller is not client:
+            reply["error"] = "not in control"
+        else:
+            started = time.perf_counter()
+            try:
+                result = await self.device.command(line)
+                reply["ok"] = True
+                reply["notice"] = result.notice.text if result.notice is not None else None
+            except CommandError as e:
+                reply["error"] = e.reply.error.text
+            except (CommandRejected, ConnectionError, asyncio.TimeoutError) as e:
+                reply["error"] = f"{type(e).__name__}: {e}"
+            reply["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        client.reply(reply)
+
+
+class TelemetryClient:
+    """Asyncio client of a TelemetryServer: telemetry messages as dicts and commands."""
+
+    def __init__(self, maxsize=10000):
+        self.reader = None
+        self.writer = None
+        self.hello = None
+        self.messages = asyncio.Queue(maxsize)
+        self._replies = {}
+        self._controls = deque()
+        self._next_id = 0
+        self._task = None
+
+    async def connect(self, address) -> dict:
+        kind, where = parse_address(address)
+        if kind == "unix":
+            self.reader, self.writer = await asyncio.open_unix_connection(where)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(*where)
+        self.hello = json.loads(await self.reader.readline())
+        self._task = asyncio.create_task(self._read())
+        return self.hello
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+    async def control(self) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        self._controls.append(future)
+        self._write({"op": "control"})
+        return (await future)["granted"]
+
+    async def command(self, line, timeout=30.0) -> dict:
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._replies[self._next_id] = future
+        self._write({"op": "command", "id": self._next_id, "line": line})
+        return await asyncio.wait_for(future, timeout)
+
+    def _write(self, message) -> None:
+        self.writer.write(encode_message(message))
+
+    async def _read(self) -> None:
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                await self.messages.put(None)
+                return
+            message = json.loads(line)
+            kind = message["type"]
+            if kind == "reply":
+                future = self._replies.pop(message["id"], None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+            elif kind == "control" and self._controls:
+                self._controls.popleft().set_result(message)
+            else:
+                if self.messages.full():
+                    self.messages.get_nowait()
+                self.messages.put_nowait(message)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.messages.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+
+async def serve(args) -> int:
+    device = CubeDevice(args.port, reconnect=args.reconnect)
+    await device.connect()
+    await device.initialize(restart=args.restart, report_interval=args.interval)
+    server = TelemetryServer(device, commands=args.commands, buffer=args.buffer)
+    await server.start(args.listen)
+    print(json.dumps({"port": args.port, "listen": [str(address) for address in server.addresses]}), flush=True)
+    loop = asyncio.get_running_loop()
+    failed = asyncio.Event()
+    device.add_listener(
+        lambda records: any(type(record) is ConnectionEvent and record.event == "failed" for record in records)
+        and loop.call_soon_threadsafe(failed.set)
+    )
+    try:
+        # serve until the port is gone for good
+        while not failed.is_set() and (device.connected or device.reconnect):
+            await asyncio.sleep(0.5)
+    finally:
+        await server.close()
+        await device.disconnect()
+    return 0
+
+
+async def watch(args) -> int:
+    client = TelemetryClient()
+    hello = await client.connect(args.address)
+    sys.stdout.write(json.dumps(hello) + "\n")
+    if args.command:
+        if not await client.control():
+            print(json.dumps({"type": "error", "error": "control not granted"}), flush=True)
+            return 1
+        for line in args.command:
+            reply = await client.command(line)
+            sys.stdout.write(json.dumps(reply) + "\n")
+    async for message in client:
+        sys.stdout.write(json.dumps(message) + "\n")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="mode", required=True)
+    serve_parser = commands.add_parser("serve", help="own a serial port and broadcast its telemetry")
+    serve_parser.add_argument("port", help="serial port of the machine")
+    serve_parser.add_argument("--listen", default="127.0.0.1:8765", help="host:port or path of a unix socket")
+    serve_parser.add_argument("--commands", action="store_true", help="accept commands from the controlling client")
+    serve_parser.add_argument("--buffer", type=int, default=256, help="received chunks queued per client")
+    serve_parser.add_argument("--interval", type=int, default=100, help="report interval in ms (default 100)")
+    serve_parser.add_argument("--restart", action="store_true", help="restart the machine on connect")
+    serve_parser.add_argument("--reconnect", type=float, default=3.0, help="seconds to re-attach a lost port")
+    watch_parser = commands.add_parser("watch", help="print the stream of a server as JSON lines")
+    watch_parser.add_argument("address", help="host:port or path of a unix socket")
+    watch_parser.add_argument("--command", action="append", help="take control and send this line first")
+    args = parser.parse_args()
+    try:
+        raise SystemExit(asyncio.run(serve(args) if args.mode == "serve" else watch(args)))
+    except (KeyboardInterrupt, BrokenPipeError):
+        raise SystemExit(130)
+
+
+if __name__ == "__main__":
+    main()
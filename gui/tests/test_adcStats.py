@@ -0,0 +1,109 @@
+"""AdcAggregator windows and the threshold counters of src/adc.cpp
+
+    python -m pytest gui/tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from adcStats import AdcAggregator, threshold_counter  # noqa: E402
+from telemetry import AdcFrame, PosFrame  # noqa: E402
+
+
+def counter_loop(steps, start):
+    # the counter of the adc interrupt, but stopping at zero instead of wrapping, the peak is
+    # taken over the samples of the window, not the value carried over
+    counter = start
+    peak = 0
+    for step in steps:
+        counter = max(counter + step, 0)
+        peak = max(peak, counter)
+    return peak, counter
+
+
+def adc(*volts):
+    return [AdcFrame(0, v) for v in volts]
+
+
+@pytest.mark.parametrize(
+    "steps, start",
+    [
+        ([1, 1, 1], 0),
+        ([-1, -1, -1], 0),
+        ([-1, -1, 1, 1], 0),
+        ([1, -1, -1, -1, 1, 0, 1], 0),
+        ([-1, -1, -1, -1, 1], 2),
+        ([0, 0, -1], 5),
+    ],
+)
+def test_threshold_counter_stops_at_zero(steps, start):
+    assert threshold_counter(np.array(steps), start) == counter_loop(steps, start)
+
+
+def test_threshold_counter_random():
+    rng = np.random.default_rng(1)
+    for start in (0, 3, 50):
+        steps = rng.integers(-1, 2, 1000)
+        assert threshold_counter(steps, start) == counter_loop(steps.tolist(), start)
+
+
+def test_window_statistics():
+    windows = []
+    aggregator = AdcAggregator(lambda: (1.0, 5.0, 30.0), windows.append)
+    volts = [2.0, 4.0, 10.0, 20.0, 40.0]
+    assert aggregator.append_records(adc(*volts) + [PosFrame(True, 0, 0.0)], t=100.0) == []
+    # the window is closed by the first call a window length after it started
+    [window] = aggregator.append_records([], t=101.0)
+    assert windows == [window]
+    assert window.t == 101.0
+    assert window.count == 5
+    assert (window.min, window.max) == (2.0, 40.0)
+    assert window.mean == pytest.approx(np.mean(volts))
+    assert window.std == pytest.approx(np.std(volts))
+    assert (window.below, window.above) == (0.4, 0.2)
+    # low: +1 +1 -1 -1 0, high: 0 0 -1 -1 +1
+    assert (window.counter_l, window.counter_h) == (2, 1)
+    assert (aggregator.counter_l, aggregator.counter_h) == (0, 1)
+
+
+def test_counters_carry_over_and_saturate():
+    aggregator = AdcAggregator(lambda: (1.0, 5.0, 30.0))
+    aggregator.append_records(adc(1.0, 1.0, 1.0), t=0.0)
+    [window] = aggregator.append_records([], t=1.0)
+    assert (window.counter_l, aggregator.counter_l) == (3, 3)
+    # the low counter continues from 3, the high counter stays at zero instead of wrapping
+    aggregator.append_records(adc(10.0, 1.0, 10.0, 10.0, 10.0, 10.0, 10.0), t=1.5)
+    [window] = aggregator.append_records([], t=2.0)
+    assert (window.counter_l, aggregator.counter_l) == (3, 0)
+    assert (window.counter_h, aggregator.counter_h) == (0, 0)
+    aggregator.reset()
+    assert (aggregator.counter_l, aggregator.counter_h) == (0, 0)
+
+
+def test_settings_apply_from_the_next_window():
+    settings = [(1.0, 5.0, 30.0)]
+    aggregator = AdcAggregator(lambda: settings[-1])
+    aggregator.append_records(adc(10.0), t=0.0)
+    settings.append((1.0, 15.0, 30.0))
+    [window] = aggregator.append_records(adc(10.0), t=1.0)
+    assert window.below == 0.0
+    aggregator.append_records(adc(10.0), t=1.5)
+    [window] = aggregator.append_records([], t=2.0)
+    assert window.below == 1.0
+
+
+def test_block_overflow_summarises_early():
+    aggregator = AdcAggregator(lambda: (1.0, 5.0, 30.0), capacity=4)
+    assert aggregator.append_records(adc(10.0, 10.0, 10.0), t=0.0) == []
+    [window] = aggregator.append_records(adc(1.0, 1.0, 1.0), t=0.1)
+    assert (window.count, window.mean) == (3, 10.0)
+    # more samples than the block holds: only the last ones are kept
+    [window] = aggregator.append_records(adc(*range(10)), t=0.2)
+    assert window.count == 3
+    [window] = aggregator.append_records([], t=1.0)
+    assert (window.count, window.min, window.max) == (4, 6.0, 9.0)
@@ -0,0 +1,88 @@
+"""FrameSplitter on hand-made byte streams with binary frames and text lines
+
+    python -m pytest gui/tests
+"""
+import os
+import sys
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from binaryTelemetry import FrameSplitter, crc16, encode_adc, encode_pos  # noqa: E402
+from telemetry import AdcFrame, PosFrame  # noqa: E402
+
+
+def feed(data, chunk_size=None):
+    splitter = FrameSplitter()
+    chunk_size = chunk_size or len(data)
+    items = []
+    for offset in range(0, len(data), chunk_size):
+        items += splitter.feed(data[offset : offset + chunk_size])
+    return items, splitter
+
+
+def frames(items):
+    # (type name, raw or steps) of the decoded frames, text lines left out
+    return [
+        (type(item).__name__, item.raw if type(item) is AdcFrame else item.steps)
+        for item in items
+        if type(item) is not str
+    ]
+
+
+def test_crc_is_ccitt_false():
+    assert crc16(b"123456789") == 0x29B1
+
+
+def test_resync_after_garbage():
+    # a stray sync byte with an unknown type and one right before the end of the garbage
+    data = b"noise \xa5\x07 more\xa5" + encode_adc(1, 1600) + encode_pos(1, True, 4000)
+    items, splitter = feed(data)
+    assert frames(items) == [("AdcFrame", 1600), ("PosFrame", 4000)]
+    assert items[1].pos_mm == 1.0
+    assert splitter.stats() == {"frames": 2, "crc_errors": 0, "lost": 0, "restarts": 0}
+
+
+def test_corrupted_sync_byte_is_text():
+    frame = encode_adc(1, 1600)
+    items, splitter = feed(b"\xa4" + frame[1:] + b"\n" + encode_adc(2, 1700))
+    assert frames(items) == [("AdcFrame", 1700)]
+    assert len([item for item in items if type(item) is str]) == 1
+    assert splitter.frames == 1
+
+
+def test_bad_crc_is_rejected():
+    frame = bytearray(encode_pos(5, False, -1234))
+    frame[-1] ^= 0xFF
+    items, splitter = feed(bytes(frame) + b"\n" + encode_pos(6, False, -1235))
+    assert frames(items) == [("PosFrame", -1235)]
+    assert splitter.crc_errors == 1
+    assert splitter.lost == 0
+
+
+def test_sequence_gaps_are_counted_per_type():
+    data = encode_adc(1, 100) + encode_pos(40, True, 0) + encode_adc(4, 100) + encode_pos(41, True, 0)
+    # the 16 bit counter wraps without a gap
+    data += encode_adc(0xFFFF, 100) + encode_adc(0, 100)
+    items, splitter = feed(data)
+    assert len(frames(items)) == 6
+    # adc 2 and 3 missing, the jump from 4 to 0xFFFF looks like a step back: counted as a restart
+    assert splitter.lost == 2
+    assert splitter.restarts == 1
+
+
+def test_frame_inside_text_line():
+    data = b"[INFO] moving" + encode_pos(1, True, 8000) + b" to 2.0\n"
+    items, _ = feed(data)
+    assert [type(item) for item in items] == [PosFrame, str]
+    assert items[1] == "[INFO] moving to 2.0"
+
+
+def test_frame_split_across_chunks():
+    data = b"line one\n" + encode_adc(1, 2000) + b"line two\n" + encode_pos(2, True, 400) + encode_adc(2, 2100)
+    expected = [("AdcFrame", 2000), ("PosFrame", 400), ("AdcFrame", 2100)]
+    for chunk_size in range(1, 12):
+        items, splitter = feed(data, chunk_size)
+        assert frames(items) == expected
+        assert [item for item in items if type(item) is str] == ["line one", "line two"]
+        assert splitter.stats() == {"frames": 3, "crc_errors": 0, "lost": 0, "restarts": 0}
@@ -0,0 +1,233 @@
+"""CubeDevice against the simulator (cubeSim.py) on a pty, Linux only
+
+    python -m pytest gui/tests
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from cubeDevice import AttachError, ConnectionEvent, CubeDevice, SentLine  # noqa: E402
+from cubeSim import CubeSimulator  # noqa: E402
+from programStreamer import ProgramStreamer, parse_program  # noqa: E402
+from telemetry import PosFrame  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs a pty (Linux)")
+
+
+class LegacySimulator(CubeSimulator):
+    # autoMode() before the fix: Serial.println("end auto mode\n")
+    def cmd_M104(self):
+        auto_mode = self.auto_mode
+        self.auto_mode = False
+        super().cmd_M104()
+        if auto_mode:
+            self.write(b"end auto mode\n\r\n")
+
+    commands = {**CubeSimulator.commands, "M104": cmd_M104}
+
+
+@pytest.fixture(params=[CubeSimulator, LegacySimulator], ids=["firmware", "legacy"])
+def link(request, tmp_path):
+    simulator = request.param(parser_tick=0.01)
+    link = simulator.start(str(tmp_path / "ttyCUBE"))
+    yield link
+    simulator.stop()
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 30))
+
+
+def test_pipelined_replies_after_auto_mode(link):
+    async def main():
+        device = CubeDevice(link, timeout=5.0)
+        await device.connect()
+        try:
+            await device.initialize(restart=False, report_interval=1000)
+            await device.generator_on(1000, 1000)
+            await device.auto_mode(5, 30, 10)
+            # without waiting for the replies, like the program streamer
+            futures = [await device.send(line) for line in ("M104", "M101", "M114", "G91")]
+            replies = await asyncio.gather(*futures)
+            await device.command("M114")
+        finally:
+            await device.disconnect()
+        return replies
+
+    replies = run(main())
+    notices = [reply.notice.text if reply.notice is not None else None for reply in replies]
+    assert notices[0].startswith("-> M103 stop auto mode")
+    assert notices[1].startswith("-> M101 set PWM off")
+    assert notices[2].startswith("-> M114 ")
+    assert notices[3].startswith("-> G91 ")
+    assert all(reply.error is None for reply in replies)
+
+
+class HangingSimulator(CubeSimulator):
+    # M0 without a boot line afterwards
+    def cmd_M0(self):
+        pass
+
+    commands = {**CubeSimulator.commands, "M0": cmd_M0}
+
+
+def test_commands_after_restart_timeout(tmp_path):
+    simulator = HangingSimulator(parser_tick=0.01)
+    link = simulator.start(str(tmp_path / "ttyCUBE"))
+
+    async def main():
+        device = CubeDevice(link, timeout=2.0)
+        await device.connect()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await device.restart(timeout=0.3)
+            return await device.status()
+        finally:
+            await device.disconnect()
+
+    try:
+        reply = run(main())
+    finally:
+        simulator.stop()
+    assert reply.notice.text.startswith("-> M114 ")
+
+
+def test_disconnect_with_jog_in_flight(tmp_path):
+    simulator = CubeSimulator()
+    link = simulator.start(str(tmp_path / "ttyCUBE"))
+
+    async def main():
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        device = CubeDevice(link)
+        await device.connect()
+        future = await device.send("G1 Z10", jog=10)
+        await device.disconnect()
+        reply = await future
+        await asyncio.sleep(0)
+        return reply, errors
+
+    try:
+        reply, errors = run(main())
+    finally:
+        simulator.stop()
+    assert reply.error is not None
+    assert errors == []
+
+
+def test_program_with_refused_command(tmp_path):
+    simulator = CubeSimulator(parser_tick=0.01)
+    link = simulator.start(str(tmp_path / "ttyCUBE"))
+
+    async def main():
+        device = CubeDevice(link, timeout=2.0)
+        await device.connect()
+        try:
+            await device.initialize(restart=False)
+            # the generator is off, M103 would wait for ever
+            program = parse_program("G1 Z10\nM103 1 2 3\nG1 Z10\n")
+            streamer = ProgramStreamer(device, program, stop_on_error=False)
+            return await streamer.run()
+        finally:
+            await device.disconnect()
+
+    try:
+        status = run(main())
+    finally:
+        simulator.stop()
+    assert status["done"] == 3
+    assert status["errors"] == 1
+
+
+def test_abort_while_waiting_for_homing(tmp_path):
+    simulator = CubeSimulator(parser_tick=0.01)
+    link = simulator.start(str(tmp_path / "ttyCUBE"))
+
+    async def main():
+        device = CubeDevice(link, timeout=30.0)
+        await device.connect()
+        try:
+            await device.initialize(restart=False)
+            # homing that never ends
+            device.state.update(homing=True)
+            streamer = ProgramStreamer(device, parse_program("G90\n"))
+            task = asyncio.ensure_future(streamer.run())
+            await asyncio.sleep(0.2)
+            streamer.abort()
+            return await asyncio.wait_for(task, 2.0)
+        finally:
+            await device.disconnect()
+
+    try:
+        status = run(main())
+    finally:
+        simulator.stop()
+    assert status["state"] == "aborted"
+    assert status["sent"] == 0
+
+
+class StatuslessSimulator(CubeSimulator):
+    # firmware from before M114
+    commands = {word: command for word, command in CubeSimulator.commands.items() if word != "M114"}
+
+
+def test_attach_without_status_report(tmp_path):
+    simulator = StatuslessSimulator(parser_tick=0.01)
+    link = simulator.start(str(tmp_path / "ttyCUBE"))
+
+    async def main():
+        device = CubeDevice(link, timeout=2.0)
+        await device.connect()
+        try:
+            with pytest.raises(AttachError):
+                await device.initialize(restart=False)
+            sent = []
+            device.add_listener(lambda records: sent.extend(r.text for r in records if type(r) is SentLine))
+            await asyncio.sleep(0.2)
+            return sent
+        finally:
+            await device.disconnect()
+
+    try:
+        sent = run(main())
+    finally:
+        simulator.stop()
+    # the caller decides about the restart
+    assert not any(text.startswith("M0") for text in sent)
+
+
+def test_subscriptions_survive_reconnect(tmp_path):
+    simulator = CubeSimulator(parser_tick=0.01)
+    link = simulator.start(str(tmp_path / "ttyCUBE"))
+
+    async def main():
+        device = CubeDevice(link, timeout=2.0, reconnect=5.0)
+        events = []
+        device.add_listener(lambda records: events.extend(r.event for r in records if type(r) is ConnectionEvent))
+        await device.connect()
+        try:
+            await device.initialize(restart=False, report_interval=50)
+            positions = device.positions()
+            await positions.__anext__()
+            device._on_error(OSError("unplugged"))
+            while "reconnected" not in events:
+                await asyncio.sleep(0.05)
+            frame = await asyncio.wait_for(positions.__anext__(), 2.0)
+        finally:
+            await device.disconnect()
+        # disconnect() ends the stream
+        rest = [record async for record in positions]
+        return frame, events, rest
+
+    try:
+        frame, events, rest = run(main())
+    finally:
+        simulator.stop()
+    assert events == ["lost", "reconnected"]
+    assert frame is not None
+    assert all(type(record) is PosFrame for record in rest)
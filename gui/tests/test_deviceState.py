@@ -0,0 +1,142 @@
+"""DeviceState rules against the command handlers of src/serialParser.cpp
+
+    python -m pytest gui/tests
+"""
+import asyncio
+import os
+import re
+import sys
+
+import pytest
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from deviceState import BOOT_STATE, RULES, SETTLING, CommandRejected, DeviceState, parse_status  # noqa: E402
+from telemetry import LogLine  # noqa: E402
+
+PARSER_SOURCE = os.path.join(GUI_PATH, "..", "src", "serialParser.cpp")
+# firmware flags of the mode checks
+FLAGS = {
+    "homingFlag": "homing",
+    "autoModeFlag": "auto_mode",
+    "touchModeFlag": "touch_mode",
+    "generatorAciveFlag": "generator",
+}
+
+
+def firmware_rules() -> dict:
+    # command word -> ((flag, refused value, message), ...) of the checks in every handler, in their order
+    with open(PARSER_SOURCE) as f:
+        source = f.read()
+    handlers = dict(re.findall(r'registerCommand\("(\w+)", "\w*", &(\w+)\);', source))
+    definition = r"void (cmd_\w+)\(MyCommandParser::Argument \*args, char \*response\)\s*\{(.*?)\n\}"
+    bodies = dict(re.findall(definition, source, re.S))
+    check = re.compile(r'if \((\w+) == (true|false)\)\s*\{\s*Log\.error\("(.*?)\\n"\);\s*return;\s*\}')
+    rules = {}
+    for word, handler in handlers.items():
+        found = check.findall(bodies[handler])
+        checks = tuple((FLAGS[flag], value == "true", message) for flag, value, message in found)
+        if checks:
+            rules[word] = checks
+    return rules
+
+
+def booted(**values):
+    state = DeviceState()
+    state.booted()
+    state.update(**values)
+    return state
+
+
+def test_rules_match_the_firmware():
+    rules = firmware_rules()
+    # the parser has checks at all, and every rule names a flag the state follows
+    assert "M103" in rules
+    assert rules == RULES
+    assert {name for checks in RULES.values() for name, _, _ in checks} <= set(BOOT_STATE)
+    assert set(SETTLING) <= set(BOOT_STATE)
+
+
+@pytest.mark.parametrize("word, checks", sorted(RULES.items()))
+def test_first_failing_check_wins(word, checks):
+    for i, (name, refused, message) in enumerate(checks):
+        # every earlier check passes, this one fails, all later ones fail as well
+        values = {earlier: not value for earlier, value, _ in checks[:i]}
+        values.update({later: value for later, value, _ in checks[i:]})
+        assert booted(**values).check(f"{word} 1 2 3") == message
+    assert booted(**{name: not refused for name, refused, _ in checks}).check(word) is None
+
+
+def test_unknown_state_never_rejects():
+    state = DeviceState()
+    for word in RULES:
+        assert state.check(word) is None
+    # but the axis check does not depend on the state
+    assert state.check("G1 X10") == "Only Z-Axis is supported!"
+    assert state.check("g0 z10 ; comment") is None
+    assert state.check("  ") is None
+
+
+def test_notices_follow_the_firmware():
+    state = booted()
+    state.apply_log(LogLine("INFO", "-> G28"))
+    assert state.mode == "homing"
+    state.apply_log(LogLine("INFO", "encoder set to 0"))
+    state.apply_log(LogLine("INFO", "freq: 1000Hz"))
+    state.apply_log(LogLine("INFO", "-> M103 start auto mode with upper: 30.00, lower: 5.00, sens: 10"))
+    assert state.mode == "auto"
+    assert state.check("M101") == "Can't do this during auto mode..."
+    state.apply_log(LogLine("INFO", "-> M103 stop auto mode :..."))
+    assert state.mode == "manual"
+    state.apply_log(LogLine("INFO", "Set new report interval to 50ms"))
+    assert state.interval == 50
+
+
+def test_status_report():
+    text = "-> M114 homing:0 homed:1 touch:0 auto:1 generator:1 relative:0 binary:0 steps:4 target:4 interval:100"
+    changes = parse_status(text)
+    assert changes == {
+        "homing": False,
+        "homed": True,
+        "touch_mode": False,
+        "auto_mode": True,
+        "generator": True,
+        "relative": False,
+        "binary": False,
+        "interval": 100,
+    }
+    assert parse_status("-> M114 homing:x auto: interval:100ms") == {}
+
+
+def test_wait_allowed():
+    async def main():
+        state = booted(homing=True)
+        # homing ends by itself, the command waits for it
+        waiting = asyncio.ensure_future(state.wait_allowed("G91", timeout=1.0))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        state.update(homing=False)
+        await waiting
+
+        # auto mode only ends with another command
+        with pytest.raises(CommandRejected):
+            await booted(auto_mode=True).wait_allowed("M101")
+
+        # homing is over, but the generator is still off
+        state = booted(homing=True)
+        waiting = asyncio.ensure_future(state.wait_allowed("M103 5 30 10", timeout=1.0))
+        await asyncio.sleep(0)
+        state.update(homing=False)
+        with pytest.raises(CommandRejected, match="Generator must be active"):
+            await waiting
+
+        # the connection is lost while waiting
+        state = booted(touch_mode=True)
+        waiting = asyncio.ensure_future(state.wait_allowed("M104", timeout=1.0))
+        await asyncio.sleep(0)
+        state.cancel_waiters(ConnectionError("lost"))
+        with pytest.raises(ConnectionError):
+            await waiting
+
+    asyncio.run(main())
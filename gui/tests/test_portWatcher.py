@@ -0,0 +1,83 @@
+"""PortWatcher on a pty link in a temporary directory, Linux only
+
+    python -m pytest gui/tests
+"""
+import os
+import queue
+import sys
+import time
+
+import pytest
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+import portWatcher  # noqa: E402
+from portWatcher import PortWatcher  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs a pty (Linux)")
+
+
+@pytest.fixture
+def pty():
+    master, slave = os.openpty()
+    yield os.ttyname(slave)
+    os.close(slave)
+    os.close(master)
+
+
+def wait_for(changes, port, added, timeout):
+    # the first change of the watcher may list ports of the machine, skip everything else
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            change = changes.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            return False
+        if port in change[0 if added else 1]:
+            return True
+
+
+def watch(tmp_path, pty, **options):
+    link = str(tmp_path / "ttyCUBE0")
+    changes = queue.Queue()
+    patterns = (str(tmp_path / "ttyCUBE*"),)
+    watcher = PortWatcher(lambda added, removed: changes.put((added, removed)), patterns, **options)
+    watcher.start()
+    try:
+        # wait for the first scan, a link created before it would show up as present from the start
+        deadline = time.monotonic() + 2.0
+        while not watcher.scans and time.monotonic() < deadline:
+            time.sleep(0.01)
+        os.symlink(pty, link)
+        added = wait_for(changes, link, True, 1.0)
+        os.remove(link)
+        removed = wait_for(changes, link, False, 1.0)
+    finally:
+        watcher.stop()
+        watcher.join(timeout=10)
+    assert not watcher.is_alive()
+    return watcher, added, removed
+
+
+def test_inotify(tmp_path, pty):
+    # a poll interval far above the bound, only inotify can report the link in time
+    watcher, added, removed = watch(tmp_path, pty, poll_interval=3.0)
+    if watcher.inotify is None:
+        pytest.skip("inotify is not available")
+    assert added and removed
+
+
+def test_polling(tmp_path, pty):
+    _, added, removed = watch(tmp_path, pty, poll_interval=0.05, use_inotify=False)
+    assert added and removed
+
+
+def test_polling_without_inotify(tmp_path, pty, monkeypatch):
+    def no_inotify(directories):
+        raise OSError(38, "inotify_init1 failed")
+
+    monkeypatch.setattr(portWatcher, "Inotify", no_inotify)
+    watcher, added, removed = watch(tmp_path, pty, poll_interval=0.05)
+    assert watcher.inotify is None
+    assert added and removed
@@ -0,0 +1,69 @@
+"""SerialSelector on ptys, Linux only
+
+    python -m pytest gui/tests
+"""
+import os
+import queue
+import sys
+
+import pytest
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from serialReader import SerialSelector  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs a pty (Linux)")
+
+
+class Port:
+    # the selector only needs fileno() of a port
+    def __init__(self):
+        self.master, self.slave = os.openpty()
+
+    def fileno(self):
+        return self.slave
+
+    def close(self):
+        os.close(self.slave)
+        os.close(self.master)
+
+
+@pytest.fixture
+def port():
+    port = Port()
+    yield port
+    port.close()
+
+
+def test_register_and_unregister(port):
+    selector = SerialSelector()
+    selector.start()
+    lines = queue.Queue()
+    try:
+        selector.register(port, lines.put)
+        os.write(port.master, b"<POS> homed:1 steps:0 pos:0.0000\n")
+        assert lines.get(timeout=2.0) == ["<POS> homed:1 steps:0 pos:0.0000"]
+        selector.unregister(port)
+        assert port not in selector.channels
+    finally:
+        selector.stop()
+        selector.join(timeout=2.0)
+    assert not selector.is_alive()
+
+
+def test_register_after_stop_raises(port):
+    selector = SerialSelector()
+    with pytest.raises(RuntimeError):
+        # never started
+        selector.register(port, print)
+    selector.start()
+    selector.stop()
+    # the thread may still be running down, the request must not succeed either way
+    with pytest.raises(RuntimeError):
+        selector.register(port, print)
+    selector.join(timeout=2.0)
+    with pytest.raises(RuntimeError):
+        selector.register(port, print)
+    # nothing to remove, returns at once
+    selector.unregister(port)
@@ -0,0 +1,105 @@
+"""SerialWriter jog merging and holding, with an in-memory port
+
+    python -m pytest gui/tests
+"""
+import os
+import sys
+import threading
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from serialWriter import SerialWriter, jog_line  # noqa: E402
+
+
+class Port:
+    port = "memory"
+
+    def __init__(self):
+        self.written = []
+        self.wrote = threading.Condition()
+
+    def write(self, data):
+        with self.wrote:
+            self.written.append(data.decode())
+            self.wrote.notify_all()
+
+    def wait_written(self, count, timeout=2.0):
+        with self.wrote:
+            return self.wrote.wait_for(lambda: len(self.written) >= count, timeout)
+
+
+def queued(writer):
+    return [line.text for line in writer.queue]
+
+
+def test_jog_line():
+    assert jog_line(100) == "G1 Z100\n"
+    assert jog_line(-0.5) == "G1 Z-0.5\n"
+    # float noise of summed jogs is rounded away
+    assert jog_line(0.1 + 0.2) == "G1 Z0.3\n"
+
+
+def test_queued_jogs_are_merged():
+    writer = SerialWriter(Port())
+    first, merged = writer.put(jog_line(100), 100, "first")
+    assert not merged
+    line, merged = writer.put(jog_line(-30), -30, "second")
+    assert merged and line is first
+    writer.put(jog_line(5), 5, "third")
+    assert queued(writer) == ["G1 Z75\n"]
+    # the merged line keeps the context of the line it was merged into
+    assert (first.jog, first.merged, first.context) == (75, 2, "first")
+    assert (writer.queued, writer.merged) == (3, 2)
+
+
+def test_no_merge_across_other_commands():
+    writer = SerialWriter(Port())
+    writer.put(jog_line(100), 100)
+    writer.put("M114\n")
+    _, merged = writer.put(jog_line(50), 50)
+    assert not merged
+    # a plain line is never merged, not even into a jog
+    _, merged = writer.put("G1 Z10\n")
+    assert not merged
+    writer.put(jog_line(20), 20)
+    assert queued(writer) == ["G1 Z100\n", "M114\n", "G1 Z50\n", "G1 Z10\n", "G1 Z20\n"]
+    assert writer.merged == 0
+
+
+def test_jogs_held_until_the_previous_one_was_answered():
+    port = Port()
+    writer = SerialWriter(port, hold_timeout=5.0)
+    writer.start()
+    try:
+        writer.put(jog_line(100), 100)
+        assert port.wait_written(1)
+        # the first jog is unanswered, the next clicks wait in the queue and end up as one move
+        writer.put(jog_line(100), 100)
+        writer.put(jog_line(100), 100)
+        assert not port.wait_written(2, timeout=0.1)
+        assert queued(writer) == ["G1 Z200\n"]
+        writer.jog_done()
+        assert port.wait_written(2)
+        assert port.written == ["G1 Z100\n", "G1 Z200\n"]
+    finally:
+        writer.stop()
+        writer.join(timeout=2.0)
+    assert not writer.is_alive()
+
+
+def test_hold_timeout():
+    port = Port()
+    writer = SerialWriter(port, hold_timeout=0.05)
+    writer.start()
+    try:
+        writer.put(jog_line(100), 100)
+        writer.put("M114\n")
+        assert port.wait_written(2)
+        # the reply of the first jog never comes, the second one is written after hold_timeout anyway
+        writer.put(jog_line(10), 10)
+        assert port.wait_written(3)
+        assert port.written == ["G1 Z100\n", "M114\n", "G1 Z10\n"]
+    finally:
+        writer.stop()
+        writer.join(timeout=2.0)
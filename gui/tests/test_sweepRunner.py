@@ -0,0 +1,83 @@
+"""SweepRunner against simulated machines (cubeSim.py) on ptys, Linux only
+
+    python -m pytest gui/tests
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from connectionManager import ConnectionManager  # noqa: E402
+from cubeSim import CubeSimulator  # noqa: E402
+from sweepRunner import SweepRunner, expand_grid, load_results, RESULTS_FILE  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs a pty (Linux)")
+
+
+@pytest.fixture
+def machines(tmp_path):
+    simulators = [CubeSimulator(parser_tick=0.01, report_interval=20) for _ in range(2)]
+    links = [simulator.start(str(tmp_path / f"ttyCUBE{i}")) for i, simulator in enumerate(simulators)]
+    yield links
+    for simulator in simulators:
+        simulator.stop()
+
+
+def sweep(links, out, runs, lose=None, **limits):
+    # lose(runner, result) returns the port to cut off after a result, or None
+    async def main():
+        manager = ConnectionManager(reconnect=0.0)
+        runner = SweepRunner(manager, runs, str(out), poll=0.02, **limits)
+        lost = []
+
+        def result_done(result):
+            port = lose(runner, result) if lose is not None and not lost else None
+            if port is not None:
+                lost.append(port)
+                manager.devices[port]._on_error(OSError("unplugged"))
+
+        runner.listeners.append(result_done)
+        try:
+            await manager.connect_many(links, report_interval=50)
+            results = await asyncio.wait_for(runner.run(links), 30)
+        finally:
+            await manager.disconnect_all()
+            manager.shutdown()
+        return results, lost
+
+    return asyncio.run(main())
+
+
+def test_run_given_back_after_the_others_finished(machines, tmp_path):
+    runs = expand_grid({"auto_sens": [5, 10, 20]})
+
+    def lose(runner, result):
+        # the second result: the other machine already took the last run, this one finds the queue empty
+        if len(runner.completed) == 2 and runner.recorders:
+            return next(iter(runner.recorders))
+        return None
+
+    results, lost = sweep(machines, tmp_path, runs, lose=lose, duration=0.5)
+    assert len(lost) == 1
+    # the failed attempt on the lost machine is replaced by the one that completed the run
+    assert sorted(result["run"] for result in results) == sorted(run.run_id for run in runs)
+    assert [result["status"] for result in results] == ["ok"] * len(runs)
+    with open(tmp_path / RESULTS_FILE) as f:
+        assert [json.loads(line)["status"] for line in f].count("error") == 1
+    completed = [run_id for run_id, result in load_results(tmp_path / RESULTS_FILE).items() if result["status"] == "ok"]
+    assert sorted(completed) == sorted(run.run_id for run in runs)
+
+
+def test_depth_not_reached_is_incomplete(machines, tmp_path):
+    runs = expand_grid({})
+    results, _ = sweep(machines[:1], tmp_path, runs, depth=1000.0, max_duration=0.3)
+    assert [result["status"] for result in results] == ["incomplete"]
+    assert [result["stop"] for result in results] == ["max_duration"]
+    assert results[0]["start_pos_mm"] is not None
+    # not "ok", so a resume runs it again
+    assert load_results(tmp_path / RESULTS_FILE)[runs[0].run_id]["status"] == "incomplete"
@@ -0,0 +1,87 @@
+"""decode_line on the line formats of the firmware
+
+    python -m pytest gui/tests
+"""
+import os
+import sys
+
+import pytest
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, GUI_PATH)
+
+from telemetry import AdcFrame, ESP, LogLine, PosFrame, decode_line  # noqa: E402
+
+
+def test_adc():
+    frame = decode_line("<ADC> raw:1543 calc:11.91V ")
+    assert type(frame) is AdcFrame
+    assert (frame.raw, frame.volts) == (1543, 11.91)
+
+
+def test_pos():
+    frame = decode_line("<POS> homed:1 steps:-40211 pos:-10.0527")
+    assert type(frame) is PosFrame
+    assert (frame.homed, frame.steps, frame.pos_mm) == (True, -40211, -10.0527)
+    assert decode_line("<POS> homed:0 steps:0 pos:0.0000").homed is False
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "<ADC>",
+        "<ADC> raw: calc:1.00V",
+        "<ADC> raw:-5 calc:1.00V",
+        "<ADC> raw:1543",
+        "<ADC> raw:1543 calc:V",
+        "<ADC> raw:1543 calc:abcV",
+        "<POS>",
+        "<POS> homed:1",
+        "<POS> homed:1 steps:x pos:1.0",
+        "<POS> homed:1 steps:4000 pos:",
+    ],
+)
+def test_malformed_telemetry_is_plain_text(line):
+    record = decode_line(line)
+    assert type(record) is LogLine
+    assert (record.level, record.text) == (None, line)
+    assert str(record) == line
+
+
+@pytest.mark.parametrize(
+    "line, level, text",
+    [
+        ("<ERROR> Only Z-Axis is supported!", "ERROR", "Only Z-Axis is supported!"),
+        ("<INFO> homing done", "INFO", "homing done"),
+        ("SILENT boot", "SILENT", "boot"),
+        ("<DEBUG> unknown level", None, "<DEBUG> unknown level"),
+        ("plain text", None, "plain text"),
+        ("", None, ""),
+    ],
+)
+def test_log_lines(line, level, text):
+    record = decode_line(line)
+    assert type(record) is LogLine
+    assert (record.level, record.text) == (level, text)
+
+
+def test_dots_in_front_of_a_line():
+    # "." of the movement task while waiting, followed by the next line
+    frame = decode_line("...<POS> homed:1 steps:4000 pos:1.0000")
+    assert type(frame) is PosFrame
+    assert frame.steps == 4000
+    record = decode_line("..<WARNING> Target position can't be negative!")
+    assert (record.level, record.text) == ("WARNING", "Target position can't be negative!")
+    assert (decode_line("..").level, decode_line("..").text) == (None, "")
+
+
+def test_esp_responses():
+    # println() of the command parser ends with "\r\n", the "\n" is already split off
+    record = decode_line("ok\r")
+    assert (record.level, record.text) == (ESP, "ok")
+    assert str(record) == "ok"
+    record = decode_line("parse error: G1 Z\r")
+    assert (record.level, record.text) == (ESP, "parse error: G1 Z")
+    # telemetry and level prefixes win over the line ending
+    assert type(decode_line("<ADC> raw:16 calc:0.01V\r")) is AdcFrame
+    assert decode_line("<INFO> done\r").level == "INFO"
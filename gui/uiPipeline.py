@@ -0,0 +1,111 @@
+"""UI update pipeline for CUBEcontrol
+Worker threads never touch Tk widgets. They post typed events into a queue which
+is drained on the Tk thread by a periodic app.after() tick. Telemetry is coalesced
+so only the newest ADC and POS value of a frame is rendered, console lines of a
+frame are handed over as one batch.
+"""
+import time  # Importing time for the frame timings
+from collections import deque  # Importing deque, append/popleft are thread-safe in CPython
+from telemetry import AdcFrame, PosFrame  # Importing the decoded telemetry records
+from instrumentation import metrics  # Importing the process-wide latency metrics
+
+
+class ConsoleEvent:
+    __slots__ = ("text", "send", "error")
+
+    def __init__(self, text, send=False, error=False):
+        self.text = text
+        self.send = send
+        self.error = error
+
+
+class UiPipeline:
+    """Thread-safe event queue drained on the Tk thread with a frame-rate cap.
+
+    handlers maps an event class to a callback running on the Tk thread. Classes in
+    coalesce only get their newest event of a frame delivered, all other handlers
+    receive the list of events of the frame in arrival order (one list per handler,
+    even if it is registered for several classes).
+    """
+
+    def __init__(self, root, handlers, coalesce=(AdcFrame, PosFrame), max_fps=30):
+        self.root = root
+        self.handlers = dict(handlers)
+        self.coalesce = tuple(coalesce)
+        self.queue = deque()
+        # time of the first post into an empty queue, only kept while metrics are enabled
+        self.first_post = None
+        self.after_handle = None
+        self.set_max_fps(max_fps)
+
+    def set_max_fps(self, max_fps) -> None:
+        self.interval = max(1, int(1000 / max_fps))
+
+    def post(self, event) -> None:
+        # may be called from any thread
+        if metrics.enabled and self.first_post is None:
+            self.first_post = time.perf_counter()
+        self.queue.append(event)
+
+    def post_many(self, events) -> None:
+        if metrics.enabled and self.first_post is None:
+            self.first_post = time.perf_counter()
+        self.queue.extend(events)
+
+    def clear(self) -> None:
+        self.queue.clear()
+        self.first_post = None
+
+    def start(self) -> None:
+        if self.after_handle is None:
+            self.after_handle = self.root.after(self.interval, self._tick)
+
+    def stop(self) -> None:
+        if self.after_handle is not None:
+            self.root.after_cancel(self.after_handle)
+            self.after_handle = None
+
+    def flush(self) -> None:
+        # drain everything that is queued right now and render it
+        queue = self.queue
+        if not queue:
+            return
+        measure = metrics.enabled
+        if measure:
+            started = time.perf_counter()
+            first_post, self.first_post = self.first_post, None
+            metrics.observe("ui_queue_depth", len(queue), "events")
+        latest = {}
+        batches = {}
+        handlers = self.handlers
+        coalesce = self.coalesce
+        for _ in range(len(queue)):
+            event = queue.popleft()
+            cls = type(event)
+            if cls in coalesce:
+                latest[cls] = event
+            else:
+                handler = handlers.get(cls)
+                if handler is not None:
+                    batches.setdefault(handler, []).append(event)
+
+        for cls, event in latest.items():
+            handler = handlers.get(cls)
+            if handler is not None:
+                handler(event)
+        for handler, events in batches.items():
+            handler(events)
+
+        if measure:
+            # first_post is None if metrics were switched on while events were queued
+            done = time.perf_counter()
+            metrics.observe("ui_render_ms", (done - started) * 1000)
+            if first_post is not None:
+                metrics.observe("ui_queue_wait_ms", (started - first_post) * 1000)
+                metrics.observe("post_to_render_ms", (done - first_post) * 1000)
+
+    def _tick(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self.after_handle = self.root.after(self.interval, self._tick)
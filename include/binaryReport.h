@@ -0,0 +1,27 @@
+/**
+ * @file binaryReport.h
+ * @brief Compact binary frames for the ADC and POS reports, enabled with M105 1.
+ *
+ * Every frame starts with the sync byte 0xA5, which never occurs in the ASCII log
+ * output, followed by the frame type, a sequence number per type, the fixed-width
+ * little-endian fields and a CRC-16/CCITT-FALSE over everything after the sync byte:
+ *
+ *   ADC  A5 01 seq:u16 raw:u16 crc:u16                    8 bytes
+ *   POS  A5 02 seq:u16 homed:u8 steps:i32 crc:u16        11 bytes
+ *
+ * A frame is written with a single Serial.write() call, so it can't be split by
+ * the log output of other tasks, but it may end up in the middle of a log line.
+ * The decoder is gui/binaryTelemetry.py.
+ */
+#pragma once
+#include <Arduino.h>
+
+#define REPORT_SYNC 0xA5
+#define REPORT_TYPE_ADC 0x01
+#define REPORT_TYPE_POS 0x02
+
+void sendAdcReport(uint16_t raw);
+
+void sendPosReport(bool homed, int32_t steps);
+
+extern volatile bool binaryReportFlag;
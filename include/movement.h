@@ -22,6 +22,7 @@ void stepperDisable();
 void movementTask(void* args);
 void movementReport();
 void setNewTargetPosition(double newPos);
+bool isHomed();
 
 extern bool homingFlag, stopFlag, touchModeFlag, autoModeFlag, relativePositioningFlag;
 extern int targetSteps, currentSteps;
@@ -4,6 +4,7 @@
 #include "SPI.h"
 #include "soc/spi_struct.h"
 #include "adc.h"
+#include "binaryReport.h"
 
 // VSPI are pins 19, 18
 SPIClass SPI_ADC(VSPI);
@@ -84,7 +85,12 @@ void adcTask(void *param)
                 adc0V = 0;
             }
         if (millis()-ttimer > adc_report_interval){
-            Serial.printf("<ADC> raw:%d calc:%.2fV \n",adcVoltage, calcVoltage(adcVoltage));
+            if (binaryReportFlag){
+                sendAdcReport(adcVoltage);
+            }
+            else{
+                Serial.printf("<ADC> raw:%d calc:%.2fV \n",adcVoltage, calcVoltage(adcVoltage));
+            }
             ttimer = millis();
         }
         vTaskDelay(100);
@@ -0,0 +1,57 @@
+#include "binaryReport.h" // include the corresponding header file
+
+volatile bool binaryReportFlag = false;
+
+namespace
+{
+    // every report type is only sent from one task, so the counters need no lock
+    uint16_t adcSequence = 0;
+    uint16_t posSequence = 0;
+
+    // CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), binascii.crc_hqx(data, 0xFFFF) in python
+    uint16_t crc16(const uint8_t *data, size_t length)
+    {
+        uint16_t crc = 0xFFFF;
+        while (length--)
+        {
+            crc ^= (uint16_t)(*data++) << 8;
+            for (int i = 0; i < 8; i++)
+            {
+                crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+            }
+        }
+        return crc;
+    }
+
+    void putU16(uint8_t *buffer, uint16_t value)
+    {
+        buffer[0] = value & 0xFF;
+        buffer[1] = value >> 8;
+    }
+
+    void sendFrame(uint8_t *frame, size_t length)
+    {
+        putU16(frame + length - 2, crc16(frame + 1, length - 3));
+        Serial.write(frame, length);
+    }
+}
+
+// Send one ADC report frame
+void sendAdcReport(uint16_t raw)
+{
+    uint8_t frame[8] = {REPORT_SYNC, REPORT_TYPE_ADC};
+    putU16(frame + 2, adcSequence++);
+    putU16(frame + 4, raw);
+    sendFrame(frame, sizeof(frame));
+}
+
+// Send one POS report frame
+void sendPosReport(bool homed, int32_t steps)
+{
+    uint8_t frame[11] = {REPORT_SYNC, REPORT_TYPE_POS};
+    putU16(frame + 2, posSequence++);
+    frame[4] = homed;
+    putU16(frame + 5, (uint32_t)steps & 0xFFFF);
+    putU16(frame + 7, (uint32_t)steps >> 16);
+    sendFrame(frame, sizeof(frame));
+}
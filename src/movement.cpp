@@ -6,6 +6,7 @@
 #include <ArduinoLog.h>
 #include "adc.h"
 #include "funcGen.h"
+#include "binaryReport.h"
 
 bool homingFlag = false, stopFlag = false, touchModeFlag = false, autoModeFlag = false, relativePositioningFlag = true;
 int targetSteps = 0, currentSteps = 0;
@@ -32,6 +33,11 @@ namespace
     }
 }
 
+bool isHomed()
+{
+    return homed;
+}
+
 void setNewTargetPosition(double newPos)
 {
     long int newSteps = newPos * (ENCODER_STEPS_PER_MM / 1000.0);
@@ -230,13 +236,19 @@ void autoMode(){
         vTaskDelay(10);
     }
     targetSteps = encoder.getCount();
-    Serial.println("end auto mode\n");
+    // a log line, a println() would end in "\r\n" like the response of the command parser
+    Log.notice("end auto mode\n");
 }
 
 void movementReport(){
     if (millis()-ttimer > position_report_interval){
         unsigned currentSteps = encoder.getCount();
-        Serial.printf("<POS> homed:%d steps:%d pos:%.4f\n",homed, currentSteps, (float)currentSteps/ENCODER_STEPS_PER_MM);
+        if (binaryReportFlag){
+            sendPosReport(homed, currentSteps);
+        }
+        else{
+            Serial.printf("<POS> homed:%d steps:%d pos:%.4f\n",homed, currentSteps, (float)currentSteps/ENCODER_STEPS_PER_MM);
+        }
         ttimer = millis();
     }
 }
@@ -272,6 +284,8 @@ void movementTask(void *param)
         if (stepper.motionComplete() && digitalRead(PIN_Z_EN) == LOW)
         {
             // if the last move is complete and the stepper enabled
+            // a M410 without a running move only had to drop the target
+            stopFlag = false;
             if (moveStarted)
             {
                 stepperStop();
@@ -328,6 +342,13 @@ void movementTask(void *param)
                 targetSteps = currentSteps;
                 stepperStop();
             }
+            else if (stopFlag)
+            {
+                // M410: drop the rest of the move and every target that was queued behind it
+                targetSteps = currentSteps;
+                stepperStop();
+                stopFlag = false;
+            }
             else
             {
                 stepper.processMovement();
@@ -336,6 +357,7 @@ void movementTask(void *param)
         else
         {
             // if the stepper is disabled
+            stopFlag = false;
             stepperStop();
             vTaskDelay(0);
         }
@@ -5,8 +5,10 @@
 #include "movement.h"
 #include "funcGen.h"
 #include "adc.h"
+#include "binaryReport.h"
 
-typedef CommandParser<> MyCommandParser;
+// the default of CommandParser<> holds 16 commands, registerCommand() fails for every further one
+typedef CommandParser<24> MyCommandParser;
 MyCommandParser parser;
 
 // movement command in microMeters as double
@@ -68,7 +70,7 @@ void cmd_M0(MyCommandParser::Argument *args, char *response)
 void cmd_M1(MyCommandParser::Argument *args, char *response)
 {
     uint val = args[0].asUInt64;
-    Log.info("Set new report interval to %dms\n");
+    Log.info("Set new report interval to %dms\n", val);
     adc_report_interval = val;
     position_report_interval = val;
 }
@@ -212,29 +214,69 @@ void cmd_M104(MyCommandParser::Argument *args, char *response)
     autoModeFlag = false;
 }
 
+// binary reports on/off
+void cmd_M105(MyCommandParser::Argument *args, char *response)
+{
+    bool val = args[0].asUInt64;
+    Log.notice("-> M105 binary reports %s\n", val ? "on" : "off");
+    binaryReportFlag = val;
+}
+
+// status report, lets a host attach without restarting the device
+void cmd_M114(MyCommandParser::Argument *args, char *response)
+{
+    Log.notice("-> M114 homing:%d homed:%d touch:%d auto:%d generator:%d relative:%d binary:%d steps:%d target:%d interval:%u\n",
+               homingFlag, isHomed(), touchModeFlag, autoModeFlag, generatorAciveFlag, relativePositioningFlag,
+               binaryReportFlag, currentSteps, targetSteps, position_report_interval);
+}
+
+// quick stop, the axis stops where it is (used when a held jog button is released)
+void cmd_M410(MyCommandParser::Argument *args, char *response)
+{
+    if (homingFlag == true)
+    {
+        Log.error("Can't do this during homing...\n");
+        return;
+    }
+    Log.notice("-> M410 stop at steps: %d\n", currentSteps);
+    targetSteps = currentSteps;
+    stopFlag = true;
+}
+
+void registerCommand(const char *name, const char *argTypes, void (*callback)(MyCommandParser::Argument *args, char *response))
+{
+    if (!parser.registerCommand(name, argTypes, callback))
+    {
+        Log.error("Can't register command %s (limit: %d commands)\n", name, (int)MyCommandParser::MAX_COMMANDS);
+    }
+}
+
 void registerCommands()
 {
     // CommandParser contains a bug where negative int64 can't be parsed so always use string type instead
 
     // G - commands
-    parser.registerCommand("G0", "s", &cmd_G1);
-    parser.registerCommand("G1", "s", &cmd_G1);
-    parser.registerCommand("G28", "", &cmd_G28);
-    parser.registerCommand("G90", "", &cmd_G90);
-    parser.registerCommand("G91", "", &cmd_G91);
+    registerCommand("G0", "s", &cmd_G1);
+    registerCommand("G1", "s", &cmd_G1);
+    registerCommand("G28", "", &cmd_G28);
+    registerCommand("G90", "", &cmd_G90);
+    registerCommand("G91", "", &cmd_G91);
 
     // M - commands
-    parser.registerCommand("M0", "", &cmd_M0);
-    parser.registerCommand("M1", "u", &cmd_M1);
-    parser.registerCommand("M17", "", &cmd_M17);
-    parser.registerCommand("M18", "", &cmd_M18);
-    parser.registerCommand("M20", "u", &cmd_M20);
-    parser.registerCommand("M21", "u", &cmd_M21);
-    parser.registerCommand("M100", "uu", &cmd_M100);
-    parser.registerCommand("M101", "", &cmd_M101);
-    parser.registerCommand("M102", "dd", &cmd_M102);
-    parser.registerCommand("M103", "ddu", &cmd_M103);
-    parser.registerCommand("M104", "", &cmd_M104);
+    registerCommand("M0", "", &cmd_M0);
+    registerCommand("M1", "u", &cmd_M1);
+    registerCommand("M17", "", &cmd_M17);
+    registerCommand("M18", "", &cmd_M18);
+    registerCommand("M20", "u", &cmd_M20);
+    registerCommand("M21", "u", &cmd_M21);
+    registerCommand("M100", "uu", &cmd_M100);
+    registerCommand("M101", "", &cmd_M101);
+    registerCommand("M102", "dd", &cmd_M102);
+    registerCommand("M103", "ddu", &cmd_M103);
+    registerCommand("M104", "", &cmd_M104);
+    registerCommand("M105", "u", &cmd_M105);
+    registerCommand("M114", "", &cmd_M114);
+    registerCommand("M410", "", &cmd_M410);
 }
 
 void readSerial()